@@ -7,4 +7,13 @@ __init__.py
 
 from pyog.dit import *
 from pyog._wmii import x_wmi, signed_to_unsigned
+from pyog.pool import DITPool, DITExecutor, DITProxy, CommandResult, \
+    PRIORITY_INTERACTIVE, PRIORITY_EVENT, PRIORITY_READ, PRIORITY_BULK
 
+from pyog.state import DeviceStateTable, DeviceState
+from pyog.events import EventBuffer, EventHubStopped, BUFFER_BLOCK, BUFFER_DROP_OLDEST, \
+    BUFFER_SPILL
+from pyog.journal import EventJournal, JournalEntry
+from pyog.cardholders import CardholderCache
+from pyog.mirror import DataMirror, ClassMirror
+from pyog.replica import SQLiteReplica
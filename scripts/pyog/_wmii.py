@@ -356,33 +356,24 @@ def _set(obj, attribute, value):
     obj.__dict__[attribute] = value
 
 
-class _wmi_method:
-    """A currying sort of wrapper around a WMI method name. It
-    abstract's the method's parameters and can be called like
-    a normal Python object passing in the parameter values.
-
-    Output parameters are returned from the call as a tuple.
-    In addition, the docstring is set up as the method's
-    signature, including an indication as to whether any
-    given parameter is expecting an array, and what
-    special privileges are required to call the method.
+class _wmi_method_schema:
+    """The signature of a WMI method: its qualifiers and in/out
+    parameter lists. It is the same for every instance of a class
+    so it can be shared between :class:`_wmi_method` wrappers.
     """
 
-    def __init__(self, ole_object, method_name):
+    def __init__(self, method):
         """
-        :param ole_object: The WMI class/instance whose method is to be called
-        :param method_name: The name of the method to be called
+        :param method: The SWbemMethod as returned by `Methods_`
         """
         try:
-            self.ole_object = Dispatch(ole_object)
-            self.method = ole_object.Methods_(method_name)
+            self.method = method
             self.qualifiers = {}
-            for q in self.method.Qualifiers_:
+            for q in method.Qualifiers_:
                 self.qualifiers[q.Name] = q.Value
-            self.provenance = "\n".join(self.qualifiers.get("MappingStrings", []))
 
-            self.in_parameters = self.method.InParameters
-            self.out_parameters = self.method.OutParameters
+            self.in_parameters = method.InParameters
+            self.out_parameters = method.OutParameters
             if self.in_parameters is None:
                 self.in_parameter_names = []
             else:
@@ -395,7 +386,7 @@ class _wmi_method:
                                             self.out_parameters.Properties_]
 
             doc = "%s (%s) => (%s)" % (
-                method_name,
+                method.Name,
                 ", ".join([name + ("", "[]")[is_array] for (name, is_array) in
                            self.in_parameter_names]),
                 ", ".join([name + ("", "[]")[is_array] for (name, is_array) in
@@ -404,7 +395,43 @@ class _wmi_method:
             privileges = self.qualifiers.get("Privileges", [])
             if privileges:
                 doc += " | Needs: " + ", ".join(privileges)
-            self.__doc__ = doc
+            self.doc = doc
+        except pywintypes.com_error:
+            handle_com_error()
+
+
+class _wmi_method:
+    """A currying sort of wrapper around a WMI method name. It
+    abstract's the method's parameters and can be called like
+    a normal Python object passing in the parameter values.
+
+    Output parameters are returned from the call as a tuple.
+    In addition, the docstring is set up as the method's
+    signature, including an indication as to whether any
+    given parameter is expecting an array, and what
+    special privileges are required to call the method.
+    """
+
+    def __init__(self, ole_object, method_name, schema=None):
+        """
+        :param ole_object: The WMI class/instance whose method is to be called
+        :param method_name: The name of the method to be called
+        :param schema: The :class:`_wmi_method_schema` of the method if already
+          known, eg from a :class:`_wmi_schema_cache`
+        """
+        try:
+            self.ole_object = Dispatch(ole_object)
+            if schema is None:
+                schema = _wmi_method_schema(ole_object.Methods_(method_name))
+            self.method = schema.method
+            self.qualifiers = schema.qualifiers
+            self.provenance = "\n".join(self.qualifiers.get("MappingStrings", []))
+
+            self.in_parameters = schema.in_parameters
+            self.out_parameters = schema.out_parameters
+            self.in_parameter_names = schema.in_parameter_names
+            self.out_parameter_names = schema.out_parameter_names
+            self.__doc__ = schema.doc
         except pywintypes.com_error:
             handle_com_error()
 
@@ -479,15 +506,32 @@ class _wmi_method:
 
 class _wmi_property(object):
 
-    def __init__(self, property):
+    def __init__(self, property, qualifiers=None):
         self.property = property
         self.name = property.Name
         self.value = property.Value
-        self.qualifiers = dict((q.Name, q.Value) for q in property.Qualifiers_)
+        #
+        # Value as last read from WMI, to tell whether the
+        #  property has been changed locally since.
+        #
+        self.read_value = self.value
+        if qualifiers is None:
+            qualifiers = dict((q.Name, q.Value) for q in property.Qualifiers_)
+        self.qualifiers = qualifiers
         self.type = self.qualifiers.get("CIMTYPE", None)
 
     def set(self, value):
         self.property.Value = value
+        self.value = value
+
+    @property
+    def dirty(self):
+        """Whether the value differs from the one last read"""
+        return self.value != self.read_value
+
+    def clean(self):
+        """Take the current value as the one last read, eg once written"""
+        self.read_value = self.value
 
     def __repr__(self):
         return "<wmi_property: %s>" % self.name
@@ -496,6 +540,103 @@ class _wmi_property(object):
         return getattr(self.property, attr)
 
 
+#
+# class _wmi_schema
+#
+class _wmi_schema:
+    """Class-level metadata of a WMI class: property names and
+    qualifiers, key properties, method names and signatures and
+    derivation. The same for every instance of the class, so
+    :class:`_wmi_object` reads it from a :class:`_wmi_schema_cache`
+    instead of asking COM again for each instance.
+    """
+
+    def __init__(self, ole_class):
+        """
+        :param ole_class: The SWbemObject of the WMI class
+        """
+        try:
+            self.class_name = ole_class.Path_.Class
+            self.property_qualifiers = {}
+            for p in ole_class.Properties_:
+                self.property_qualifiers[p.Name] = \
+                    dict((q.Name, q.Value) for q in p.Qualifiers_)
+            self.properties = list(self.property_qualifiers)
+            self.keys = [name for name, qualifiers in self.property_qualifiers.items()
+                         if qualifiers.get("key")]
+            self.methods = [m.Name for m in ole_class.Methods_]
+            self.qualifiers = dict((q.Name, q.Value) for q in ole_class.Qualifiers_)
+            self.derivation = tuple(ole_class.Derivation_)
+            self._ole_class = ole_class
+            self._method_schemas = {}
+        except pywintypes.com_error:
+            handle_com_error()
+
+    def method(self, method_name):
+        """Return the :class:`_wmi_method_schema` of one method,
+        reading it on first use.
+        """
+        if method_name not in self._method_schemas:
+            try:
+                self._method_schemas[method_name] = _wmi_method_schema(
+                    self._ole_class.Methods_(method_name))
+            except pywintypes.com_error:
+                handle_com_error()
+        return self._method_schemas[method_name]
+
+
+#
+# class _wmi_schema_cache
+#
+class _wmi_schema_cache:
+    """Per-namespace cache of :class:`_wmi_schema` by class name. A
+    schema is read from the class definition the first time one of
+    its instances is wrapped and shared from then on. Keeps `hits`
+    and `misses` counters; call :meth:`invalidate` after the schema
+    changes on the server.
+    """
+
+    def __init__(self, namespace):
+        """
+        :param namespace: The raw SWbemServices the classes are read from
+        """
+        self._namespace = namespace
+        self._schemas = {}
+        self.hits = 0
+        self.misses = 0
+
+    def schema(self, class_name):
+        """Return the :class:`_wmi_schema` of a class, reading it
+        from the namespace on a miss.
+        """
+        key = class_name.lower()
+        try:
+            schema = self._schemas[key]
+        except KeyError:
+            self.misses += 1
+            try:
+                schema = _wmi_schema(self._namespace.Get(class_name))
+            except pywintypes.com_error:
+                handle_com_error()
+            self._schemas[key] = schema
+        else:
+            self.hits += 1
+        return schema
+
+    def invalidate(self, class_name=None):
+        """Forget the schema of one class, or of all classes if
+        no class name is given. Counters are kept.
+        """
+        if class_name is None:
+            self._schemas.clear()
+        else:
+            self._schemas.pop(class_name.lower(), None)
+
+    def stats(self):
+        """Return hits, misses and the number of cached classes"""
+        return {"hits": self.hits, "misses": self.misses, "classes": len(self._schemas)}
+
+
 #
 # class _wmi_object
 #
@@ -518,31 +659,53 @@ class _wmi_object:
       print c_drive
     """
 
-    def __init__(self, ole_object, instance_of=None, fields=[], property_map={}):
+    def __init__(self, ole_object, instance_of=None, fields=[], property_map={},
+                 schema_cache=None):
         try:
+            path = ole_object.Path_
             _set(self, "ole_object", ole_object)
-            _set(self, "id", ole_object.Path_.DisplayName.lower())
+            _set(self, "id", path.DisplayName.lower())
             _set(self, "_instance_of", instance_of)
             _set(self, "properties", {})
             _set(self, "methods", {})
             _set(self, "property_map", property_map)
             _set(self, "_associated_classes", None)
             _set(self, "_keys", None)
+            #
+            # Property, method and qualifier names are the same for
+            #  every instance of a class, so take them from the schema
+            #  cache if there is one.
+            #
+            if schema_cache is not None:
+                schema = schema_cache.schema(path.Class)
+            else:
+                schema = None
+            _set(self, "_schema", schema)
 
             if fields:
                 for field in fields:
                     self.properties[field] = None
+            elif schema is not None:
+                for name in schema.properties:
+                    self.properties[name] = None
             else:
                 for p in ole_object.Properties_:
                     self.properties[p.Name] = None
 
-            for m in ole_object.Methods_:
-                self.methods[m.Name] = None
+            if schema is not None:
+                for name in schema.methods:
+                    self.methods[name] = None
+            else:
+                for m in ole_object.Methods_:
+                    self.methods[m.Name] = None
 
             _set(self, "_properties", self.properties.keys())
             _set(self, "_methods", self.methods.keys())
-            _set(self, "qualifiers",
-                 dict((q.Name, q.Value) for q in self.ole_object.Qualifiers_))
+            if schema is not None:
+                _set(self, "qualifiers", schema.qualifiers)
+            else:
+                _set(self, "qualifiers",
+                     dict((q.Name, q.Value) for q in self.ole_object.Qualifiers_))
 
         except pywintypes.com_error:
             handle_com_error()
@@ -572,15 +735,39 @@ class _wmi_object:
 
     def _cached_properties(self, attribute):
         if self.properties[attribute] is None:
+            if self._schema is not None:
+                qualifiers = self._schema.property_qualifiers.get(attribute)
+            else:
+                qualifiers = None
             self.properties[attribute] = _wmi_property(
-                self.ole_object.Properties_(attribute))
+                self.ole_object.Properties_(attribute), qualifiers)
         return self.properties[attribute]
 
     def _cached_methods(self, attribute):
         if self.methods[attribute] is None:
-            self.methods[attribute] = _wmi_method(self.ole_object, attribute)
+            if self._schema is not None:
+                schema = self._schema.method(attribute)
+            else:
+                schema = None
+            self.methods[attribute] = _wmi_method(self.ole_object, attribute, schema)
         return self.methods[attribute]
 
+    def _rebind(self, ole_object):
+        """Point this wrapper at a fresh copy of the same object, eg
+        one re-read after `Put_`. Cached property values are dropped;
+        method wrappers and schema data are kept.
+        """
+        try:
+            _set(self, "ole_object", ole_object)
+            _set(self, "id", ole_object.Path_.DisplayName.lower())
+            for attribute in self.properties:
+                self.properties[attribute] = None
+            for method in self.methods.values():
+                if method is not None:
+                    method.ole_object = Dispatch(ole_object)
+        except pywintypes.com_error:
+            handle_com_error()
+
     def __getattr__(self, attribute):
         """
         Attempt to pass attribute calls to the proxied COM object.
@@ -649,7 +836,9 @@ class _wmi_object:
         # NB You can get the keys of an instance more directly, via
         # Path\_.Keys but this doesn't apply to classes. The technique
         # here appears to work for both.
-        if self._keys is None:
+        if self._keys is None and self._schema is not None:
+            _set(self, "_keys", list(self._schema.keys))
+        elif self._keys is None:
             _set(self, "_keys", [])
             for property in self.ole_object.Properties_:
                 for qualifier in property.Qualifiers_:
@@ -678,22 +867,45 @@ class _wmi_object:
         which has been spawned in this way won't have enough
         information to write pack, so only try if the
         instance has a path.
+
+        Properties which already hold the given value, as last
+        read or written, are skipped and nothing is written back
+        if none changed. Values left unwritten by a failed write
+        count as changed.
+
+        :returns: dict of the properties actually changed
         """
+        changed = {}
         if kwargs:
             try:
                 for attribute, value in kwargs.items():
                     if attribute in self.properties:
-                        self._cached_properties(attribute).set(value)
+                        property = self._cached_properties(attribute)
+                        if property.value != value or property.dirty:
+                            property.set(value)
+                            changed[attribute] = value
                     else:
                         raise AttributeError(attribute)
                 #
                 # Only try to write the attributes
                 #  back if the object exists.
                 #
-                if self.ole_object.Path_.Path:
+                if changed and self.ole_object.Path_.Path:
                     self.ole_object.Put_()
+                    for attribute in changed:
+                        self.properties[attribute].clean()
             except pywintypes.com_error:
                 handle_com_error()
+        return changed
+
+    def _dirty(self):
+        """Return a dict of the properties changed locally since
+        they were last read or written.
+        """
+        return dict(
+            (attribute, property.value) for attribute, property in self.properties.items()
+            if property is not None and property.dirty
+        )
 
     def path(self):
         """Return the WMI URI to this object. Can be used to
@@ -716,6 +928,8 @@ class _wmi_object:
           pp0 = wmi.WMI ().Win32_ParallelPort ()[0]
           print ' <- '.join (pp0.derivation ())
         """
+        if self._schema is not None:
+            return self._schema.derivation
         try:
             return self.ole_object.Derivation_
         except pywintypes.com_error:
@@ -988,6 +1202,11 @@ class _wmi_namespace:
         # wmi attribute preserved for backwards compatibility
         #
         _set(self, "wmi", namespace)
+        #
+        # Schema of the classes whose instances are wrapped, shared
+        #  by all of them. See _wmi_schema_cache.
+        #
+        _set(self, "schema_cache", _wmi_schema_cache(namespace))
 
         self._classes = None
         self._classes_map = {}
@@ -1017,7 +1236,7 @@ class _wmi_namespace:
 
     def get(self, moniker):
         try:
-            return _wmi_object(self.wmi.Get(moniker))
+            return _wmi_object(self.wmi.Get(moniker), schema_cache=self.schema_cache)
         except pywintypes.com_error:
             handle_com_error()
 
@@ -1073,7 +1292,8 @@ class _wmi_namespace:
         """Perform an arbitrary query against a WMI object, and return
         a list of _wmi_object representations of the results.
         """
-        return [_wmi_object(obj, instance_of, fields) for obj in self._raw_query(wql)]
+        return [_wmi_object(obj, instance_of, fields, schema_cache=self.schema_cache)
+                for obj in self._raw_query(wql)]
 
     def fetch_as_classes(self, wmi_classname, fields=(), **where_clause):
         """Build and execute a wql query to fetch the specified list of fields from
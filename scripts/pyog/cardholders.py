@@ -0,0 +1,205 @@
+"""
+cardholders.py
+
+Cardholder lookups for access events. CardholderCache maps badge IDs to cardholder
+fields, so that access events can carry their cardholder without a query per event.
+
+:Example:
+
+>>> import pyog
+>>> dit = pyog.DIT(server='ms5')
+>>> cache = pyog.CardholderCache(dit, fields=('ID', 'LASTNAME', 'FIRSTNAME', 'DEPT'))
+>>> access = dit.hardware_events(pyog.HWAccessEvent).add_stage(cache.enrich)
+>>> event = access()
+>>> event['Cardholder']
+{'ID': 1, 'LASTNAME': 'Lake', 'FIRSTNAME': 'Lisa', 'DEPT': 0}
+
+Keep the cache fresh from badge and cardholder changes, e.g. from an EventHub:
+
+>>> hub = dit.event_hub()
+>>> hub.software_events(pyog.CardholderCache.targets, callback=cache.apply)
+>>> hub.start()
+"""
+
+
+from pyog.dit import DITConnection, SWModificationEvent, SWDeletionEvent, \
+    SWCreationEvent, EventRecord, _preferred_badge, _wql_condition, _wql_name
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class CardholderCache:
+    """
+    LRU cache of cardholder fields by badge ID, with entries expiring after ttl seconds.
+
+    A miss costs two queries (Lnl_Badge, then Lnl_Cardholder), made with the cache
+    connection, so lookups and enrich() must run in the thread that owns it. apply()
+    only updates the cache and is safe from any thread.
+
+    :param connection: {DITConnection} Connection for lookups.
+    :param fields: {iterable{str}} Lnl_Cardholder properties to carry. Must include ID.
+    :param maxsize: {int} Badges held.
+    :param ttl: {float} Seconds an entry is trusted, also for unknown badges.
+    :param event_field: {str} Event property enrich() stores the cardholder in.
+    """
+
+    #: Classes whose software events apply() handles.
+    targets = ('Lnl_Badge', 'Lnl_Cardholder')
+
+    def __init__(self, connection: DITConnection, fields=('ID', 'LASTNAME', 'FIRSTNAME'),
+                 maxsize=10000, ttl=3600.0, event_field='Cardholder'):
+        self._connection = connection
+        self.fields = tuple(_wql_name(f) for f in fields)
+        if 'ID' not in self.fields:
+            raise ValueError('Cardholder fields must include ID')
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.event_field = event_field
+        self._lock = Lock()
+        self._entries = OrderedDict()  # (cardholder dict or None, expiry) by badge ID.
+        self._badges = {}  # Set of cached badge IDs by cardholder ID.
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, badge_id):
+        """
+        Looks up the cardholder of a badge, querying on a miss.
+
+        :param badge_id: {int|str} Badge ID, e.g. an access event's CardNumber.
+        :return: {dict} Cardholder fields, None if the badge or its holder is unknown.
+        """
+        try:
+            badge_id = int(badge_id)
+        except (TypeError, ValueError):
+            return None
+        now = monotonic()
+        with self._lock:
+            entry = self._entries.get(badge_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(badge_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        holder = self._query(badge_id)
+        self._store(badge_id, holder, now + self.ttl)
+        return holder
+
+    def _query(self, badge_id):
+        """
+        :param badge_id: {int} Badge ID. If several badges have it, the holder of the \
+        active one is returned, see _preferred_badge().
+        :return: {dict} Cardholder fields, None if unknown.
+        """
+        badge = _preferred_badge(row._asdict() for row in self._connection._data_query(
+            f'select BADGEKEY, PERSONID, STATUS from Lnl_Badge '
+            f'where {_wql_condition("ID", badge_id)}'
+        ))
+        if badge is None or badge['PERSONID'] is None:
+            return None
+        holders = self._connection._data_query(
+            f'select {", ".join(self.fields)} from Lnl_Cardholder '
+            f'where {_wql_condition("ID", badge["PERSONID"])}'
+        )
+        return dict(zip(self.fields, holders[0])) if holders else None
+
+    def _store(self, badge_id, holder, expiry):
+        with self._lock:
+            self._drop(badge_id)
+            self._entries[badge_id] = holder, expiry
+            if holder is not None:
+                self._badges.setdefault(holder['ID'], set()).add(badge_id)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, badge_id):
+        entry = self._entries.pop(badge_id, None)
+        if entry is not None and entry[0] is not None:
+            badges = self._badges.get(entry[0]['ID'])
+            if badges is not None:
+                badges.discard(badge_id)
+                if not badges:
+                    del self._badges[entry[0]['ID']]
+
+    def enrich(self, event):
+        """
+        Watcher stage adding the cardholder of an access event's CardNumber, see \
+        _DITWatcher.add_stage().
+
+        :param event: {EventRecord|dict} The event.
+        :return: {EventRecord|dict} A copy of the event with the cardholder fields \
+        (None if unknown) in event_field. Events without CardNumber are returned unchanged.
+        """
+        if 'CardNumber' not in event:
+            return event
+        holder = self.get(event['CardNumber'])
+        values = {self.event_field: dict(holder) if holder is not None else None}
+        if isinstance(event, EventRecord):
+            return event.with_fields(**values)
+        return dict(event, **values)
+
+    def apply(self, event):
+        """
+        Updates the cache from a software event of a target class, see targets.
+
+        Badge changes drop the badge's entries. Cardholder changes update the fields of
+        the cached badges in place, deletions drop them.
+
+        :param event: {dict} Event from SWatcher, with "class" and "operation" tags.
+        """
+        cls = event.get('class', '').lower()
+        operation = event.get('operation', '').lower()
+        with self._lock:
+            if cls == 'lnl_badge':
+                for instance in (event, event.get('previous') or {}):
+                    if instance.get('ID') is not None:
+                        self._drop(instance['ID'])
+                        self.invalidations += 1
+            elif cls == 'lnl_cardholder' and event.get('ID') is not None:
+                badges = list(self._badges.get(event['ID'], ()))
+                for badge_id in badges:
+                    if operation == SWModificationEvent.lower():
+                        holder, expiry = self._entries[badge_id]
+                        holder = dict(holder, **{f: event[f] for f in self.fields
+                                                 if f in event})
+                        self._entries[badge_id] = holder, expiry
+                    elif operation != SWCreationEvent.lower():
+                        self._drop(badge_id)
+                        self.invalidations += 1
+
+    def invalidate(self, badge_id=None):
+        """
+        Drops a badge, or everything.
+
+        :param badge_id: {int} Badge ID, None for all.
+        """
+        with self._lock:
+            if badge_id is None:
+                self._entries.clear()
+                self._badges.clear()
+            else:
+                self._drop(int(badge_id))
+            self.invalidations += 1
+
+    def software_events(self):
+        """
+        Subscribes to the software events apply() handles, on the cache connection.
+
+        :return: {SWatcher} Watcher for badge and cardholder changes.
+        """
+        return self._connection.software_events(
+            list(CardholderCache.targets),
+            [SWCreationEvent, SWModificationEvent, SWDeletionEvent]
+        )
+
+    def stats(self) -> dict:
+        """
+        :return: {dict} size, hits, misses, hit_ratio and invalidations.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else None,
+            'invalidations': self.invalidations
+        }
@@ -15,6 +15,9 @@ DITError. Based on Python wmi library (https://pypi.org/project/WMI/) slightly m
 [('Lake', 'Lisa', '234'), ('Gorvachev', 'Mikhail', None), ('Carlitos', 'Muñoz', '456'),
 ('Carr', 'Brian', None), ('Ehud', 'Barak', None), ('Marchetti', 'Thomas', None),
 ('Streuben', 'Lisa', None), ('Taksh', 'Mastpur', None), ('Twain', 'Mark', None)]
+>>> for lastname, zip_code in dit.iter_query('select LASTNAME, ZIP from Lnl_Cardholder'):
+...     pass  # Rows arrive as the server delivers them.
+...
 >>> lisa = dit.data_query('select * from Lnl_Cardholder where ID=1')[0][0]
 >>> lisa.LASTNAME
 'Lake'
@@ -30,7 +33,7 @@ DITError. Based on Python wmi library (https://pypi.org/project/WMI/) slightly m
 >>> access_watcher = dit.hardware_events(pyog.HWAccessEvent)
 >>> while 1:
 ...     event = access_watcher()
-...     print(event)
+...     print(event.to_dict())
 ...
 {'AccessResult': 2, 'Alarm': {'Description': 'Granted Access', 'EventParamDescription':
 '', 'ID': 1, 'IsActive': False, 'MustAcknowledge': True, 'Priority': 50},
@@ -58,6 +61,8 @@ None, 'FacilityCode': None, 'ID': 1, 'IsReadableCard': True, 'IssueCode': None,
 
 
 from pyog import _wmii  # Use when compiling exe
+from pyog.events import AsyncWatcher, EventHub, ReconnectingWatcher, \
+    BUFFER_DROP_OLDEST
 # import _wmii  # Use when running from Python
 import win32com
 # noinspection PyUnresolvedReferences
@@ -66,8 +71,17 @@ from re import compile, search
 # noinspection PyUnresolvedReferences
 from pythoncom import CoInitialize
 from sys import exc_info
-from functools import partial
-from collections import OrderedDict, UserString
+from functools import partial, lru_cache
+from contextlib import contextmanager
+from threading import Lock
+import asyncio
+from time import monotonic
+from collections import OrderedDict, UserString, namedtuple
+from collections.abc import Mapping
+try:
+    import numpy
+except ImportError:  # Bulk status decoding falls back to lists.
+    numpy = None
 
 
 # Hardware event classes.
@@ -143,6 +157,25 @@ class HWStatus(OrderedDict):
         """
         return [self[code] for code in self if code & status or code == 0]
 
+    def decode_many(self, statuses) -> OrderedDict:
+        """
+        Decodes many statuses at once.
+
+        :param statuses: {list{int}|numpy.ndarray} The (ORed) encoded statuses.
+        :return: {OrderedDict{str: numpy.ndarray|list{bool}}} A column per individual \
+        status, true where set. NumPy boolean arrays if NumPy is installed.
+        """
+        if numpy is not None:
+            statuses = numpy.asarray(statuses, dtype=numpy.int64)
+            return OrderedDict(
+                (name, (statuses & code) != 0 if code else numpy.ones(len(statuses), bool))
+                for code, name in self.items()
+            )
+        return OrderedDict(
+            (name, [bool(status & code) or code == 0 for status in statuses])
+            for code, name in self.items()
+        )
+
 
 class _DeviceStatus(HWStatus):
 
@@ -221,6 +254,14 @@ class _OutputStatus(HWStatus):
     def decode(self, status: int):
         return [self[status]]
 
+    def decode_many(self, statuses) -> OrderedDict:
+        if numpy is not None:
+            statuses = numpy.asarray(statuses, dtype=numpy.int64)
+            return OrderedDict((name, statuses == code) for code, name in self.items())
+        return OrderedDict(
+            (name, [status == code for status in statuses]) for code, name in self.items()
+        )
+
 
 class _InputStatus(_OutputStatus):
 
@@ -247,6 +288,21 @@ class _ReaderMode(OrderedDict):
             (0x7, 'MODE_AUTOMATIC'),
         ])
 
+    def code(self, mode) -> int:
+        """
+        Resolves a reader mode.
+
+        :param mode: {int|str} Mode code or name, e.g. 'MODE_LOCKED'.
+        :return: {int} The mode code.
+        """
+        if isinstance(mode, str):
+            for code, name in self.items():
+                if name == mode.upper():
+                    return code
+        elif mode in self:
+            return mode
+        raise ValueError(f'Unknown reader mode "{mode}"')
+
 
 #:
 PANEL_STATUS = _PanelStatus()
@@ -283,18 +339,84 @@ def decode_status(device, dit_status):
     :param dit_status: {int} The status retrieved by DataConduIT GetHardwareStatus().
     :return: {list{str}} A list with descriptive string(s) for device status.
     """
+    return _status_cls[_status_class(device)].decode(dit_status)
+
+
+def _status_class(device) -> str:
+    """
+    Finds the class of a device with a known status: its own class or, failing that, \
+    a parent.
+
+    :param device: {DITElement} The hardware device.
+    :raises ValueError: If the device has no known status.
+    :return: {str} The class name, a key of _status_cls.
+    """
     device_cls = device.wmi_class()
     if device_cls in _status_cls:
-        status_dic = _status_cls[device_cls]
-    else:
-        for parent_cls in device.derivation():
-            if parent_cls in _status_cls:
-                status_dic = _status_cls[parent_cls]
-                break
-        else:
-            raise ValueError(f'Unknown hardware device "{device_cls}"')
+        return device_cls
+    for parent_cls in device.derivation():
+        if parent_cls in _status_cls:
+            return parent_cls
+    raise ValueError(f'Unknown hardware device "{device_cls}"')
+
 
-    return status_dic.decode(dit_status)
+def _hardware_status(device) -> int:
+    """
+    Calls GetHardwareStatus() on a device.
+
+    :param device: {DITElement} The hardware device.
+    :return: {int} The encoded status.
+    """
+    method = device.GetHardwareStatus
+    values = method()
+    names = [name for name, _ in method.out_parameter_names]
+    return values[names.index('Status')] if 'Status' in names else values[0]
+
+
+def status_table(rows) -> OrderedDict:
+    """
+    Decodes the statuses of many devices into a columnar table.
+
+    Statuses are decoded per status container in bulk (with NumPy if installed) rather
+    than device by device.
+
+    :param rows: {iterable{tuple}} (class, key, name, status, error) per device, as \
+    produced by DITConnection.status_sweep(). status is None if the poll failed.
+    :return: {OrderedDict{str: list|numpy.ndarray}} Columns class, key, name, status \
+    (-1 if failed), error (None if polled) and one boolean column per status name.
+    """
+    rows = list(rows)
+    table = OrderedDict()
+    for index, column in enumerate(('class', 'key', 'name')):
+        table[column] = [row[index] for row in rows]
+    statuses = [-1 if row[3] is None else row[3] for row in rows]
+    table['status'] = numpy.asarray(statuses, dtype=numpy.int64) if numpy is not None \
+        else statuses
+    table['error'] = [row[4] for row in rows]
+
+    # Rows by status container, to decode each group with a single call.
+    groups = OrderedDict()
+    for index, row in enumerate(rows):
+        if row[3] is not None:
+            groups.setdefault(id(_status_cls[row[0]]), []).append(index)
+    flags = OrderedDict()
+    for indexes in groups.values():
+        container = _status_cls[rows[indexes[0]][0]]
+        if numpy is not None:
+            indexes = numpy.asarray(indexes)
+            for name, column in container.decode_many(table['status'][indexes]).items():
+                if name not in flags:
+                    flags[name] = numpy.zeros(len(rows), bool)
+                flags[name][indexes] |= column
+        else:
+            group = container.decode_many([statuses[index] for index in indexes])
+            for name, column in group.items():
+                if name not in flags:
+                    flags[name] = [False] * len(rows)
+                for index, value in zip(indexes, column):
+                    flags[name][index] = flags[name][index] or value
+    table.update(flags)
+    return table
 
 # endregion: Status
 
@@ -303,6 +425,13 @@ class COMError(Exception):
     """
     pywintypes.com_error with added details.
     """
+
+    # RPC_S_SERVER_UNAVAILABLE, RPC_S_CALL_FAILED, RPC_S_CALL_FAILED_DNE,
+    # RPC_E_DISCONNECTED, OR_INVALID_OXID, WBEM_E_TRANSPORT_FAILURE.
+    _disconnected_codes = frozenset((
+        0x800706BA, 0x800706BE, 0x800706BF, 0x80010108, 0x80070776, 0x80041015
+    ))
+
     def __init__(self):
         super().__init__()
 
@@ -318,13 +447,23 @@ class COMError(Exception):
             self.source = ""
             self.description = strerror
 
-        self.code = hex(_wmii.signed_to_unsigned(hresult))
+        self.hresult = _wmii.signed_to_unsigned(hresult)
+        self.code = hex(self.hresult)
         self.operation = ""  # To be assigned by client if desired.
         self.param_info = ""
         self.additional_info = excepinfo
         self.handle = err
         self.args = self.code, self.description, self.source, self.param_info
 
+    @property
+    def disconnected(self) -> bool:
+        """
+        Whether the error means the connection to DataConduIT is lost.
+
+        :return: {bool} True if the connection must be reopened.
+        """
+        return self.hresult in COMError._disconnected_codes
+
 
 class DITError(COMError):
     """
@@ -392,25 +531,80 @@ class DITElement(_wmii._wmi_object):
         try:
             ole_object = connection.Get(lnl_class).SpawnInstance_() if lnl_class else \
                 ole_obj
-            super().__init__(ole_object)
+            super().__init__(ole_object, schema_cache=connection.schema_cache)
         except _COMI_ERROR:
             handle_error()
         self.__dict__["_namespace"] = connection
-        if ole_obj is None:  # Prevents infinite recursion when called from  __refresh()
+        self.__dict__["_deferred"] = 0  # Depth of nested batch() blocks.
+        if ole_obj is None:  # Only new objects are initialized with kwargs.
             self.set(**kwargs)
 
     def set(self, **kwargs):
         """
         Sets properties in batch.
 
+        Properties which already hold the given value are skipped. If none changed
+        nothing is written nor re-read, unless the object is new.
+
         :param kwargs: Named properties and values.
-        :return: None.
+        :return: {dict} The properties actually changed and their values.
         """
+        if self._deferred:
+            return self._stage(**kwargs)
         try:
-            super().set(**kwargs)
+            changed = super().set(**kwargs)
         except _COMI_ERROR:
             handle_error()
-        self._commit()
+        # noinspection PyUnboundLocalVariable
+        if changed or not self.Path_.Path:
+            self._commit()
+        return changed
+
+    @contextmanager
+    def batch(self, refresh=True):
+        """
+        Defers committing until the end of the block.
+
+        Assignments and set() calls inside the block only change the local object,
+        which is then written with a single Put_() instead of one Put_() and re-read per
+        property. Only properties that differ from the values last read are written and
+        nothing at all if none does, or if the block raises. Blocks can be nested; the
+        outermost one commits, and a nested block that raises drops only the values
+        staged in it.
+
+        :Example:
+
+        >>> with lisa.batch() as written:
+        ...     lisa.CITY = 'Rochester'
+        ...     lisa.ZIP = '14604'
+        >>> written
+        {'CITY': 'Rochester', 'ZIP': '14604'}
+
+        :param refresh: {bool} Whether to re-read the object after writing it. Skipping \
+        it saves a round-trip but leaves properties computed by the server (e.g. \
+        LASTCHANGED) stale. New objects are always re-read.
+        :return: {dict} Filled on exit with the properties written and their values.
+        """
+        written = {}
+        staged = self._dirty()  # By enclosing blocks, kept if this one raises.
+        self.__dict__["_deferred"] += 1
+        try:
+            yield written
+        except BaseException:
+            self.__dict__["_deferred"] -= 1
+            try:
+                self._revert(staged)
+            except Exception:
+                pass  # The block's exception is the one to report.
+            raise
+        self.__dict__["_deferred"] -= 1
+        if not self._deferred:
+            written.update(self._dirty())
+            if written:
+                self._commit(put=True, refresh=refresh)
+                for key in written:
+                    if self.properties[key] is not None:  # Not reset by a refresh.
+                        self.properties[key].clean()
 
     def wmi_class(self):
         """
@@ -418,20 +612,58 @@ class DITElement(_wmii._wmi_object):
 
         :return: {str} The wrapped object class.
         """
+        if self._schema is not None:
+            return self._schema.class_name
         return search(DITElement._cls_re, self.GetObjectText_()).group(0)
 
-    def _commit(self):
+    def _stage(self, **kwargs):
+        """
+        Sets properties on the local object only, to be committed by batch().
+
+        :param kwargs: Named properties and values.
+        :return: {dict} The properties changed and their values.
+        """
+        changed = {}
+        for key, value in kwargs.items():
+            if key not in self.properties:
+                raise AttributeError(key)
+            try:
+                prop = self._cached_properties(key)
+                if prop.value != value:
+                    prop.set(value)
+                    changed[key] = value
+            except _COMI_ERROR:
+                handle_error()
+        return changed
+
+    def _revert(self, staged):
+        """
+        Drops the values staged on the local object by a batch() block.
+
+        :param staged: {dict} Values staged before the block, restored instead of the \
+        values last read.
+        :return: None.
+        """
+        for key, prop in self.properties.items():
+            if prop is not None:
+                value = staged[key] if key in staged else prop.read_value
+                if prop.value != value:
+                    prop.set(value)
+
+    def _commit(self, put=False, refresh=True):
         """
         Saves changes to DataConduIT
 
         Must be called when changes are made.
+        :param put: {bool} Whether to write an existing object. New objects are always \
+        written; existing ones are already written by _wmii._wmi_object on assignment.
+        :param refresh: {bool} Whether to re-read the object after saving. New objects \
+        are always re-read.
         :return: None.
         """
         obj_path = self.Path_.Path
-        if obj_path:
-            # Renew members with updated properties.
-            self.__refresh(obj_path)
-        else:
+        if put or not obj_path:
+            refresh = refresh or not obj_path
             try:
                 # SWbemObject.Put_() returns SWbemObjectPath on success.
                 obj_path = self.Put_().Relpath  # Better than .Path because when
@@ -439,7 +671,8 @@ class DITElement(_wmii._wmi_object):
                 # the actual path has the active node hostname.
             except _COMI_ERROR:
                 handle_error()
-            # SWbemObject.Put_() succeeded. Renew members with updated properties.
+        if refresh:
+            # Renew members with updated properties.
             self.__refresh(obj_path)
 
     def __refresh(self, obj_path: str):
@@ -447,23 +680,301 @@ class DITElement(_wmii._wmi_object):
         Updates the current instance with properties of fresh instance from DataConduIT
 
         Must be called after saving changes to DataConduIT to get the updated object.
+        Only the wrapped object and the cached property values are replaced; method
+        wrappers and schema data are kept.
         :param obj_path: {str} Object WMI path.
         :return: None.
         """
         try:
-            new_obj = self._namespace.Get(obj_path)
+            # The raw namespace, as _wmii._wmi_namespace would first look up a class
+            # named "Get".
+            new_obj = self._namespace.wmi.Get(obj_path)
+            self._rebind(new_obj)
         except _COMI_ERROR:
             handle_error()
-        # noinspection PyUnboundLocalVariable
-        self.__dict__.update(DITElement(self._namespace, ole_obj=new_obj).__dict__)
 
     def __setattr__(self, key, value):
-        # If path exists  _wmii._wmi_object.__setattr__() will call SWbemObject.Put_().
+        # Writes and re-reads only if the value changed. See set().
+        self.set(**{key: value})
+
+
+_CIM_OBJECT = 13  # wbemCimtypeObject, embedded object property.
+_wql_name_re = compile(r"^[A-Za-z_]\w*$")
+
+
+def _wql_name(name: str) -> str:
+    """
+    Validates a class or property name for use in WQL.
+
+    :param name: {str} The name.
+    :raises ValueError: If the name is not a valid identifier.
+    :return: {str} The name.
+    """
+    if not isinstance(name, str) or not _wql_name_re.match(name):
+        raise ValueError(f'Invalid WQL name: {name!r}')
+    return name
+
+
+def _wql_literal(value) -> str:
+    """
+    Formats a value as a WQL literal, escaping backslashes and quotes in strings. Send
+    queries using it as written: with the watchers, or DITConnection._data_query().
+
+    :param value: {bool|int|str} The value.
+    :raises TypeError: If the value has no WQL literal.
+    :return: {str} The literal.
+    """
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, str):
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    raise TypeError(f'Cannot filter events by {type(value).__name__} value: {value!r}')
+
+
+_WQL_VALUE_SETS = (list, tuple, set, frozenset)  # Value types matching any of their items.
+
+
+def _wql_condition(name: str, value) -> str:
+    """
+    Compiles a filter to a WQL condition.
+
+    :param name: {str} Property name.
+    :param value: Value to match, None for NULL, or a list, tuple or set of values to \
+    match any of.
+    :return: {str} The condition.
+    """
+    name = _wql_name(name)
+    if value is None:
+        return f'{name} IS NULL'
+    if isinstance(value, _WQL_VALUE_SETS):
+        if not value:
+            raise ValueError(f'No values to match for {name}')
+        values = sorted(value, key=repr)
+        return '(' + ' OR '.join(_wql_condition(name, v) for v in values) + ')' \
+            if len(values) > 1 else _wql_condition(name, values[0])
+    return f'{name} = {_wql_literal(value)}'
+
+
+def _wql_select(cls: str, fields=None, filters=None) -> str:
+    """
+    Compiles a notification query.
+
+    :param cls: {str} Event class.
+    :param fields: {iterable{str}} Properties to deliver, all if None.
+    :param filters: {dict} Value(s) to match by property name, see _wql_condition().
+    :return: {str} The WQL query.
+    """
+    projection = ', '.join(_wql_name(f) for f in fields) if fields else '*'
+    wql = f'SELECT {projection} FROM {_wql_name(cls)}'
+    conditions = [_wql_condition(name, value) for name, value in (filters or {}).items()]
+    if conditions:
+        wql += ' WHERE ' + ' AND '.join(conditions)
+    return wql
+
+
+_BADGE_ACTIVE = 1  # Lnl_Badge.STATUS of active badges.
+
+
+def _preferred_badge(badges):
+    """
+    Picks the badge an ID stands for when several Lnl_Badge instances share it, e.g. a
+    lost badge and its replacement: an active badge first, then the most recently
+    issued one (highest BADGEKEY).
+
+    :param badges: {iterable{dict}} Badges with STATUS and BADGEKEY.
+    :return: {dict} The badge, None if there are none.
+    """
+    return max(badges, default=None, key=lambda badge: (
+        badge.get('STATUS') == _BADGE_ACTIVE, badge.get('BADGEKEY') or 0))
+
+
+class EventRecord(Mapping):
+    """
+    Read-only event delivered by HWatcher, with item and attribute access to the event
+    properties. Record types are created per event class by _EventDecoder.
+
+    Embedded objects (e.g. Alarm) are decoded on first access. COM objects can only be
+    used in the thread where they were received, so call detach() before passing the
+    record to another thread; EventHub and AsyncWatcher do.
+
+    >>> event['CardNumber'], event.CardNumber, event['Alarm']['Description']
+    ('258963', '258963', 'Granted Access')
+    """
+
+    __slots__ = ('_values', '_pending')
+    _fields = ()  # Property names, in the order of _values.
+    _index = {}  # Position in _values by property name.
+    _embedded = ()  # Positions of embedded object properties.
+    event_class = None
+
+    def __getitem__(self, name):
+        position = self._index[name]
+        if self._pending and position in self._embedded:
+            self._decode_embedded()
+        return self._values[position]
+
+    def __getattr__(self, name):
         try:
-            super().__setattr__(key, value)
-        except _COMI_ERROR:
-            handle_error()
-        self._commit()
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return f'{self.event_class}({dict(self)})'
+
+    def _decode_embedded(self):
+        values = list(self._values)
+        for position in self._embedded:
+            if values[position] is not None:
+                values[position] = _decode_event(values[position])
+        self._values = tuple(values)
+        self._pending = False
+
+    def detach(self):
+        """
+        Decodes the embedded objects so that the record holds no COM objects.
+
+        :return: {EventRecord} The record.
+        """
+        if self._pending:
+            self._decode_embedded()
+        return self
+
+    def to_dict(self) -> dict:
+        """
+        :return: {dict} The event as a plain dict, embedded objects included.
+        """
+        return {name: value.to_dict() if isinstance(value, EventRecord) else value
+                for name, value in self.items()}
+
+    def with_fields(self, **values) -> 'EventRecord':
+        """
+        Copy of the record with properties added or replaced, e.g. by enrichment.
+
+        :param values: Values by property name.
+        :return: {EventRecord} The new record.
+        """
+        base = type(self)
+        key = base, tuple(values)
+        record_type = _extended_records.get(key)
+        if record_type is None:
+            fields = base._fields + tuple(n for n in values if n not in base._index)
+            record_type = _extended_records[key] = type(base.__name__, (base,), {
+                '__slots__': (),
+                '_fields': fields,
+                '_index': {name: position for position, name in enumerate(fields)},
+            })
+        record_values = list(self._values)
+        record_values.extend([None] * (len(record_type._fields) - len(record_values)))
+        for name, value in values.items():
+            record_values[record_type._index[name]] = value
+        record = object.__new__(record_type)
+        record._values = tuple(record_values)
+        record._pending = self._pending
+        return record
+
+    def __reduce__(self):
+        # Record types are created at run time, so pickle by class name and fields.
+        self.detach()
+        return _rebuild_record, (self.event_class, self._fields, self._values)
+
+
+_extended_records = {}  # Record types by base type and added properties.
+_rebuilt_records = {}  # Record types of rebuilt records by class name and properties.
+
+
+def _rebuild_record(event_class, fields, values) -> EventRecord:
+    """
+    Rebuilds an EventRecord from its class and values, when unpickled or read back \
+    from an EventBuffer spill file.
+
+    :param event_class: {str} WMI class of the event.
+    :param fields: {tuple{str}} Property names.
+    :param values: {tuple} Property values, embedded objects decoded.
+    :return: {EventRecord} The record.
+    """
+    key = event_class, fields
+    record_type = _rebuilt_records.get(key)
+    if record_type is None:
+        record_type = _rebuilt_records[key] = type(event_class, (EventRecord,), {
+            '__slots__': (),
+            '_fields': fields,
+            '_index': {name: position for position, name in enumerate(fields)},
+            '_embedded': frozenset(),
+            'event_class': event_class,
+        })
+    record = object.__new__(record_type)
+    record._values = values
+    record._pending = False
+    return record
+
+
+class _EventDecoder:
+    """
+    Converts raw events of one class to EventRecords.
+
+    Compiled from the first event of the class: the Properties_ collection is walked
+    once to read the property names and types, afterwards only the values of those
+    properties are read by name.
+
+    :param class_name: {str} WMI class of the events, names the record type.
+    :param raw_event: Raw SWbemObject event of the class.
+    """
+
+    def __init__(self, class_name, raw_event):
+        fields, embedded = [], []
+        for position, p in enumerate(raw_event.Properties_):
+            fields.append(p.Name)
+            if p.CIMType == _CIM_OBJECT:
+                embedded.append(position)
+        self.record_type = type(class_name, (EventRecord,), {
+            '__slots__': (),
+            '_fields': tuple(fields),
+            '_index': {name: position for position, name in enumerate(fields)},
+            '_embedded': frozenset(embedded),
+            'event_class': class_name,
+        })
+
+    def __call__(self, raw_event):
+        properties = raw_event.Properties_
+        try:
+            values = tuple(properties(name).Value for name in self.record_type._fields)
+        except com_error:
+            raise ValueError('Event layout changed') from None
+        record = object.__new__(self.record_type)
+        record._values = values
+        record._pending = bool(self.record_type._embedded)
+        return record
+
+
+_event_decoders = {}  # _EventDecoder by event class and projection.
+
+
+def _decode_event(raw_event, projection=None) -> EventRecord:
+    """
+    Decodes a raw event or embedded object with the decoder compiled for its class.
+
+    :param raw_event: Raw SWbemObject.
+    :param projection: {tuple{str}} Properties selected by the event query, None if all.
+    :return: {EventRecord} The event record.
+    """
+    key = raw_event.Path_.Class, projection
+    decoder = _event_decoders.get(key)
+    if decoder is not None:
+        try:
+            return decoder(raw_event)
+        except ValueError:
+            pass
+    decoder = _event_decoders[key] = _EventDecoder(key[0], raw_event)
+    return decoder(raw_event)
 
 
 class _DITWatcher(_wmii._wmi_watcher):
@@ -483,6 +994,8 @@ class _DITWatcher(_wmii._wmi_watcher):
         :param is_extrinsic: {bool} Whether the events to watch for are extrinsic.
         Hardware events are extrinsic while software events are intrinsic.
         """
+        self._stages = []
+        self._error = None  # Raised by the next call, see drain().
         try:
             wmi_event = connection.ExecNotificationQuery(notification_wql)
         except _COMI_ERROR:
@@ -503,25 +1016,117 @@ class _DITWatcher(_wmii._wmi_watcher):
         """
         return {p.Name: p.Value for p in wmi_obj.Properties_}
 
-    def __call__(self, *args, **kwargs):
+    def __call__(self, timeout_ms=-1) -> dict:
         """
         Waits for an event to arrive and delivers it
 
-        :return: {dict} A dict with the events properties and values. "previous" key
-        contains the previous state of the instance if available.
+        :param timeout_ms: {int} Milliseconds to wait, infinite if negative.
+        :raises _wmii.x_wmi_timed_out: If no event arrived in time.
+        :return: {dict} A dict with the events properties and values.
+        """
+        self._raise_error()
+        return self._process(self._next_event(timeout_ms))
+
+    def add_stage(self, stage) -> '_DITWatcher':
+        """
+        Adds a processing stage run on each event before delivery, in the watcher's \
+        thread, e.g. CardholderCache.enrich.
+
+        :param stage: {callable} Called with the event, returns the event to deliver.
+        :return: {_DITWatcher} The watcher.
+        """
+        self._stages.append(stage)
+        return self
+
+    def _process(self, raw_event):
+        event = self._event(raw_event)
+        for stage in self._stages:
+            event = stage(event)
+        return event
+
+    def drain(self, max_events=100, max_wait_ms=0) -> list:
+        """
+        Delivers the events already waiting, up to max_events, plus those arriving \
+        within max_wait_ms. Cheaper per event than calling the watcher for each.
+
+        :Example:
+
+        >>> while 1:
+        ...     events = watcher.drain(max_events=500, max_wait_ms=200)
+        ...     store(events)  # Empty list if nothing arrived in 200 ms.
+
+        If receiving fails after some events were taken off the server, those events \
+        are returned and the error is raised by the next call instead.
+
+        :param max_events: {int} Maximum number of events to return.
+        :param max_wait_ms: {int} Milliseconds to wait for more events.
+        :return: {list{dict}} The events, as the watcher delivers them, in order.
+        """
+        self._raise_error()
+        raw_events = []
+        deadline = monotonic() + max_wait_ms / 1000
+        while len(raw_events) < max_events:
+            try:
+                raw_events.append(self._next_event(
+                    max(0, int((deadline - monotonic()) * 1000))
+                ))
+            except _wmii.x_wmi_timed_out:
+                break
+            except Exception as e:
+                if not raw_events:
+                    raise
+                self._error = e
+                break
+        return [self._process(raw_event) for raw_event in raw_events]
+
+    def _raise_error(self):
+        """
+        Raises the error deferred by drain(), once.
+        """
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def _next_event(self, timeout_ms):
+        """
+        Waits for the next event. The event is not wrapped in a _wmii._wmi_event, \
+        conversion reads its properties once.
+
+        :param timeout_ms: {int} Milliseconds to wait, infinite if negative.
+        :raises _wmii.x_wmi_timed_out: If no event arrived in time.
+        :return: The raw SWbemObject event.
         """
         try:
-            return super().__call__()
-        except _COMI_ERROR:
-            handle_error()
+            return self.wmi_event.NextEvent(timeout_ms)
+        except com_error:
+            try:
+                _wmii.handle_com_error()  # Raises x_wmi_timed_out on timeout.
+            except _wmii.x_wmi_timed_out:
+                raise
+            except _wmii.x_wmi:
+                handle_error()
+
+    def _event(self, raw_event) -> dict:
+        """
+        Converts a raw event. Overridden by watchers.
+
+        :param raw_event: The raw SWbemObject event.
+        :return: {dict} The event properties and values.
+        """
+        return _DITWatcher._to_dict(raw_event)
 
 
 class HWatcher(_DITWatcher):
     """
-    Watches for hardware events and delivers them as a dictionary when called.
+    Watches for hardware events and delivers them as an EventRecord when called.
+
+    Events can be filtered by the server so that only the wanted ones are sent and
+    decoded, see DITConnection.hardware_events().
 
     :param connection: {_wmii._wmi_namespace} DataConduIT namespace connection.
     :param EventClass: {str} The name of the hardware event class to watch for.
+    :param fields: {iterable{str}} Properties to deliver, all if None.
+    :param filters: {dict} Value(s) to match by property name.
 
     DataConduIT hardware events hierarchy:
 
@@ -539,22 +1144,27 @@ class HWatcher(_DITWatcher):
                                                           * Lnl_VideoEvent
     """
 
-    def __init__(self, connection, EventClass):
+    def __init__(self, connection, EventClass, fields=None, filters=None):
+        # Projected events have fewer properties, so they get their own decoders.
+        self._decoder_key = tuple(fields) if fields else None
         super().__init__(
             connection,
-            f"SELECT * FROM {EventClass}",
+            _wql_select(EventClass, fields, filters),
             is_extrinsic=True
         )
 
-    def __call__(self, *args, **kwargs) -> dict:
+    def __call__(self, timeout_ms=-1) -> EventRecord:
         """
         Waits for an event to arrive and delivers it. Note that this is blocking.
 
-        :return: {dict} A dict with the events properties and values.
+        :param timeout_ms: {int} Milliseconds to wait, infinite if negative.
+        :raises _wmii.x_wmi_timed_out: If no event arrived in time.
+        :return: {EventRecord} The event, a read-only mapping of properties and values.
         """
-        dict_evt = _DITWatcher._to_dict(super().__call__())
-        dict_evt["Alarm"] = _DITWatcher._to_dict(dict_evt["Alarm"])
-        return dict_evt
+        return super().__call__(timeout_ms)
+
+    def _event(self, raw_event) -> EventRecord:
+        return _decode_event(raw_event, self._decoder_key)
 
 
 class SWatcher(_DITWatcher):
@@ -565,10 +1175,14 @@ class SWatcher(_DITWatcher):
     Lnl_Cardholder, Lnl_Visitor, Lnl_Badge, and Lnl_Account (Directory accounts linked
     to Cardholder).
 
+    Several target classes and operations can be watched with one subscription. Events
+    are tagged with the target class ("class") and operation ("operation") they are for.
+
     :param connection: {_wmii._wmi_namespace} DataConduIT namespace connection.
-    :param SWClass: {str} The name of software class to watch changes for.
-    :param operation: The operation type class to watch for: __InstanceOperationEvent or\
-    child.
+    :param TargetCls: {str|iterable{str}} The name(s) of software class to watch changes \
+    for.
+    :param operation: {str|iterable{str}} The operation type class(es) to watch for: \
+    __InstanceOperationEvent or child.
 
     WMI software event operation hierarchy:
 
@@ -580,30 +1194,330 @@ class SWatcher(_DITWatcher):
     """
 
     targets = ('lnl_cardholder', 'lnl_visitor', 'lnl_badge', 'lnl_account')
+    operations = ('__instanceoperationevent', '__instancecreationevent',
+                  '__instancemodificationevent', '__instancedeletionevent')
+    # Class names as the server reports them in Path_.Class, to tag events the same
+    # whether the tag is known from the subscription or read from the event.
+    _names = {name.lower(): name for name in (
+        'Lnl_Cardholder', 'Lnl_Visitor', 'Lnl_Badge', 'Lnl_Account', SWOperationEvent,
+        SWCreationEvent, SWModificationEvent, SWDeletionEvent
+    )}
 
     def __init__(self, connection, TargetCls, operation):
-        if TargetCls.lower() not in SWatcher.targets:
-            raise ValueError(f'Invalid target class: {TargetCls}')
+        targets = [TargetCls] if isinstance(TargetCls, str) else list(TargetCls)
+        operations = [operation] if isinstance(operation, str) else list(operation)
+        for target in targets:
+            if target.lower() not in SWatcher.targets:
+                raise ValueError(f'Invalid target class: {target}')
+        for op in operations:
+            if op.lower() not in SWatcher.operations:
+                raise ValueError(f'Invalid operation: {op}')
+        if not targets or not operations:
+            raise ValueError('No target class or operation to watch')
+        # Tags known from the subscription need not be read from each event.
+        self._target = SWatcher._names[targets[0].lower()] if len(targets) == 1 else None
+        self._operation = SWatcher._names[operations[0].lower()] \
+            if len(operations) == 1 and operations[0].lower() != SWOperationEvent.lower() \
+            else None
         super().__init__(
             connection,
-            f"select * from {operation} where TargetInstance ISA '{TargetCls}'",
+            SWatcher._wql(targets, operations),
             is_extrinsic=False
         )
 
-    def __call__(self, *args, **kwargs):
+    @staticmethod
+    def _wql(targets, operations) -> str:
+        """
+        Compiles the notification query for one or more targets and operations.
+
+        :param targets: {list{str}} Target classes.
+        :param operations: {list{str}} Operation event classes.
+        :return: {str} The WQL query.
+        """
+        isa = ' OR '.join(f"TargetInstance ISA '{_wql_name(t)}'" for t in targets)
+        if len(operations) == 1:
+            return f"select * from {_wql_name(operations[0])} where {isa}"
+        if any(op.lower() == SWOperationEvent.lower() for op in operations):
+            return f"select * from {SWOperationEvent} where {isa}"
+        classes = ' OR '.join(f"__CLASS = '{_wql_name(op)}'" for op in operations)
+        return f"select * from {SWOperationEvent} where ({classes}) AND ({isa})"
+
+    def __call__(self, timeout_ms=-1):
         """
         Waits for an event to arrive and delivers it. Note that this is blocking.
 
+        :param timeout_ms: {int} Milliseconds to wait, infinite if negative.
+        :raises _wmii.x_wmi_timed_out: If no event arrived in time.
         :return: {dict} A dict with the events properties and values. "previous" key
-        contains the previous state of the instance if available.
+        contains the previous state of the instance if available, "class" the target
+        class and "operation" the operation event class, e.g. __InstanceCreationEvent.
+        "TIME_CREATED" is the operation event's, unless the instance has its own.
         """
-        event = super().__call__()
-        dict_evt = _DITWatcher._to_dict(event)
-        dict_evt["previous"] = _DITWatcher._to_dict(event.previous) \
-            if event.previous is not None else None
+        return super().__call__(timeout_ms)
+
+    def _event(self, raw_event) -> dict:
+        # PreviousInstance only exists in modification events.
+        instances = _DITWatcher._to_dict(raw_event)
+        target = instances["TargetInstance"]
+        dict_evt = _DITWatcher._to_dict(target)
+        previous = instances.get("PreviousInstance")
+        dict_evt["previous"] = _DITWatcher._to_dict(previous) \
+            if previous is not None else None
+        dict_evt["class"] = self._target or target.Path_.Class
+        dict_evt["operation"] = self._operation or raw_event.Path_.Class
+        # Lets EventHub report the lag of software events as of hardware events.
+        if instances.get("TIME_CREATED") is not None:
+            dict_evt.setdefault("TIME_CREATED", instances["TIME_CREATED"])
         return dict_evt
 
 
+@lru_cache(maxsize=None)
+def _row_type(properties: tuple) -> type:
+    """
+    Named tuple type for rows of a projected query.
+
+    :param properties: {tuple{str}} The selected properties.
+    :return: {type} The row type. Fields that are not valid identifiers are renamed.
+    """
+    return namedtuple('Row', properties, rename=True)
+
+
+def _read_row(ole_obj, properties, row_type, references=()) -> tuple:
+    """
+    Reads only the requested properties of a query result, once each.
+
+    Skips _wmii._wmi_object, which enumerates all properties, methods and qualifiers \
+    of the result before any value is read. Reference properties are turned into WMI \
+    objects as _wmii._wmi_object does.
+
+    :param ole_obj: {ISWbemObject} Query result.
+    :param properties: {list{str}} The properties to read.
+    :param row_type: {type} Row type from _row_type().
+    :param references: {tuple{int}} Positions of the reference properties.
+    :return: {tuple} The row.
+    """
+    ole_properties = ole_obj.Properties_
+    values = [ole_properties(p).Value for p in properties]
+    for i in references:
+        if values[i] is not None:
+            values[i] = _wmii.WMI(moniker=values[i])
+    return row_type._make(values)
+
+
+#: Key properties of the parent a device's name is unique under, by device class. Keys
+#: are listed alphabetically by WMI, so their order does not tell the parent.
+_name_scope = {
+    'lnl_panel': (),
+    'lnl_reader': ('PanelID',),
+    'lnl_alarmpanel': ('PanelID',),
+    'lnl_alarminput': ('PanelID', 'AlarmPanelID'),
+    'lnl_alarmoutput': ('PanelID', 'AlarmPanelID'),
+}
+
+
+class DITTopology:
+    """
+    Cache of the hardware devices of a connection, indexed by name and key.
+
+    Each device class is loaded with a single query and kept until the cache is older
+    than ttl seconds or refresh() is called. Devices added on the server are found after
+    either; lookups of unknown devices never reload. Devices are full DITElements, so
+    their methods (e.g. OpenDoor, GetHardwareStatus) cost one COM call each.
+
+    :Example:
+
+    >>> dit.topology.reader('3300', 'CK').OpenDoor()
+    >>> dit.topology.panel(1).Name
+    '3300'
+    >>> dit.topology.by_key('Lnl_Reader', 1, 2)  # Key properties in schema order.
+    >>> dit.topology.device('Lnl_AlarmInput', '3300', 'Input 1', alarm_panel='AP1')
+
+    :param connection: {DITConnection} The DataConduIT connection.
+    :param ttl: {float} Seconds the devices are cached.
+    :param classes: {tuple{str}} Device classes to load.
+    """
+
+    #: Device classes loaded by default.
+    classes = (
+        'Lnl_Panel', 'Lnl_Reader', 'Lnl_AlarmPanel', 'Lnl_AlarmInput', 'Lnl_AlarmOutput'
+    )
+
+    def __init__(self, connection, ttl=300.0, classes=None):
+        self._connection = connection
+        self.ttl = ttl
+        if classes is not None:
+            self.classes = tuple(classes)
+        self.loaded = None  # monotonic() time of the last load.
+        self._devices = {}
+        self._by_name = {}
+        self._by_key = {}
+        self._names = {}  # Device name by class and key.
+        self._panel_ids = {}  # Panel ID by lowercase name.
+
+    def refresh(self):
+        """
+        Reloads all devices.
+
+        :return: None.
+        """
+        devices, by_name, by_key, names, panel_ids = {}, {}, {}, {}, {}
+        for lnl_class in self.classes:
+            cls_key = lnl_class.lower()
+            devices[cls_key] = []
+            by_name[cls_key] = {}
+            by_key[cls_key] = {}
+            names[cls_key] = {}
+            for device, in self._connection.iter_query(f'select * from {lnl_class}'):
+                devices[cls_key].append(device)
+                key = tuple(_property(device, k) for k in device.keys)
+                by_key[cls_key][key] = device
+                name = _property(device, 'Name')
+                names[cls_key][key] = name
+                if name is not None:
+                    # Names are unique under the parent: (PanelID, AlarmPanelID) for
+                    # alarm inputs and outputs. Other classes are scoped by their panel.
+                    values = {k.lower(): v for k, v in zip(device.keys, key)}
+                    scope = _name_scope.get(
+                        cls_key, ('PanelID',) if 'panelid' in values else ())
+                    scope = tuple(values.get(k.lower()) for k in scope)
+                    by_name[cls_key][scope + (name.lower(),)] = device
+                    if cls_key == 'lnl_panel':
+                        panel_ids[name.lower()] = _property(device, 'ID')
+        self._devices, self._by_name, self._by_key = devices, by_name, by_key
+        self._names, self._panel_ids = names, panel_ids
+        self.loaded = monotonic()
+
+    @property
+    def expired(self) -> bool:
+        """
+        Whether the devices were never loaded or are older than ttl.
+
+        :return: {bool} True if the next lookup reloads.
+        """
+        return self.loaded is None or monotonic() - self.loaded > self.ttl
+
+    def _lookup(self, index, lnl_class, key):
+        """
+        Looks a device up, reloading only when expired. Missing devices are not \
+        reloaded for, so unknown names cost no query.
+
+        :return: {DITElement} The device or None.
+        """
+        if self.expired:
+            self.refresh()
+        return index().get(lnl_class.lower(), {}).get(key)
+
+    def devices(self, lnl_class=None) -> list:
+        """
+        The cached devices.
+
+        :param lnl_class: {str} Only devices of this class. All if not specified.
+        :return: {list{DITElement}} The devices.
+        """
+        if self.expired:
+            self.refresh()
+        if lnl_class is not None:
+            return list(self._devices.get(lnl_class.lower(), ()))
+        return [device for devices in self._devices.values() for device in devices]
+
+    def keys(self, lnl_class) -> list:
+        """
+        Keys and names of the cached devices of a class, e.g. to pass across threads.
+
+        :param lnl_class: {str} Device class.
+        :return: {list{tuple}} (key, name) pairs. See by_key().
+        """
+        if self.expired:
+            self.refresh()
+        return list(self._names.get(lnl_class.lower(), {}).items())
+
+    def panel(self, panel):
+        """
+        Finds a panel.
+
+        :param panel: {str|int} Panel name or ID.
+        :return: {DITElement} The Lnl_Panel or None.
+        """
+        if isinstance(panel, int):
+            return self.by_key('Lnl_Panel', panel)
+        return self._lookup(lambda: self._by_name, 'Lnl_Panel', (panel.lower(),))
+
+    def panel_id(self, panel):
+        """
+        Resolves a panel name to its ID without touching DataConduIT.
+
+        :param panel: {str|int} Panel name or ID.
+        :return: {int} The panel ID or None.
+        """
+        if isinstance(panel, int):
+            return panel
+        lnl_panel = self.panel(panel)  # Reloads if needed.
+        return None if lnl_panel is None else self._panel_ids.get(panel.lower())
+
+    def device(self, lnl_class, panel, name, alarm_panel=None):
+        """
+        Finds a device by its panel and name.
+
+        :param lnl_class: {str} Device class, e.g. 'Lnl_Reader'.
+        :param panel: {str|int} Panel name or ID.
+        :param name: {str} Device name.
+        :param alarm_panel: {str|int} Alarm panel name or ID, required for alarm \
+        inputs and outputs whose names are only unique per alarm panel.
+        :return: {DITElement} The device or None.
+        """
+        panel_id = self.panel_id(panel)
+        if panel_id is None:
+            return None
+        scope = (panel_id,)
+        if alarm_panel is not None:
+            if not isinstance(alarm_panel, int):
+                lnl_alarm_panel = self.device('Lnl_AlarmPanel', panel_id, alarm_panel)
+                if lnl_alarm_panel is None:
+                    return None
+                alarm_panel = _property(lnl_alarm_panel, 'AlarmPanelID')
+            scope += (alarm_panel,)
+        return self._lookup(lambda: self._by_name, lnl_class, scope + (name.lower(),))
+
+    def reader(self, panel, reader):
+        """
+        Finds a reader.
+
+        :param panel: {str|int} Panel name or ID.
+        :param reader: {str|int} Reader name or ID.
+        :return: {DITElement} The Lnl_Reader or None.
+        """
+        if isinstance(reader, int):
+            panel_id = self.panel_id(panel)
+            if panel_id is None:
+                return None
+            return self.by_key('Lnl_Reader', panel_id, reader)
+        return self.device('Lnl_Reader', panel, reader)
+
+    def by_key(self, lnl_class, *key):
+        """
+        Finds a device by the values of its key properties.
+
+        :param lnl_class: {str} Device class.
+        :param key: Key property values in schema order, e.g. PanelID, ReaderID.
+        :return: {DITElement} The device or None.
+        """
+        return self._lookup(lambda: self._by_key, lnl_class, key)
+
+
+def _property(element, name):
+    """
+    Reads a property case insensitively, as WQL does.
+
+    :param element: {_wmii._wmi_object} The object.
+    :param name: {str} Property name.
+    :return: The property value, None if the object has no such property.
+    """
+    try:
+        return element.ole_object.Properties_(name).Value
+    except _COMI_ERROR:
+        return None
+
+
 class DITConnection:
     """
     OnGuard WMI namespace connection manager. Can be instantiated directly but use
@@ -612,6 +1526,10 @@ class DITConnection:
 
     def __init__(self, dit_namespace: _wmii._wmi_namespace):
         self._namespace = dit_namespace
+        self._topology = None
+        self._connect_args = None  # Set by DIT() to allow clone().
+        self._hub = None  # EventHub of the asyncio subscriptions.
+        self._hub_lock = Lock()
 
     @property
     def namespace(self) -> _wmii._wmi_namespace:
@@ -622,70 +1540,412 @@ class DITConnection:
         """
         return self._namespace
 
-    def data_query(self, wql: str) -> list:
+    @property
+    def schema_cache(self) -> _wmii._wmi_schema_cache:
+        """
+        Class schemas shared by all objects wrapped from this connection.
+
+        Exposes hits and misses counters, stats() and invalidate(class_name=None).
+
+        :return: {_wmii._wmi_schema_cache} The schema cache.
+        """
+        return self._namespace.schema_cache
+
+    @property
+    def topology(self) -> DITTopology:
+        """
+        Cached hardware devices, loaded on first use. See DITTopology.
+
+        :return: {DITTopology} The device cache.
+        """
+        if self._topology is None:
+            self._topology = DITTopology(self)
+        return self._topology
+
+    def data_query(self, wql: str, stream=False):
         """
         Runs a WQL data query (as opposed to an event or schema query).
 
-        :param wql: {str} The query.
-        :return: {list{tuple}} If queried for "*" a list of tuples with DITElements,\
-        otherwise a list of tuples with the specified properties.
+        :param wql: {str} The query. Backslashes are doubled before it is sent, as in \
+        _wmii, so write them once.
+        :param stream: {bool} Return a generator as in iter_query() instead of loading \
+        the whole result set. Note the different shape for "*".
+        :return: {list{tuple}} If queried for "*" a list holding a single tuple with all \
+        the DITElements, otherwise a list of named tuples with the specified properties. \
+        Reference properties are read as WMI objects of the referenced paths.
         """
+        return self._data_query(wql, stream, escaped=False)
+
+    def iter_query(self, wql: str):
+        """
+        Runs a WQL data query yielding rows as the server delivers them.
+
+        Rows are wrapped one at a time from the forward-only enumerator, so memory
+        stays constant and the first row is available after one round-trip. The
+        enumerator can only be walked once and, as any COM object, only from the thread
+        that owns the connection.
+
+        :param wql: {str} The query, see data_query().
+        :return: {generator{tuple}} If queried for "*" a 1-tuple with a DITElement per \
+        row, unlike data_query()'s single tuple of all of them, otherwise named tuples \
+        with the specified properties.
+        """
+        return self._iter_query(wql, escaped=False)
+
+    def _data_query(self, wql: str, stream=False, escaped=True):
+        """
+        data_query() for queries whose string literals are already escaped, e.g. built
+        with _wql_condition().
+
+        :param escaped: {bool} False to double backslashes as data_query() does.
+        """
+        if stream:
+            return self._iter_query(wql, escaped)
+        properties = DITConnection._projection(wql)
         try:
-            results = self._namespace.query(wql)
-            properties = [p.strip()
-                          for p in wql[7:wql.lower().index(' from')].split(',')]
+            results = self._exec_query(wql, escaped)
             if properties[0] == '*':
                 return [tuple(DITElement(self._namespace, ole_obj=r) for r in results)]
             else:
-                final_results = []
+                row_type = _row_type(tuple(properties))
+                references = self._references(wql, properties)
+                return [_read_row(r, properties, row_type, references) for r in results]
+        except _COMI_ERROR:
+            handle_error()
+
+    def _iter_query(self, wql: str, escaped=True):
+        """
+        iter_query() for queries whose string literals are already escaped, see
+        _data_query().
+        """
+        properties = DITConnection._projection(wql)
+        try:
+            results = self._exec_query(wql, escaped)
+            if properties[0] == '*':
                 for r in results:
-                    final_results.append(
-                        tuple(getattr(r, p.upper()) for p in properties)
-                    )
-                return final_results
+                    yield DITElement(self._namespace, ole_obj=r),
+            else:
+                row_type = _row_type(tuple(properties))
+                references = self._references(wql, properties)
+                for r in results:
+                    yield _read_row(r, properties, row_type, references)
         except _COMI_ERROR:
             handle_error()
 
+    def _exec_query(self, wql: str, escaped):
+        """
+        Sends a WQL data query, forward-only and semi-synchronous.
+
+        :param wql: {str} The query.
+        :param escaped: {bool} Whether string literals are already escaped, e.g. by
+        _wql_literal(), and the query is sent as written. Otherwise backslashes are
+        doubled by _wmii's _raw_query().
+        :return: {SWbemObjectSet} The raw results.
+        """
+        if not escaped:
+            return self._namespace._raw_query(wql)
+        return self._namespace.wmi.ExecQuery(
+            strQuery=wql, iFlags=_wmii.wbemFlagReturnImmediately | _wmii.wbemFlagForwardOnly
+        )
+
+    def _references(self, wql: str, properties) -> tuple:
+        """
+        Finds the selected properties that hold object paths, from the cached schema of
+        the queried class.
+
+        :param wql: {str} The query.
+        :param properties: {list{str}} The selected properties, see _projection().
+        :return: {tuple{int}} Positions of the reference properties.
+        """
+        lnl_class = wql[wql.lower().index(' from ') + 6:].split()[0]
+        schema = self.schema_cache.schema(lnl_class)
+        references = {name.lower() for name, qualifiers in schema.property_qualifiers.items()
+                      if str(qualifiers.get('CIMTYPE', '')).startswith('ref:')}
+        return tuple(i for i, p in enumerate(properties) if p.lower() in references)
+
+    @staticmethod
+    def _projection(wql: str) -> list:
+        """
+        Extracts the selected property names from a WQL data query.
+
+        :param wql: {str} The query.
+        :return: {list{str}} The selected properties, ['*'] for all of them.
+        """
+        return [p.strip() for p in wql[7:wql.lower().index(' from')].split(',')]
+
     def open_door(self, panel, reader):
         """
         Pulses reader open.
 
-        :param panel: {str} Panel name upstream the reader.
-        :param reader: {str} Reader name.
+        The reader is resolved from the topology cache, so this is a single COM call
+        once the cache is loaded.
+
+        :param panel: {str|int} Panel name or ID upstream the reader.
+        :param reader: {str|int} Reader name or ID.
         :return: None.
         """
-        panel_id = self.data_query(f'select ID from Lnl_Panel where NAME = "{panel}"')
-        if panel_id:
-            lnl_reader = self.data_query(
-                f'select * from Lnl_Reader '
-                f'where PanelID = {panel_id[0][0]} and Name = "{reader}"'
-            )
-            if lnl_reader:
-                lnl_reader[0][0].OpenDoor()
-            else:
-                DITConnection._not_found_error("panel", panel)
-        else:
+        self._reader(panel, reader).OpenDoor()
+
+    def set_reader_mode(self, panel, reader, mode):
+        """
+        Sets reader mode.
+
+        :param panel: {str|int} Panel name or ID upstream the reader.
+        :param reader: {str|int} Reader name or ID.
+        :param mode: {int|str} Mode code or name from READER_MODE, e.g. 'MODE_LOCKED'.
+        :return: None.
+        """
+        self._reader(panel, reader).SetMode(Mode=READER_MODE.code(mode))
+
+    def status_sweep(self, classes=None) -> OrderedDict:
+        """
+        Polls the hardware status of all cached devices and decodes it in bulk.
+
+        Devices are polled one after the other on this connection, one round-trip each.
+        Use DITPool.status_sweep() to spread them over the pool's connections.
+
+        :Example:
+
+        >>> table = dit.status_sweep()
+        >>> offline = [name for name, online in zip(table['name'], table['RDRSTATUS_ONLINE'])
+        ...            if not online]
+
+        :param classes: {iterable{str}} Device classes to poll. Defaults to the topology \
+        classes with a known status.
+        :return: {OrderedDict} Columnar table, see status_table().
+        """
+        return status_table(self._poll_statuses(self._status_devices(classes)))
+
+    def _status_devices(self, classes=None) -> list:
+        """
+        Lists the cached devices to poll as plain data.
+
+        :param classes: {iterable{str}} Device classes, see status_sweep().
+        :return: {list{tuple}} (class, key, name) per device.
+        """
+        if classes is None:
+            classes = [cls for cls in self.topology.classes if cls in _status_cls]
+        return [(lnl_class, key, name)
+                for lnl_class in classes for key, name in self.topology.keys(lnl_class)]
+
+    def _poll_statuses(self, devices) -> list:
+        """
+        Polls devices listed by _status_devices().
+
+        :param devices: {iterable{tuple}} (class, key, name) per device.
+        :return: {list{tuple}} (class, key, name, status, error) per device, with the \
+        actual device class.
+        """
+        rows = []
+        for lnl_class, key, name in devices:
+            status = error = None
+            device = self.topology.by_key(lnl_class, *key)
+            if device is None:
+                error = _wmii.x_wmi(f'{lnl_class} "{key}" not found.')
+                rows.append((lnl_class, key, name, status, error))
+                continue
+            try:
+                lnl_class = _status_class(device)
+                status = _hardware_status(device)
+            except _COMI_ERROR as e:
+                if getattr(e, 'com_error', e) is None:  # x_wmi without a COM error.
+                    error = e
+                else:
+                    try:
+                        handle_error()
+                    except COMError as details:
+                        error = details
+            except (COMError, ValueError) as e:
+                error = e
+            rows.append((lnl_class, key, name, status, error))
+        return rows
+
+    def _reader(self, panel, reader) -> DITElement:
+        """
+        Resolves a reader from the topology cache.
+
+        :param panel: {str|int} Panel name or ID.
+        :param reader: {str|int} Reader name or ID.
+        :raises _wmii.x_wmi: If the panel or reader is not found.
+        :return: {DITElement} The Lnl_Reader.
+        """
+        if self.topology.panel(panel) is None:
+            DITConnection._not_found_error("panel", panel)
+        lnl_reader = self.topology.reader(panel, reader)
+        if lnl_reader is None:
             DITConnection._not_found_error("reader", reader)
+        return lnl_reader
 
-    def hardware_events(self, EventClass=HWEvent):
+    def hardware_events(self, EventClass=HWEvent, PanelID=None, DeviceID=None,
+                        SecondaryDeviceID=None, AccessResult=None, Type=None,
+                        SubType=None, fields=None, **filters):
         """
         Creates hardware event subscription for the given event class.
 
+        Filters are compiled into the notification query so that the server only sends
+        matching events. Each filter takes a value or a list of values to match any of.
+
+        :Example:
+
+        >>> doors = dit.hardware_events(pyog.HWAccessEvent, PanelID=1, DeviceID=[2, 3])
+        >>> badges = dit.hardware_events(pyog.HWAccessEvent, fields=['CardNumber', 'Time'])
+
         :param EventClass: {str} The hardware event class.
+        :param PanelID: {int|list{int}} Panel ID(s).
+        :param DeviceID: {int|list{int}} Device ID(s), e.g. reader ID.
+        :param SecondaryDeviceID: {int|list{int}} Secondary device ID(s), e.g. input ID.
+        :param AccessResult: {int|list{int}} Access result(s), access events only.
+        :param Type: {int|list{int}} Event type(s).
+        :param SubType: {int|list{int}} Event subtype(s).
+        :param fields: {iterable{str}} Properties to deliver, all if None.
+        :param filters: Value(s) to match for other properties of the event class.
         :return: {HWatcher} The hardware event watcher.
         """
-        return HWatcher(self._namespace, EventClass)
+        typed = dict(PanelID=PanelID, DeviceID=DeviceID,
+                     SecondaryDeviceID=SecondaryDeviceID, AccessResult=AccessResult,
+                     Type=Type, SubType=SubType)
+        for name, value in typed.items():
+            if value is not None and not all(
+                    isinstance(v, int) and not isinstance(v, bool)
+                    for v in (value if isinstance(value, _WQL_VALUE_SETS) else [value])):
+                raise TypeError(f'{name} must be an int or a list of ints')
+        filters = dict(
+            {name: value for name, value in typed.items() if value is not None}, **filters
+        )
+        return HWatcher(self._namespace, EventClass, fields, filters)
 
     def software_events(self, TargetCls, operation=SWOperationEvent):
         """
-        Creates software event subscription for the given event class and operation.
+        Creates software event subscription for the given event class(es) and \
+        operation(s). One subscription can watch several classes and operations.
+
+        :Example:
 
-        :param TargetCls: {str} The software event class.
-        :param operation: {str} The operation type. __InstanceOperationEvent or child.
+        >>> people = dit.software_events(
+        ...     ['Lnl_Cardholder', 'Lnl_Visitor'], [pyog.SWCreationEvent, pyog.SWDeletionEvent]
+        ... )
+        >>> event = people()
+        >>> event['class'], event['operation']
+        ('Lnl_Visitor', '__InstanceCreationEvent')
+
+        :param TargetCls: {str|iterable{str}} The software event class(es).
+        :param operation: {str|iterable{str}} The operation type(s). \
+        __InstanceOperationEvent or child.
         :return: {SWatcher} The software event watcher.
         """
         return SWatcher(self._namespace, TargetCls, operation)
 
+    def hardware_events_async(self, EventClass=HWEvent, maxsize=1000,
+                              policy=BUFFER_DROP_OLDEST, **filters) -> AsyncWatcher:
+        """
+        Creates a hardware event subscription for asyncio. All asyncio subscriptions of \
+        a connection share one COM thread and connection, see EventHub.
+
+        :Example:
+
+        >>> async for event in dit.hardware_events_async(pyog.HWAccessEvent):
+        ...     print(event['CardNumber'])
+
+        :param EventClass: {str} The hardware event class.
+        :param maxsize: {int} Events queued for the event loop.
+        :param policy: {str} What to do when the queue is full, see AsyncWatcher.
+        :param filters: Filters and fields, see hardware_events().
+        :return: {AsyncWatcher} The asynchronous hardware event watcher.
+        """
+        return AsyncWatcher(
+            self._async_hub(), lambda dit: dit.hardware_events(EventClass, **filters),
+            maxsize, policy, EventClass
+        )
+
+    def software_events_async(self, TargetCls, operation=SWOperationEvent, maxsize=1000,
+                              policy=BUFFER_DROP_OLDEST) -> AsyncWatcher:
+        """
+        Creates a software event subscription for asyncio. See hardware_events_async().
+
+        :param TargetCls: {str|iterable{str}} The software event class(es).
+        :param operation: {str|iterable{str}} The operation type(s). \
+        __InstanceOperationEvent or child.
+        :param maxsize: {int} Events queued for the event loop.
+        :param policy: {str} What to do when the queue is full, see AsyncWatcher.
+        :return: {AsyncWatcher} The asynchronous software event watcher.
+        """
+        return AsyncWatcher(
+            self._async_hub(), lambda dit: dit.software_events(TargetCls, operation),
+            maxsize, policy, str(TargetCls)
+        )
+
+    def _async_hub(self) -> EventHub:
+        """
+        The hub shared by the asyncio subscriptions, replaced if it failed or stopped.
+
+        :return: {EventHub} The hub.
+        """
+        with self._hub_lock:
+            if self._hub is None or self._hub.stopped:
+                self._hub = self.event_hub()
+            return self._hub
+
+    def close(self):
+        """
+        Stops the thread and connection serving the asyncio subscriptions, ending their
+        iterations. The connection itself stays usable, later asyncio subscriptions
+        start a new thread.
+        """
+        with self._hub_lock:
+            hub, self._hub = self._hub, None
+        if hub is not None:
+            hub.stop()
+
+    async def aclose(self):
+        """
+        close() for use in the event loop, without blocking it.
+        """
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def hardware_events_reconnecting(self, EventClass=HWEvent, on_gap=None, **filters) \
+            -> ReconnectingWatcher:
+        """
+        Creates a hardware event subscription that is renewed on a new connection when \
+        this one is lost, reporting the outage as a Gap. See ReconnectingWatcher.
+
+        :Example:
+
+        >>> watcher = dit.hardware_events_reconnecting(pyog.HWAccessEvent, on_gap=log_gap)
+        >>> while 1:
+        ...     events = watcher.drain(500, max_wait_ms=200)
+
+        :param EventClass: {str} The hardware event class.
+        :param on_gap: {callable} Called with each Gap.
+        :param filters: Filters and fields, see hardware_events().
+        :return: {ReconnectingWatcher} The watcher.
+        """
+        return ReconnectingWatcher(
+            self, self.clone,
+            lambda dit: dit.hardware_events(EventClass, **filters), on_gap
+        )
+
+    def event_hub(self, idle_ms=50) -> EventHub:
+        """
+        Creates a hub serving many event subscriptions from one COM thread, on its own \
+        connection. See EventHub.
+
+        :param idle_ms: {int} Sleep after a poll of all subscriptions found no event.
+        :return: {EventHub} The hub, not started.
+        """
+        return EventHub(self.clone, idle_ms)
+
+    def clone(self, coinitialize=False) -> 'DITConnection':
+        """
+        Opens a new connection with the same parameters, e.g. for use in another thread.
+
+        :param coinitialize: {bool} Initializes the COM libraries for the current thread.
+        :raises ValueError: If this connection was not opened with DIT().
+        :return: {DITConnection} The new connection.
+        """
+        if self._connect_args is None:
+            raise ValueError('Connection was not opened with DIT(), cannot clone it')
+        return _connect_dit(coinitialize=coinitialize, **self._connect_args)
+
     def send_access_granted(self, panel, reader, badge_id=-1):
         """
         Access granted.
@@ -784,7 +2044,9 @@ def _connect_dit(
     except _COMI_ERROR:
         handle_error()
     else:
-        return DITConnection(conn)
+        dit = DITConnection(conn)
+        dit._connect_args = dict(server=server, username=username, password=password)
+        return dit
 
 
 DIT = _connect_dit
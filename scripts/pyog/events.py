@@ -0,0 +1,949 @@
+"""
+events.py
+
+Event delivery helpers on top of blocking watchers. A watcher is any callable taking a
+timeout in milliseconds that returns the next event or raises _wmii.x_wmi_timed_out.
+
+:Example:
+
+>>> import pyog
+>>> dit = pyog.DIT(server='ms5')
+>>> async def access():
+...     async for event in dit.hardware_events_async(pyog.HWAccessEvent):
+...         print(event['CardNumber'])
+...
+>>> asyncio.run(access())
+
+Many subscriptions can share one COM thread and connection through an EventHub:
+
+>>> hub = dit.event_hub()
+>>> access = hub.hardware_events(pyog.HWAccessEvent, callback=print)
+>>> changes = queue.Queue()
+>>> hub.software_events('Lnl_Cardholder', queue=changes)
+>>> hub.start()
+>>> hub.stats()
+{'Lnl_AccessEvent': {'events': 120, 'rate': 2.1, 'lag': 0.4, 'max_lag': 1.2, \
+'callback_errors': 0, 'error': None}, ...}
+
+An EventBuffer bounds the memory used by events waiting for a slow consumer:
+
+>>> buffer = pyog.EventBuffer(10000, policy=pyog.BUFFER_SPILL, spill_path='events.spill')
+>>> hub.hardware_events(pyog.HWAccessEvent, queue=buffer)
+>>> while 1:
+...     store(buffer.get_batch(500, timeout=1))
+"""
+
+
+from pyog import _wmii
+# noinspection PyUnresolvedReferences
+from pythoncom import CoInitialize, CoUninitialize
+from threading import Thread, Event, Lock, Condition
+from collections import deque, namedtuple, OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from queue import Empty
+from tempfile import TemporaryFile
+from os import SEEK_END
+from os.path import exists
+import json
+import struct
+from collections.abc import Mapping
+from datetime import datetime
+from time import monotonic, sleep
+from random import uniform
+import asyncio
+
+
+#: EventBuffer policy: put() waits for room.
+BUFFER_BLOCK = 'block'
+#: EventBuffer policy: put() discards the oldest event to make room.
+BUFFER_DROP_OLDEST = 'drop_oldest'
+#: EventBuffer policy: put() writes the event to a spill file, read back once there is room.
+BUFFER_SPILL = 'spill'
+_BUFFER_POLICIES = (BUFFER_BLOCK, BUFFER_DROP_OLDEST, BUFFER_SPILL)
+# Spill file record header: length of the JSON record that follows, see _spill_event().
+_SPILL_RECORD = struct.Struct('<I')
+
+
+class EventHubStopped(Exception):
+    """
+    Queued to the live subscriptions of an EventHub when it is stopped.
+    """
+
+
+def _detach(event):
+    """
+    Makes an event safe to hand to another thread, see EventRecord.detach().
+
+    :param event: The event.
+    :return: The event.
+    """
+    detach = getattr(event, 'detach', None)
+    return detach() if detach is not None else event
+
+
+def _event_data(event):
+    """
+    The value of an event stored on disk by EventJournal and EventBuffer, as JSON with \
+    default=str: values JSON cannot hold (e.g. datetime) are stored as strings.
+
+    :param event: The event.
+    :return: The event, EventRecords as plain dicts, see EventRecord.to_dict().
+    """
+    to_dict = getattr(event, 'to_dict', None)
+    return to_dict() if to_dict is not None else event
+
+
+class AsyncWatcher:
+    """
+    Delivers the events of an EventHub subscription to asyncio.
+
+    Subscriptions share the hub's COM thread and connection, so any number of them costs
+    one thread. Events are handed to the event loop through an asyncio.Queue holding at
+    most maxsize events. When it is full:
+
+    * BUFFER_DROP_OLDEST: the oldest event is discarded, counted in dropped.
+    * BUFFER_BLOCK: the hub thread waits for room, which holds up every subscription of
+      the hub. Use a hub of its own for such subscriptions.
+
+    An error ending the subscription is always queued, discarding the oldest event if
+    needed, and raised by the iteration. Stopping the hub ends the iteration.
+
+    Iterate with async for. Breaking out, cancelling the consuming task or calling
+    close() / aclose() cancels the subscription.
+
+    :param hub: {EventHub} Hub serving the subscription, started if needed.
+    :param open_watcher: {callable} Called with the hub connection to create the watcher,
+    see EventHub.subscribe().
+    :param maxsize: {int} Events queued for the event loop.
+    :param policy: {str} BUFFER_DROP_OLDEST or BUFFER_BLOCK.
+    :param name: {str} Subscription name in the hub stats.
+    """
+
+    def __init__(self, hub, open_watcher, maxsize=1000, policy=BUFFER_DROP_OLDEST,
+                 name=None):
+        if policy not in (BUFFER_BLOCK, BUFFER_DROP_OLDEST):
+            raise ValueError(f'Invalid policy: {policy}')
+        if maxsize < 1:
+            raise ValueError(f'Invalid maxsize: {maxsize}')
+        self._hub = hub
+        self._open_watcher = open_watcher
+        self.maxsize = maxsize
+        self.policy = policy
+        self.name = name
+        self.dropped = 0
+        self._subscription = None
+        self._loop = None
+        self._queue = None
+
+    def start(self):
+        """
+        Subscribes and starts the hub. Called by the first iteration if not called before.
+        Must be called from the event loop.
+        """
+        if self._subscription is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.maxsize)
+        self._subscription = self._hub.subscribe(self._open_watcher, queue=self,
+                                                 name=self.name)
+        self._hub.start()
+
+    def put(self, item):
+        """
+        Hands an item to the event loop. Called by the hub thread.
+
+        :param item: An event, or the exception ending the subscription.
+        """
+        try:
+            if self.policy == BUFFER_BLOCK and not isinstance(item, BaseException):
+                future = asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop)
+                while True:
+                    try:
+                        return future.result(0.1)
+                    except FutureTimeoutError:
+                        if self._subscription.cancelled or self._hub.stopped:
+                            # Nobody will make room.
+                            future.cancel()
+                            return
+            self._loop.call_soon_threadsafe(self._put_nowait, item)
+        except RuntimeError:  # Loop closed, nobody is listening.
+            self.close()
+
+    def _put_nowait(self, item):
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(item)
+
+    def __aiter__(self):
+        return self._events()
+
+    async def _events(self):
+        self.start()
+        try:
+            while True:
+                item = await self._queue.get()
+                if isinstance(item, EventHubStopped):
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Cancels the subscription. The hub drops it on its next pass.
+        """
+        if self._subscription is not None:
+            self._subscription.cancel()
+
+    async def aclose(self):
+        """
+        Cancels the subscription.
+        """
+        self.close()
+
+    @property
+    def running(self) -> bool:
+        """
+        :return: {bool} Whether the subscription is live and its hub running.
+        """
+        return self._subscription is not None and not self._subscription.cancelled and \
+            self._subscription.error is None and self._hub.running
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+
+class Subscription:
+    """
+    An EventHub subscription. Events go to callback, queue or both.
+
+    :param open_watcher: {callable} Called with the hub connection to create the watcher.
+    :param callback: {callable} Called with each event in the hub thread.
+    :param queue: Object with put(), e.g. queue.Queue, receiving each event. Receives the
+    error instead if the subscription fails.
+    :param name: {str} Name in stats.
+    :param window: {int} Seconds over which rate is averaged.
+    """
+
+    def __init__(self, open_watcher, callback=None, queue=None, name=None, window=10):
+        self._open_watcher = open_watcher
+        self.callback = callback
+        self.queue = queue
+        self.name = name
+        self.window = window
+        self.watcher = None
+        self.events = 0
+        self.callback_errors = 0
+        self.lag = None  # Seconds between event creation and delivery, last event.
+        self.max_lag = None
+        self.error = None  # Set when the subscription fails and is dropped.
+        self.cancelled = False
+        self._seconds = deque()  # [second, events] pairs within window.
+
+    def _deliver(self, event):
+        """
+        Hands an event to the callback and queue and updates counters.
+
+        :param event: {dict} The event.
+        """
+        self.events += 1
+        now = int(monotonic())
+        if self._seconds and self._seconds[-1][0] == now:
+            self._seconds[-1][1] += 1
+        else:
+            self._seconds.append([now, 1])
+            while self._seconds[0][0] <= now - self.window:
+                self._seconds.popleft()
+        created = event.get('TIME_CREATED') if isinstance(event, Mapping) else None
+        if created is not None:
+            self.lag = (datetime.utcnow() - _wmii.from_1601(created)).total_seconds()
+            self.max_lag = self.lag if self.max_lag is None else max(self.max_lag, self.lag)
+        if self.queue is not None:
+            self.queue.put(_detach(event))
+        if self.callback is not None:
+            try:
+                self.callback(event)
+            except Exception:
+                self.callback_errors += 1
+
+    @property
+    def rate(self) -> float:
+        """
+        :return: {float} Events per second over the last window seconds.
+        """
+        now = int(monotonic())
+        return sum(n for second, n in list(self._seconds) if second > now - self.window) \
+            / self.window
+
+    def stats(self) -> dict:
+        """
+        :return: {dict} Delivered events, rate, lag, max_lag (seconds, from the events' \
+        TIME_CREATED, so subject to clock skew with the server; for software events that \
+        of the operation event, see SWatcher), callback_errors and error.
+        """
+        return {
+            'events': self.events, 'rate': self.rate, 'lag': self.lag,
+            'max_lag': self.max_lag, 'callback_errors': self.callback_errors,
+            'error': self.error
+        }
+
+    def cancel(self):
+        """
+        Ends the subscription. The hub drops it on its next pass.
+        """
+        self.cancelled = True
+
+
+class EventHub:
+    """
+    Serves many event subscriptions from one COM thread and connection.
+
+    The thread polls the watchers round-robin with NextEvent(0), taking at most one event
+    from each per pass so that a busy subscription does not starve the others, and
+    sleeps idle_ms after a pass that found nothing.
+
+    Subscriptions can be added and cancelled from any thread, also while running. When
+    the hub stops, EventHubStopped is queued to the subscriptions still live.
+
+    :param connect: {callable} Called in the hub thread to open its connection, e.g.
+    DITConnection.clone.
+    :param idle_ms: {int} Sleep after an empty pass, bounds delivery latency.
+    """
+
+    def __init__(self, connect, idle_ms=50):
+        self._connect = connect
+        self.idle_ms = idle_ms
+        self._lock = Lock()
+        self._pending = []  # Subscriptions to open in the hub thread.
+        self._subscriptions = []
+        self._stop = Event()
+        self._thread = None
+        self.error = None  # Set if the connection could not be opened or the loop died.
+
+    def subscribe(self, open_watcher, callback=None, queue=None, name=None) -> Subscription:
+        """
+        Adds a subscription.
+
+        :param open_watcher: {callable} Called with the hub connection to create the \
+        watcher, e.g. lambda dit: dit.hardware_events('Lnl_AccessEvent').
+        :param callback: {callable} Called with each event in the hub thread. Keep it short.
+        :param queue: Object with put() receiving each event.
+        :param name: {str} Name in stats, made unique with a "#n" suffix if taken.
+        :raises RuntimeError: If the hub was stopped, unless it failed.
+        :return: {Subscription} The subscription. Fails at once if the hub has failed.
+        """
+        with self._lock:
+            if self._stop.is_set() and self.error is None:
+                raise RuntimeError('EventHub is stopped')
+            taken = {s.name for s in self._subscriptions + self._pending}
+            name = unique = name or 'subscription'
+            n = 1
+            while unique in taken:
+                n += 1
+                unique = f'{name} #{n}'
+            subscription = Subscription(open_watcher, callback, queue, unique)
+            if self.error is None:
+                self._pending.append(subscription)
+        if self.error is not None:
+            EventHub._fail(subscription, self.error)
+        return subscription
+
+    def hardware_events(self, *args, callback=None, queue=None, name=None, **filters) \
+            -> Subscription:
+        """
+        Subscribes to hardware events. See DITConnection.hardware_events().
+
+        :param args: Passed to hardware_events().
+        :param callback: {callable} Called with each event in the hub thread.
+        :param queue: Object with put() receiving each event.
+        :param name: {str} Name in stats. Defaults to the event class.
+        :param filters: Filters and fields, passed to hardware_events().
+        :return: {Subscription} The subscription.
+        """
+        return self.subscribe(lambda dit: dit.hardware_events(*args, **filters), callback,
+                              queue, name or (args[0] if args else 'hardware_events'))
+
+    def software_events(self, *args, callback=None, queue=None, name=None) \
+            -> Subscription:
+        """
+        Subscribes to software events. See DITConnection.software_events().
+
+        :param args: Passed to software_events().
+        :param callback: {callable} Called with each event in the hub thread.
+        :param queue: Object with put() receiving each event.
+        :param name: {str} Name in stats. Defaults to the arguments.
+        :return: {Subscription} The subscription.
+        """
+        return self.subscribe(lambda dit: dit.software_events(*args), callback, queue,
+                              name or ' '.join(map(str, args)))
+
+    def start(self):
+        """
+        Starts the hub thread.
+        """
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='EventHub', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        CoInitialize()
+        connection = None
+        try:
+            connection = self._connect()
+            while not self._stop.is_set():
+                self._update(connection)
+                delivered = False
+                for subscription in self._subscriptions:
+                    try:
+                        event = subscription.watcher(0)
+                    except _wmii.x_wmi_timed_out:
+                        continue
+                    except Exception as e:
+                        self._fail(subscription, e)
+                        continue
+                    subscription._deliver(event)
+                    delivered = True
+                if not delivered:
+                    self._stop.wait(self.idle_ms / 1000)
+        except Exception as e:
+            with self._lock:
+                self.error = e
+                pending, self._pending = self._pending, []
+            # Subscribers waiting on their queues would otherwise wait forever.
+            for subscription in self._subscriptions + pending:
+                self._fail(subscription, e)
+        finally:
+            with self._lock:
+                self._stop.set()
+                pending, self._pending = self._pending, []
+            stopped = EventHubStopped()
+            for subscription in self._subscriptions + pending:
+                if not subscription.cancelled and subscription.error is None:
+                    self._fail(subscription, stopped)
+                subscription.watcher = None
+            connection = None  # Release COM objects before uninitializing.
+            CoUninitialize()
+
+    def _update(self, connection):
+        """
+        Opens pending subscriptions and drops cancelled or failed ones.
+
+        :param connection: The hub connection.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for subscription in pending:
+            try:
+                subscription.watcher = subscription._open_watcher(connection)
+            except Exception as e:
+                self._fail(subscription, e)
+            else:
+                self._subscriptions.append(subscription)
+        self._subscriptions = [s for s in self._subscriptions
+                               if not s.cancelled and s.error is None]
+
+    @staticmethod
+    def _fail(subscription, error):
+        """
+        Marks a subscription failed. It is dropped on the next pass.
+
+        :param subscription: {Subscription} The subscription.
+        :param error: {Exception} The error.
+        """
+        subscription.error = error
+        subscription.watcher = None
+        if subscription.queue is not None:
+            subscription.queue.put(error)
+
+    def stats(self) -> dict:
+        """
+        :return: {dict{str: dict}} Subscription.stats() by subscription name. Names are \
+        unique, see subscribe().
+        """
+        with self._lock:
+            subscriptions = self._subscriptions + self._pending
+        return {s.name: s.stats() for s in subscriptions}
+
+    def stop(self, wait=True):
+        """
+        Stops the hub thread. Live subscriptions get EventHubStopped, and the hub takes
+        no new ones.
+
+        :param wait: {bool} Wait for the thread to end.
+        """
+        pending = []
+        with self._lock:
+            self._stop.set()
+            if self._thread is None:  # Never started, no thread to end the subscriptions.
+                pending, self._pending = self._pending, []
+        for subscription in pending:
+            self._fail(subscription, EventHubStopped())
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    @property
+    def stopped(self) -> bool:
+        """
+        :return: {bool} Whether stop() was called or the hub thread ended.
+        """
+        return self._stop.is_set()
+
+    @property
+    def running(self) -> bool:
+        """
+        :return: {bool} Whether the hub thread is alive.
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+class EventBuffer:
+    """
+    Bounded FIFO of events between a watcher and its consumers. Thread safe, and usable
+    as an EventHub subscription queue.
+
+    When maxsize events are held in memory, put() applies the policy:
+
+    * BUFFER_BLOCK: waits for room, up to timeout. Slows down the producer.
+    * BUFFER_DROP_OLDEST: discards the oldest event, counted in dropped.
+    * BUFFER_SPILL: appends the event to the spill file. Spilled events are read back in
+      order once the memory part is consumed, so order is kept. Events are stored as
+      JSON, as by EventJournal: EventRecords come back as records of the same event
+      class, but with embedded objects as dicts, and values JSON cannot hold (e.g.
+      datetime) come back as strings.
+
+    A named spill file outlives the buffer: events still spilled when it is closed, or
+    when the process dies, are read back by the next buffer opening the file. After a
+    crash, events already read back from it may be delivered again.
+
+    :param maxsize: {int} Events held in memory.
+    :param policy: {str} BUFFER_BLOCK, BUFFER_DROP_OLDEST or BUFFER_SPILL.
+    :param spill_path: {str} Spill file, its events are read back first. A temporary
+    file if None.
+    """
+
+    def __init__(self, maxsize=10000, policy=BUFFER_BLOCK, spill_path=None):
+        if policy not in _BUFFER_POLICIES:
+            raise ValueError(f'Unknown buffer policy "{policy}"')
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        self.maxsize = maxsize
+        self.policy = policy
+        self._events = deque()
+        self._lock = Lock()
+        self._not_empty = Condition(self._lock)
+        self._not_full = Condition(self._lock)
+        self._spill_path = spill_path
+        self._spill = None  # Opened on first spill, or to read back an existing file.
+        self._spill_read = 0  # Offset of the next spilled event to read back.
+        self.spilled = 0  # Events in the spill file not read back yet.
+        self.closed = False
+        self.dropped = 0
+        self.rejected = 0  # put() timed out waiting for room, or the buffer was closed.
+        self.put_count = 0
+        self.get_count = 0
+        self.max_depth = 0
+        if policy == BUFFER_SPILL and spill_path and exists(spill_path):
+            self._recover_spill()
+
+    def put(self, event, block=True, timeout=None) -> bool:
+        """
+        Adds an event, applying the policy if the buffer is full.
+
+        :param event: The event. EventRecords are detached.
+        :param block: {bool} With BUFFER_BLOCK, whether to wait for room.
+        :param timeout: {float} With BUFFER_BLOCK, seconds to wait for room.
+        :return: {bool} False if the event was rejected because the buffer stayed full or \
+        is closed.
+        """
+        event = _detach(event)
+        with self._lock:
+            if self.closed:
+                self.rejected += 1
+                return False
+            if self.spilled or len(self._events) >= self.maxsize:
+                if self.policy == BUFFER_SPILL:
+                    self._spill_event(event)
+                    self.put_count += 1
+                    self.max_depth = max(self.max_depth, len(self._events) + self.spilled)
+                    self._not_empty.notify()
+                    return True
+                if self.policy == BUFFER_DROP_OLDEST:
+                    self._events.popleft()
+                    self.dropped += 1
+                elif not block or not self._not_full.wait_for(self._room, timeout) or \
+                        self.closed:
+                    self.rejected += 1
+                    return False
+            self._events.append(event)
+            self.put_count += 1
+            self.max_depth = max(self.max_depth, len(self._events) + self.spilled)
+            self._not_empty.notify()
+            return True
+
+    def get(self, block=True, timeout=None):
+        """
+        Removes the oldest event.
+
+        :param block: {bool} Whether to wait for an event.
+        :param timeout: {float} Seconds to wait.
+        :raises queue.Empty: If no event is available, also as soon as the buffer is \
+        closed and empty.
+        :return: The event.
+        """
+        with self._lock:
+            if not self._wait(block, timeout):
+                raise Empty
+            return self._pop()
+
+    def get_batch(self, max_events=1000, timeout=None) -> list:
+        """
+        Removes up to max_events events, waiting up to timeout for the first one.
+
+        :param max_events: {int} Maximum number of events.
+        :param timeout: {float} Seconds to wait for an event, forever if None.
+        :return: {list} The events, oldest first. Empty if none arrived in time or the \
+        buffer is closed and empty.
+        """
+        with self._lock:
+            if not self._wait(True, timeout):
+                return []
+            events = []
+            while len(events) < max_events and (self._events or self.spilled):
+                events.append(self._pop())
+            return events
+
+    def _available(self) -> bool:
+        return bool(self._events or self.spilled)
+
+    def _room(self) -> bool:
+        return self.closed or len(self._events) < self.maxsize
+
+    def _wait(self, block, timeout) -> bool:
+        if block and not self._available() and not self.closed:
+            self._not_empty.wait_for(lambda: self.closed or self._available(), timeout)
+        return self._available()
+
+    def _pop(self):
+        if not self._events:
+            self._read_spill()
+        event = self._events.popleft()
+        self.get_count += 1
+        self._not_full.notify()
+        return event
+
+    def _open_spill(self):
+        """
+        :return: {file} The spill file, opened without truncating it.
+        """
+        if not self._spill_path:
+            return TemporaryFile()
+        try:
+            return open(self._spill_path, 'r+b')
+        except FileNotFoundError:
+            return open(self._spill_path, 'w+b')
+
+    def _recover_spill(self):
+        """
+        Opens an existing spill file to read its events back, dropping a record torn by
+        a crash.
+        """
+        self._spill = spill = self._open_spill()
+        size = spill.seek(0, SEEK_END)
+        offset = 0
+        while offset + _SPILL_RECORD.size <= size:
+            spill.seek(offset)
+            length, = _SPILL_RECORD.unpack(spill.read(_SPILL_RECORD.size))
+            if offset + _SPILL_RECORD.size + length > size:
+                break
+            offset += _SPILL_RECORD.size + length
+            self.spilled += 1
+        spill.truncate(offset)
+
+    def _spill_event(self, event):
+        """
+        Appends an event to the spill file: its length, then the JSON record \
+        [event class or null, event].
+
+        :param event: The event.
+        """
+        if self._spill is None:
+            self._spill = self._open_spill()
+        data = json.dumps([getattr(event, 'event_class', None), _event_data(event)],
+                          default=str).encode()
+        self._spill.seek(0, SEEK_END)
+        self._spill.write(_SPILL_RECORD.pack(len(data)) + data)
+        self.spilled += 1
+
+    def _read_spill(self):
+        """
+        Reads spilled events back into memory, up to maxsize.
+        """
+        self._spill.seek(self._spill_read)
+        while self.spilled and len(self._events) < self.maxsize:
+            length, = _SPILL_RECORD.unpack(self._spill.read(_SPILL_RECORD.size))
+            event_class, event = json.loads(self._spill.read(length))
+            if event_class is not None:
+                # Imported here as pyog.dit imports this module.
+                from pyog.dit import _rebuild_record
+                event = _rebuild_record(event_class, tuple(event), tuple(event.values()))
+            self._events.append(event)
+            self.spilled -= 1
+        self._spill_read = self._spill.tell()
+        if not self.spilled:  # All read back, start over.
+            self._spill.seek(0)
+            self._spill.truncate()
+            self._spill_read = 0
+
+    def qsize(self) -> int:
+        """
+        :return: {int} Events held, in memory and spilled.
+        """
+        return len(self._events) + self.spilled
+
+    def stats(self) -> dict:
+        """
+        :return: {dict} depth (in memory), spilled, dropped, rejected, put, got and \
+        max_depth.
+        """
+        with self._lock:
+            return {
+                'depth': len(self._events), 'spilled': self.spilled,
+                'dropped': self.dropped, 'rejected': self.rejected,
+                'put': self.put_count, 'got': self.get_count, 'max_depth': self.max_depth
+            }
+
+    def close(self):
+        """
+        Closes the spill file and rejects further events. Events in memory can still be
+        got. Spilled events not read back stay in a named spill file, a temporary one
+        loses them. Blocked put() and get() calls return.
+        """
+        with self._lock:
+            self.closed = True
+            self._not_full.notify_all()
+            self._not_empty.notify_all()
+            if self._spill is not None:
+                if self._spill_read and self.spilled:
+                    self._compact_spill()
+                self._spill.close()
+                self._spill = None
+                self.spilled = 0
+
+    def _compact_spill(self):
+        """
+        Moves the events not read back to the start of the spill file, so that the next
+        buffer opening it does not deliver the others again.
+        """
+        read, write = self._spill_read, 0
+        while True:
+            self._spill.seek(read)
+            chunk = self._spill.read(2 ** 20)
+            if not chunk:
+                break
+            self._spill.seek(write)
+            self._spill.write(chunk)
+            read += len(chunk)
+            write += len(chunk)
+        self._spill.truncate(write)
+        self._spill_read = 0
+
+
+#: Possible event loss while a ReconnectingWatcher was disconnected. last_time and
+#: first_time are the TIME_CREATED (datetime, UTC) of the last event before and first
+#: event after, last_serial and first_serial their SerialNumber, reconnect the seconds
+#: taken to subscribe again and catch_up the seconds from losing the connection to the
+#: first event after.
+Gap = namedtuple('Gap', 'last_time first_time last_serial first_serial reconnect catch_up')
+
+
+class ReconnectingWatcher:
+    """
+    Watcher that resubscribes on a new connection when the connection is lost.
+
+    Keeps high-water marks of the events' TIME_CREATED and SerialNumber. After
+    reconnecting, the outage is reported as a Gap once the first event arrives, and
+    events delivered again (same SerialNumber and TIME_CREATED as a recent event) are
+    dropped. Reconnection is retried with exponential backoff starting at backoff
+    seconds, within the timeout of the call: a call that times out while reconnecting
+    raises _wmii.x_wmi_timed_out and the next call resumes reconnecting.
+
+    Use in the thread that creates it, like any watcher.
+
+    :param connection: The connection for the first subscription, e.g. a DITConnection.
+    :param connect: {callable} Opens a new connection, e.g. DITConnection.clone.
+    :param open_watcher: {callable} Called with a connection to create the watcher.
+    :param on_gap: {callable} Called with each Gap.
+    :param backoff: {float} First retry delay in seconds.
+    :param max_backoff: {float} Maximum retry delay in seconds.
+    :param dedupe: {int} Recent events remembered to drop duplicates.
+    :param max_gaps: {int} Recent gaps kept in gaps. Use on_gap to keep them all.
+    """
+
+    def __init__(self, connection, connect, open_watcher, on_gap=None, backoff=0.05,
+                 max_backoff=30.0, dedupe=10000, max_gaps=100):
+        self._connect = connect
+        self._open_watcher = open_watcher
+        self.on_gap = on_gap
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._recent = OrderedDict()
+        self._dedupe = dedupe
+        self.last_time = None
+        self.last_serial = None
+        self.gaps = deque(maxlen=max_gaps)  # The most recent Gaps.
+        self._gap_count = 0
+        self.reconnects = 0
+        self.duplicates = 0
+        self._lost_at = None  # monotonic() when the connection was lost.
+        self._reconnect = None  # Seconds taken by the last reconnection.
+        self._delay = backoff  # Next retry delay while reconnecting.
+        self._retry_at = 0  # monotonic() of the next reconnection attempt.
+        self._stages = []  # Added to each watcher, see add_stage().
+        self._connection = connection
+        self._watcher = open_watcher(connection)
+
+    def __call__(self, timeout_ms=-1):
+        """
+        Waits for the next event, reconnecting if needed.
+
+        :param timeout_ms: {int} Milliseconds to wait, infinite if negative.
+        :raises _wmii.x_wmi_timed_out: If no event arrived in time.
+        :return: The event.
+        """
+        deadline = None if timeout_ms < 0 else monotonic() + timeout_ms / 1000
+        while True:
+            remaining = -1 if deadline is None \
+                else max(0, int((deadline - monotonic()) * 1000))
+            event = self._next(lambda watcher: watcher(remaining), deadline)
+            if event is not None and self._accept(event):
+                return event
+
+    def drain(self, max_events=100, max_wait_ms=0) -> list:
+        """
+        Delivers waiting events as one list, reconnecting if needed. See \
+        HWatcher.drain().
+
+        :param max_events: {int} Maximum number of events to return.
+        :param max_wait_ms: {int} Milliseconds to wait for more events.
+        :return: {list} The events, empty if still reconnecting at max_wait_ms.
+        """
+        try:
+            events = self._next(lambda watcher: watcher.drain(max_events, max_wait_ms),
+                                monotonic() + max_wait_ms / 1000)
+        except _wmii.x_wmi_timed_out:
+            return []
+        return [event for event in events or () if self._accept(event)]
+
+    def add_stage(self, stage) -> 'ReconnectingWatcher':
+        """
+        Adds a processing stage to the watcher and to each watcher opened on reconnect.
+        See HWatcher.add_stage().
+
+        :param stage: {callable} Called with the event, returns the event to deliver.
+        :return: {ReconnectingWatcher} The watcher.
+        """
+        self._stages.append(stage)
+        if self._watcher is not None:
+            self._watcher.add_stage(stage)
+        return self
+
+    def _next(self, receive, deadline=None):
+        """
+        Receives from the watcher, reconnecting when the connection is lost.
+
+        :param receive: {callable} Called with the watcher.
+        :param deadline: {float} monotonic() at which to give up reconnecting, never if
+        None.
+        :raises _wmii.x_wmi_timed_out: If still reconnecting at the deadline.
+        :return: What receive returns, None if the connection was lost and restored.
+        """
+        if self._watcher is not None:
+            try:
+                return receive(self._watcher)
+            except _wmii.x_wmi_timed_out:
+                raise
+            except Exception as e:
+                if not getattr(e, 'disconnected', False):
+                    raise
+            self._lost_at = monotonic()
+            self._connection = self._watcher = None  # Release the broken COM objects.
+            self._delay, self._retry_at = self.backoff, 0
+        while self._watcher is None:
+            wait = self._retry_at - monotonic()
+            if wait > 0:
+                if deadline is not None and deadline < self._retry_at:
+                    sleep(max(0, deadline - monotonic()))
+                    raise _wmii.x_wmi_timed_out()
+                sleep(wait)
+            try:
+                self._connection = self._connect()
+                watcher = self._open_watcher(self._connection)
+                for stage in self._stages:
+                    watcher.add_stage(stage)
+                self._watcher = watcher
+            except Exception as e:
+                if not getattr(e, 'disconnected', False):
+                    raise
+                self._connection = None
+                self._retry_at = monotonic() + uniform(self._delay / 2, self._delay)
+                self._delay = min(self._delay * 2, self.max_backoff)
+        self.reconnects += 1
+        self._reconnect = monotonic() - self._lost_at
+        return None
+
+    def _accept(self, event) -> bool:
+        """
+        Updates the high-water marks, reports a pending gap and filters duplicates.
+
+        :param event: The event.
+        :return: {bool} False if the event was already delivered.
+        """
+        get = getattr(event, 'get', None)
+        created = get('TIME_CREATED') if get is not None else None
+        serial = get('SerialNumber') if get is not None else None
+        if created is not None:
+            key = serial, created
+            if key in self._recent:
+                self.duplicates += 1
+                return False
+            self._recent[key] = None
+            if len(self._recent) > self._dedupe:
+                self._recent.popitem(last=False)
+            created = _wmii.from_1601(created)
+        if self._lost_at is not None:
+            gap = Gap(self.last_time, created, self.last_serial, serial, self._reconnect,
+                      monotonic() - self._lost_at)
+            self._lost_at = None
+            self.gaps.append(gap)
+            self._gap_count += 1
+            if self.on_gap is not None:
+                self.on_gap(gap)
+        if created is not None and (self.last_time is None or created > self.last_time):
+            self.last_time = created
+        if serial is not None:
+            self.last_serial = serial
+        return True
+
+    def stats(self) -> dict:
+        """
+        :return: {dict} reconnects, gaps, duplicates, last_time and last_serial.
+        """
+        return {
+            'reconnects': self.reconnects, 'gaps': self._gap_count,
+            'duplicates': self.duplicates, 'last_time': self.last_time,
+            'last_serial': self.last_serial
+        }
@@ -0,0 +1,402 @@
+"""
+journal.py
+
+Append-only on-disk journal of events, for forensics and for replaying events into
+consumers after an outage.
+
+Events are appended from any thread without waiting for the disk: a writer thread
+serializes them to length-prefixed records in segment files, rotated by size and
+optionally zlib compressed. Each segment has a sparse index of serial numbers, times and
+offsets for seeking. Segments are read back through mmap.
+
+:Example:
+
+>>> import pyog
+>>> journal = pyog.EventJournal('journal')
+>>> hub = dit.event_hub()
+>>> hub.hardware_events(pyog.HWEvent, callback=journal.append)
+>>> hub.start()
+...
+>>> for entry in journal.replay(start_time=time.time() - 3600):
+...     print(entry.seq, entry.time, entry.event['Description'])
+...
+>>> journal.close()
+"""
+
+
+from pyog.events import _detach, _event_data
+from collections import namedtuple
+from threading import Thread, Lock, Condition
+from queue import SimpleQueue
+from bisect import bisect_right
+from time import time
+import json
+import mmap
+import os
+import struct
+import zlib
+
+
+#: A journaled event: serial number, append time (seconds since epoch) and event.
+JournalEntry = namedtuple('JournalEntry', 'seq time event')
+
+# Record header: data length, flags, serial number, append time. Followed by data.
+_RECORD = struct.Struct('<IBQd')
+# Index entry: serial number, append time, record offset in the segment.
+_INDEX = struct.Struct('<QdQ')
+_ZLIB = 0x1  # Record flag, data is zlib compressed.
+_SEGMENT_EXT = '.seg'
+_INDEX_EXT = '.idx'
+
+
+def _records(buffer, offset=0):
+    """
+    Iterates the complete records in a segment buffer.
+
+    :param buffer: {memoryview|bytes} Segment contents.
+    :param offset: {int} Offset of the first record.
+    :return: {iterator{tuple}} (offset, flags, seq, time, data memoryview) per record.
+    """
+    view = memoryview(buffer)
+    try:
+        size = len(view)
+        while offset + _RECORD.size <= size:
+            length, flags, seq, when = _RECORD.unpack_from(view, offset)
+            start = offset + _RECORD.size
+            if start + length > size:
+                break  # Torn record at the end of the segment.
+            yield offset, flags, seq, when, view[start:start + length]
+            offset = start + length
+    finally:
+        view.release()
+
+
+def _decode(flags, data):
+    """
+    Decodes record data.
+
+    :param flags: {int} Record flags.
+    :param data: {memoryview} Record data.
+    :return: The event.
+    """
+    if flags & _ZLIB:
+        data = zlib.decompress(data)
+    return json.loads(bytes(data))
+
+
+class _Segment:
+    """
+    A segment file and its sparse index.
+
+    :param path: {str} Segment file path.
+    :param first_seq: {int} Serial number of the first record.
+    """
+
+    def __init__(self, path, first_seq):
+        self.path = path
+        self.first_seq = first_seq
+        self.first_time = None  # Read from the first record.
+
+    @property
+    def index_path(self) -> str:
+        """
+        :return: {str} Index file path, next to the segment.
+        """
+        return self.path[:-len(_SEGMENT_EXT)] + _INDEX_EXT
+
+    def index(self) -> list:
+        """
+        :return: {list{tuple}} (seq, time, offset) index entries, by serial number.
+        """
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        size = os.path.getsize(self.path)
+        return [entry for entry in (
+            _INDEX.unpack_from(data, offset)
+            for offset in range(0, len(data) - _INDEX.size + 1, _INDEX.size)
+        ) if entry[2] < size]
+
+
+class EventJournal:
+    """
+    Append-only journal of events in a directory of segment files.
+
+    append() only queues the event, a writer thread writes it. flush() waits until every
+    appended event is written (and fsynced with fsync=True). Events still queued when
+    the process dies are lost, so flush() at points that must be durable. If writing
+    fails the error is raised by the next append() or flush().
+
+    Events are stored as JSON: EventRecords as to_dict(), values JSON cannot hold as
+    strings. Replayed events are plain dicts.
+
+    :param directory: {str} Journal directory, created if needed. An existing journal is
+    continued, dropping a record torn by a crash.
+    :param segment_size: {int} Bytes after which a new segment is started.
+    :param compress: {bool} zlib compress each record.
+    :param index_interval: {int} Records between index entries.
+    :param fsync: {bool} fsync after each write batch.
+    """
+
+    def __init__(self, directory, segment_size=64 * 2 ** 20, compress=False,
+                 index_interval=256, fsync=False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.compress = compress
+        self.index_interval = index_interval
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._segments = self._load_segments()
+        self._next_seq = self._recover()
+        self._lock = Lock()  # Serial numbers.
+        self._written = Condition()
+        self._queue = SimpleQueue()
+        self.appended = 0
+        self.written = 0
+        self.error = None
+        self.closed = False
+        self._file = self._index_file = None
+        self._writer = Thread(target=self._write_loop, name='EventJournal', daemon=True)
+        self._writer.start()
+
+    def _load_segments(self) -> list:
+        """
+        :return: {list{_Segment}} Existing segments, by serial number.
+        """
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.endswith(_SEGMENT_EXT) and name[:-len(_SEGMENT_EXT)].isdigit():
+                segments.append(_Segment(os.path.join(self.directory, name),
+                                         int(name[:-len(_SEGMENT_EXT)])))
+        segments.sort(key=lambda segment: segment.first_seq)
+        for segment in segments:
+            with open(segment.path, 'rb') as f:
+                header = f.read(_RECORD.size)
+            if len(header) == _RECORD.size:
+                segment.first_time = _RECORD.unpack(header)[3]
+        return segments
+
+    def _recover(self) -> int:
+        """
+        Truncates a torn record at the end of the last segment.
+
+        :return: {int} Serial number for the next event.
+        """
+        if not self._segments:
+            return 1
+        last = self._segments[-1]
+        with open(last.path, 'rb') as f:
+            data = f.read()
+        end, next_seq = 0, last.first_seq
+        for offset, _, seq, _, record in _records(data):
+            end, next_seq = offset + _RECORD.size + len(record), seq + 1
+        if end < len(data):
+            with open(last.path, 'r+b') as f:
+                f.truncate(end)
+        return next_seq
+
+    def append(self, event) -> int:
+        """
+        Queues an event for writing. Does not wait for the disk.
+
+        :param event: The event. EventRecords are detached.
+        :raises Exception: The error that stopped the writer, if any.
+        :raises ValueError: If the journal is closed.
+        :return: {int} The event serial number.
+        """
+        if self.error is not None:
+            raise self.error
+        event = _detach(event)
+        with self._lock:
+            if self.closed:
+                raise ValueError('EventJournal is closed')
+            seq = self._next_seq
+            self._next_seq += 1
+            self.appended += 1
+            # Queued under the lock so that events are written in serial number order.
+            self._queue.put((seq, time(), event))
+        return seq
+
+    #: Queue interface, e.g. for EventHub subscriptions.
+    put = append
+
+    def _write_loop(self):
+        while True:
+            items = [self._queue.get()]
+            while not self._queue.empty() and len(items) < 1000:
+                items.append(self._queue.get())
+            stop = None in items
+            if stop:
+                del items[items.index(None):]
+            try:
+                if items:
+                    self._write(items)
+            except Exception as e:
+                self.error = e
+                stop = True
+            with self._written:
+                self.written += len(items)
+                self._written.notify_all()
+            if stop:
+                break
+        for f in (self._file, self._index_file):
+            if f is not None:
+                f.close()
+
+    def _write(self, items):
+        """
+        Writes events to the current segment, rotating it when full.
+
+        :param items: {list{tuple}} (seq, time, event) per event.
+        """
+        for seq, when, event in items:
+            if self._file is None or self._file.tell() >= self.segment_size:
+                self._rotate(seq, when)
+            data = json.dumps(_event_data(event), default=str).encode()
+            flags = 0
+            if self.compress:
+                data = zlib.compress(data)
+                flags |= _ZLIB
+            offset = self._file.tell()
+            if offset == 0 or (seq - self._segments[-1].first_seq) % \
+                    self.index_interval == 0:
+                self._index_file.write(_INDEX.pack(seq, when, offset))
+            self._file.write(_RECORD.pack(len(data), flags, seq, when) + data)
+        self._file.flush()
+        self._index_file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+            os.fsync(self._index_file.fileno())
+
+    def _rotate(self, seq, when):
+        """
+        Continues the last segment if there is room, otherwise starts a new one.
+
+        :param seq: {int} Serial number of the next record.
+        :param when: {float} Time of the next record.
+        """
+        if self._file is None and self._segments and \
+                os.path.getsize(self._segments[-1].path) < self.segment_size:
+            segment = self._segments[-1]
+        else:
+            if self._file is not None:
+                self._file.close()
+                self._index_file.close()
+            segment = _Segment(os.path.join(self.directory, f'{seq:020d}{_SEGMENT_EXT}'),
+                               seq)
+            self._segments.append(segment)
+        if segment.first_time is None:
+            segment.first_time = when
+        self._file = open(segment.path, 'ab')
+        self._index_file = open(segment.index_path, 'ab')
+
+    def flush(self, timeout=None) -> bool:
+        """
+        Waits until all events appended so far are written.
+
+        :param timeout: {float} Seconds to wait, forever if None.
+        :raises Exception: The error that stopped the writer, if any.
+        :return: {bool} False if timed out.
+        """
+        target = self.appended
+        with self._written:
+            done = self._written.wait_for(
+                lambda: self.written >= target or self.error is not None, timeout
+            )
+        if self.error is not None:
+            raise self.error
+        return done
+
+    def replay(self, start_seq=None, start_time=None, raw=False):
+        """
+        Iterates journaled events in order, reading segments through mmap. Flushes first.
+
+        :param start_seq: {int} First serial number to deliver.
+        :param start_time: {float} Deliver events appended at or after this time.
+        :param raw: {bool} Deliver record data as memoryviews into the mapped segment
+        (zero-copy, valid until the next event; compressed if compress was set) instead
+        of decoded events.
+        :return: {iterator{JournalEntry}} The events.
+        """
+        if self.error is None:
+            self.flush()
+        segments = [segment for segment in self._segments if segment.first_time is not None]
+        first = 0
+        if start_seq is not None:
+            first = max(0, bisect_right([s.first_seq for s in segments], start_seq) - 1)
+        elif start_time is not None:
+            first = max(0, bisect_right([s.first_time for s in segments], start_time) - 1)
+        for segment in segments[first:]:
+            offset = 0
+            if start_seq is not None or start_time is not None:
+                # Last index entry before the start, records are scanned from there.
+                column, start = (0, start_seq) if start_seq is not None \
+                    else (1, start_time)
+                for entry in segment.index():
+                    if entry[column] > start:
+                        break
+                    offset = entry[2]
+            yield from self._replay_segment(segment, offset, start_seq, start_time, raw)
+
+    @staticmethod
+    def _replay_segment(segment, offset, start_seq, start_time, raw):
+        with open(segment.path, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        records = _records(mapped, offset)
+        try:
+            for _, flags, seq, when, data in records:
+                if start_seq is not None and seq < start_seq or \
+                        start_time is not None and when < start_time:
+                    data.release()
+                    continue
+                if raw:
+                    yield JournalEntry(seq, when, data)
+                else:
+                    event = _decode(flags, data)
+                    data.release()
+                    yield JournalEntry(seq, when, event)
+        finally:
+            records.close()
+            try:
+                mapped.close()
+            except BufferError:  # Raw views still held, closed when released.
+                pass
+
+    @property
+    def last_seq(self) -> int:
+        """
+        :return: {int} Serial number of the last appended event, 0 if none.
+        """
+        return self._next_seq - 1
+
+    def stats(self) -> dict:
+        """
+        :return: {dict} appended, written, pending (queued for writing), segments and
+        bytes on disk.
+        """
+        return {
+            'appended': self.appended, 'written': self.written,
+            'pending': self.appended - self.written, 'segments': len(self._segments),
+            'bytes': sum(os.path.getsize(s.path) for s in list(self._segments)
+                         if os.path.exists(s.path))
+        }
+
+    def close(self):
+        """
+        Writes the queued events and stops the writer. Later appends raise ValueError.
+        """
+        with self._lock:  # No append can queue after the stop marker.
+            if not self.closed:
+                self.closed = True
+                self._queue.put(None)
+        self._writer.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
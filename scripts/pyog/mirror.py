@@ -0,0 +1,338 @@
+"""
+mirror.py
+
+In-memory mirror of DataConduIT classes. DataMirror loads the instances of the mirrored
+classes once, then keeps them current from software events, so that lookups are served
+from memory instead of data_query().
+
+:Example:
+
+>>> import pyog
+>>> dit = pyog.DIT(server='ms5')
+>>> mirror = pyog.DataMirror(dit, indexes={'Lnl_Cardholder': ['LASTNAME', 'DEPT']})
+>>> stop = Event()
+>>> Thread(target=mirror.watch, args=(stop,)).start()  # Or mirror.apply(event) per event.
+>>> mirror.cardholder(1)['LASTNAME']
+'Lake'
+>>> mirror.badge(258963)['PERSONID']
+1
+>>> [c['FIRSTNAME'] for c in mirror.find('Lnl_Cardholder', 'LASTNAME', 'Lake')]
+['Lisa']
+>>> mirror.check()['Lnl_Cardholder']
+{'local': 1200, 'server': 1200, 'missing': [], 'extra': [], 'stale': []}
+>>> stop.set()  # watch() returns within a second.
+"""
+
+
+from pyog import _wmii
+from pyog.dit import DITConnection, SWCreationEvent, SWModificationEvent, \
+    SWDeletionEvent, _preferred_badge, _wql_condition, _wql_name
+from threading import RLock, Event
+
+
+class ClassMirror:
+    """
+    Instances of one DataConduIT class, by key and by indexed property.
+
+    Rows are dicts of the mirrored properties. Rows handed out are shared, do not
+    modify them. Lookups are safe from any thread.
+
+    :param connection: {DITConnection} Connection used to load.
+    :param lnl_class: {str} Class name, e.g. 'Lnl_Cardholder'.
+    :param fields: {iterable{str}} Properties to mirror, all if None. Key properties \
+    are always mirrored.
+    :param indexes: {iterable{str}} Properties to index for find().
+    """
+
+    def __init__(self, connection: DITConnection, lnl_class, fields=None, indexes=()):
+        self._connection = connection
+        self.lnl_class = _wql_name(lnl_class)
+        schema = connection.schema_cache.schema(lnl_class)
+        names = {p.lower(): p for p in schema.properties}
+        self.keys = tuple(schema.keys)
+        fields = schema.properties if fields is None else \
+            [names.get(f.lower(), f) for f in fields]
+        self.fields = tuple(self.keys) + tuple(_wql_name(f) for f in fields
+                                               if f not in self.keys)
+        for column in indexes:
+            if column.lower() not in names:
+                raise ValueError(f'{lnl_class} has no property {column}')
+        self.indexes = tuple(names[c.lower()] for c in indexes)
+        self._lock = RLock()
+        self._rows = {}  # Row by key.
+        self._index = {column: {} for column in self.indexes}  # Set of keys by value.
+
+    def _key(self, row) -> tuple:
+        return tuple(row.get(k) for k in self.keys)
+
+    def load(self):
+        """
+        (Re)loads all instances.
+        """
+        rows = {}
+        for values in self._connection._iter_query(
+                f'select {", ".join(self.fields)} from {self.lnl_class}'):
+            row = dict(zip(self.fields, values))
+            rows[self._key(row)] = row
+        index = {column: {} for column in self.indexes}
+        for key, row in rows.items():
+            for column, keys in index.items():
+                keys.setdefault(row[column], set()).add(key)
+        with self._lock:
+            self._rows, self._index = rows, index
+
+    def apply(self, operation, instance) -> bool:
+        """
+        Applies a change.
+
+        :param operation: {str} Operation event class, e.g. SWModificationEvent.
+        :param instance: {dict} The instance after the change (before, for deletions).
+        :return: {bool} Whether the mirror changed.
+        """
+        key = self._key(instance)
+        with self._lock:
+            old = self._rows.get(key)
+            if operation.lower() == SWDeletionEvent.lower():
+                if old is None:
+                    return False
+                self._remove(key, old)
+                return True
+            row = {f: instance.get(f) for f in self.fields}
+            if old is not None:
+                changed = old.get('LASTCHANGED'), row.get('LASTCHANGED')
+                if row == old or None not in changed and changed[1] < changed[0]:
+                    return False  # Already loaded, e.g. changed between watch and load.
+                self._remove(key, old)
+            self._rows[key] = row
+            for column, keys in self._index.items():
+                keys.setdefault(row[column], set()).add(key)
+        return True
+
+    def _remove(self, key, row):
+        if row is None:
+            return
+        del self._rows[key]
+        for column, keys in self._index.items():
+            matching = keys.get(row[column])
+            if matching is not None:
+                matching.discard(key)
+                if not matching:
+                    del keys[row[column]]
+
+    def get(self, *key) -> dict:
+        """
+        Looks up an instance by key.
+
+        :param key: Key property values in schema order.
+        :return: {dict} The row, None if unknown.
+        """
+        return self._rows.get(key)
+
+    def find(self, column, value) -> list:
+        """
+        Looks up instances by an indexed property.
+
+        :param column: {str} Indexed property.
+        :param value: Value to match.
+        :return: {list{dict}} The matching rows.
+        """
+        with self._lock:
+            index = self._index.get(column)
+            if index is None:
+                names = {c.lower(): c for c in self._index}
+                if column.lower() not in names:
+                    raise KeyError(f'{self.lnl_class}.{column} is not indexed')
+                index = self._index[names[column.lower()]]
+            return [self._rows[key] for key in index.get(value, ())]
+
+    def rows(self) -> list:
+        """
+        :return: {list{dict}} All rows.
+        """
+        with self._lock:
+            return list(self._rows.values())
+
+    def check(self, recent=100, chunk=50) -> dict:
+        """
+        Compares the mirror with the server: all keys, and LASTCHANGED of the most \
+        recently changed rows if the class has it.
+
+        :param recent: {int} Rows whose LASTCHANGED is compared.
+        :param chunk: {int} Keys per query when reading LASTCHANGED.
+        :return: {dict} local and server counts, and lists of keys missing from the \
+        mirror, extra in it and stale (LASTCHANGED differs).
+        """
+        server = {tuple(key) for key in self._connection._iter_query(
+            f'select {", ".join(self.keys)} from {self.lnl_class}'
+        )}
+        with self._lock:
+            local = set(self._rows)
+            latest = sorted(
+                (row for row in self._rows.values() if row.get('LASTCHANGED') is not None),
+                key=lambda row: row['LASTCHANGED'], reverse=True
+            )[:recent] if 'LASTCHANGED' in self.fields else []
+            latest = {self._key(row): row['LASTCHANGED'] for row in latest}
+        stale = []
+        keys = list(latest)
+        for start in range(0, len(keys), chunk):
+            condition = ' OR '.join(
+                '(' + ' AND '.join(_wql_condition(k, v) for k, v in zip(self.keys, key)) + ')'
+                for key in keys[start:start + chunk]
+            )
+            for row in self._connection._iter_query(
+                    f'select {", ".join(self.keys)}, LASTCHANGED from {self.lnl_class} '
+                    f'where {condition}'):
+                key = tuple(row[:len(self.keys)])
+                if key in latest and row[-1] != latest[key]:
+                    stale.append(key)
+        return {
+            'local': len(local), 'server': len(server),
+            'missing': sorted(server - local, key=repr),
+            'extra': sorted(local - server, key=repr), 'stale': stale
+        }
+
+    def __len__(self):
+        return len(self._rows)
+
+
+class DataMirror:
+    """
+    In-memory mirror of cardholders and badges, or other software event classes, kept
+    current from their creation, modification and deletion events.
+
+    apply(), watch(), load() and check() use the connection so must run in the thread
+    that owns it. Lookups are served from memory and are safe from any thread.
+
+    :param connection: {DITConnection} Connection used to load, check and watch.
+    :param classes: {iterable{str}} Classes to mirror, see SWatcher.targets.
+    :param fields: {dict} Properties to mirror by class, all if not given.
+    :param indexes: {dict} Properties to index by class, see ClassMirror.find(). \
+    Lnl_Badge is always indexed by ID (the badge ID) and PERSONID.
+    """
+
+    def __init__(self, connection: DITConnection, classes=('Lnl_Cardholder', 'Lnl_Badge'),
+                 fields=None, indexes=None):
+        self._connection = connection
+        fields = {c.lower(): f for c, f in (fields or {}).items()}
+        indexes = {c.lower(): list(i) for c, i in (indexes or {}).items()}
+        for column in ('ID', 'PERSONID'):
+            if column.lower() not in map(str.lower, indexes.get('lnl_badge', [])):
+                indexes.setdefault('lnl_badge', []).append(column)
+        self._mirrors = {
+            cls.lower(): ClassMirror(connection, cls, fields.get(cls.lower()),
+                                     indexes.get(cls.lower(), ()))
+            for cls in classes
+        }
+        self.loaded = Event()
+        self.applied = 0
+        self.ignored = 0
+
+    def __getitem__(self, lnl_class) -> ClassMirror:
+        return self._mirrors[lnl_class.lower()]
+
+    def load(self):
+        """
+        (Re)loads all classes.
+        """
+        for mirror in self._mirrors.values():
+            mirror.load()
+        self.loaded.set()
+
+    def apply(self, event: dict) -> bool:
+        """
+        Applies a software event.
+
+        :param event: {dict} An event as delivered by SWatcher, with "class" and \
+        "operation".
+        :return: {bool} Whether the mirror changed.
+        """
+        mirror = self._mirrors.get((event.get('class') or '').lower())
+        if mirror is None or not mirror.apply(event['operation'], event):
+            self.ignored += 1
+            return False
+        self.applied += 1
+        return True
+
+    def software_events(self):
+        """
+        Subscribes to the changes of the mirrored classes.
+
+        :return: {SWatcher} Watcher for creation, modification and deletion events.
+        """
+        return self._connection.software_events(
+            [mirror.lnl_class for mirror in self._mirrors.values()],
+            [SWCreationEvent, SWModificationEvent, SWDeletionEvent]
+        )
+
+    def watch(self, stop=None, timeout_ms=1000):
+        """
+        Loads the mirror, then applies changes as they arrive. Blocks until stop is \
+        set; run in the connection's thread.
+
+        Subscribes before loading so that no change is lost in between.
+
+        :param stop: {threading.Event} Set to return. Watches forever if not given.
+        :param timeout_ms: {int} Longest wait for an event before checking stop.
+        """
+        watcher = self.software_events()
+        self.load()
+        while stop is None or not stop.is_set():
+            try:
+                event = watcher(timeout_ms)
+            except _wmii.x_wmi_timed_out:
+                continue
+            self.apply(event)
+
+    def find(self, lnl_class, column, value) -> list:
+        """
+        Looks up instances by an indexed property.
+
+        :param lnl_class: {str} Mirrored class.
+        :param column: {str} Indexed property.
+        :param value: Value to match.
+        :return: {list{dict}} The matching rows.
+        """
+        return self[lnl_class].find(column, value)
+
+    def cardholder(self, person_id) -> dict:
+        """
+        :param person_id: {int} Cardholder ID.
+        :return: {dict} The cardholder, None if unknown.
+        """
+        return self['Lnl_Cardholder'].get(person_id)
+
+    def badge(self, badge_id) -> dict:
+        """
+        :param badge_id: {int|str} Badge ID, e.g. an access event's CardNumber.
+        :return: {dict} The badge, None if unknown. If several badges have the ID, the \
+        active one, see _preferred_badge().
+        """
+        try:
+            badge_id = int(badge_id)
+        except (TypeError, ValueError):
+            return None
+        return _preferred_badge(self['Lnl_Badge'].find('ID', badge_id))
+
+    def badges(self, person_id) -> list:
+        """
+        :param person_id: {int} Cardholder ID.
+        :return: {list{dict}} The cardholder's badges.
+        """
+        return self['Lnl_Badge'].find('PERSONID', person_id)
+
+    def check(self, recent=100) -> dict:
+        """
+        Compares each mirrored class with the server, see ClassMirror.check().
+
+        :param recent: {int} Rows per class whose LASTCHANGED is compared.
+        :return: {dict} Check result by class name.
+        """
+        return {mirror.lnl_class: mirror.check(recent) for mirror in self._mirrors.values()}
+
+    def stats(self) -> dict:
+        """
+        :return: {dict} Row count by class name, applied and ignored events.
+        """
+        stats = {mirror.lnl_class: len(mirror) for mirror in self._mirrors.values()}
+        stats.update(applied=self.applied, ignored=self.ignored)
+        return stats
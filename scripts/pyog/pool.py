@@ -0,0 +1,644 @@
+"""
+pool.py
+
+Pool of DataConduIT connections for concurrent use. COM objects can only be used in the
+thread where they were created, so each connection is owned by a worker thread with its
+own COM apartment. Work is submitted as callables receiving the worker's DITConnection
+and results come back as futures.
+
+:Example:
+
+>>> import pyog
+>>> pool = pyog.DITPool(4, server='ms5')
+>>> rows = pool.data_query('select ID, LASTNAME from Lnl_Cardholder').result()
+>>> pool.open_door(panel='3300', reader='CK').result()
+>>> pool.update('Lnl_Cardholder.ID=1', CITY='Rochester').result()
+{'CITY': 'Rochester'}
+>>> pool.submit(lambda dit: dit.data_query('select * from Lnl_Reader')[0][0].Name)
+<Future at 0x... state=pending>
+>>> pool.shutdown()
+
+Note that DITElements and other COM objects must not leave the worker: query for
+properties instead of "*", or do the work with the elements inside a submitted callable.
+
+Tasks are scheduled by priority class so that door commands do not queue behind bulk
+jobs: the most urgent queued task goes first and bulk writes never take all workers.
+
+>>> pool.update('Lnl_Cardholder.ID=1', CITY='Rochester')  # PRIORITY_BULK
+>>> pool.open_door(panel='3300', reader='CK')  # PRIORITY_INTERACTIVE, runs first.
+>>> pool.submit(fn, priority=pyog.PRIORITY_READ)
+"""
+
+
+from pyog.dit import DITConnection, DITElement, COMError, _connect_dit, _COMI_ERROR, \
+    handle_error, status_table
+# noinspection PyUnresolvedReferences
+from pythoncom import CoInitialize, CoUninitialize
+from concurrent.futures import Future
+from collections import OrderedDict, deque, namedtuple
+from queue import Empty
+from threading import Thread, Lock, Condition
+from time import monotonic
+from types import GeneratorType
+
+
+# Priority classes, most urgent first.
+#: Interactive hardware commands, e.g. open_door.
+PRIORITY_INTERACTIVE = 0
+#: Event sends, e.g. send_event.
+PRIORITY_EVENT = 1
+#: Reads, e.g. data_query.
+PRIORITY_READ = 2
+#: Bulk writes, e.g. update.
+PRIORITY_BULK = 3
+_PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_EVENT, PRIORITY_READ, PRIORITY_BULK)
+
+# Priority of DITConnection methods called through DITProxy. Others are reads.
+_method_priority = {
+    'open_door': PRIORITY_INTERACTIVE,
+    'set_reader_mode': PRIORITY_INTERACTIVE,
+    'send_event': PRIORITY_EVENT,
+    'send_access_granted': PRIORITY_EVENT,
+    'send_access_denied': PRIORITY_EVENT,
+}
+
+# DITConnection methods DITProxy forwards, those returning values usable in any thread.
+# Watchers, hubs and connections are bound to the worker thread so are left out.
+_proxy_methods = frozenset((
+    'data_query', 'iter_query', 'open_door', 'set_reader_mode', 'status_sweep',
+    'send_event', 'send_access_granted', 'send_access_denied',
+))
+
+
+#: Outcome of a command sent to one device by a bulk call, e.g. DITPool.open_doors().
+#: error is None on success; latency is seconds from submission to completion.
+CommandResult = namedtuple('CommandResult', 'device ok error latency')
+
+
+class _Task:
+    """
+    A call to run on a worker connection.
+
+    :param fn: {callable} Called with the worker's DITConnection and args.
+    :param args: Positional arguments.
+    :param kwargs: Named arguments.
+    :param priority: {int} Priority class.
+    """
+
+    __slots__ = ('fn', 'args', 'kwargs', 'priority', 'future', 'enqueued')
+
+    def __init__(self, fn, args, kwargs, priority):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = Future()
+        self.enqueued = monotonic()
+
+
+class _Scheduler:
+    """
+    Task queue ordered by priority class, FIFO within a class.
+
+    A task is only handed out while fewer than its class limit are running, so a class
+    can be kept from taking every worker. Shutdown markers (None) are handed out once no
+    task can run.
+
+    :param limits: {dict{int: int}} Maximum running tasks per priority class.
+    """
+
+    def __init__(self, limits):
+        self._limits = limits
+        self._queues = {priority: deque() for priority in _PRIORITIES}
+        self._running = dict.fromkeys(_PRIORITIES, 0)
+        self._stops = 0
+        self._cond = Condition()
+
+    def put(self, task):
+        """
+        Queues a task, or a shutdown marker if None.
+
+        :param task: {_Task} The task.
+        :return: None.
+        """
+        with self._cond:
+            if task is None:
+                self._stops += 1
+            else:
+                self._queues[task.priority].append(task)
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """
+        Takes the most urgent task that can run, waiting for one.
+
+        :param timeout: {float} Seconds to wait.
+        :raises queue.Empty: If no task could be taken in time.
+        :return: {_Task} The task, or None to stop.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._cond:
+            while True:
+                for priority in _PRIORITIES:
+                    queue = self._queues[priority]
+                    limit = self._limits.get(priority)
+                    if queue and (limit is None or self._running[priority] < limit):
+                        self._running[priority] += 1
+                        return queue.popleft()
+                if self._stops:
+                    self._stops -= 1
+                    return None
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise Empty
+                self._cond.wait(remaining)
+
+    def done(self, task):
+        """
+        Frees the slot of a task taken with get().
+
+        :param task: {_Task} The finished task.
+        :return: None.
+        """
+        with self._cond:
+            self._running[task.priority] -= 1
+            self._cond.notify_all()
+
+    def depth(self) -> dict:
+        """
+        Queued tasks per priority class.
+
+        :return: {dict{int: int}} Queue length by priority.
+        """
+        with self._cond:
+            return {priority: len(queue) for priority, queue in self._queues.items()}
+
+
+class _Worker(Thread):
+    """
+    Thread owning one DataConduIT connection in its own COM apartment.
+
+    The connection is opened on first use and reopened after it is found broken, either
+    by a task or by the health check run when the worker has been idle for
+    health_interval seconds.
+
+    :param pool: {DITPool} The pool whose queue is served.
+    :param name: {str} Thread name.
+    """
+
+    _ping_class = '__Namespace'
+
+    def __init__(self, pool, name):
+        super().__init__(name=name, daemon=True)
+        self._pool = pool
+        self._dit = None
+
+    def run(self):
+        CoInitialize()
+        try:
+            while True:
+                try:
+                    task = self._pool._scheduler.get(self._pool.health_interval)
+                except Empty:
+                    self._check_health()
+                    continue
+                if task is None:
+                    break
+                self._execute(task)
+        finally:
+            self._dit = None  # Release COM objects before uninitializing.
+            CoUninitialize()
+
+    def _execute(self, task):
+        """
+        Runs a task, reconnecting first if needed.
+
+        :param task: {_Task} The task.
+        :return: None.
+        """
+        if not task.future.set_running_or_notify_cancel():
+            self._pool._scheduler.done(task)  # Cancelled while queued, free its slot.
+            return
+        self._pool._started(task)
+        try:
+            if self._dit is None:
+                self._dit = self._pool._connect()
+            result = task.fn(self._dit, *task.args, **task.kwargs)
+        except BaseException as e:
+            if isinstance(e, COMError) and e.disconnected:
+                self._dit = None
+            task.future.set_exception(e)
+        else:
+            task.future.set_result(result)
+        finally:
+            self._pool._finished(task)
+
+    def _check_health(self):
+        """
+        Pings the server over an idle connection and drops it if broken.
+
+        :return: None.
+        """
+        if self._dit is None:
+            return
+        try:
+            self._dit.namespace.wmi.Get(_Worker._ping_class)
+        except Exception:
+            self._dit = None
+
+    @property
+    def connected(self) -> bool:
+        """
+        Whether the worker currently holds an open connection.
+
+        :return: {bool} True if connected.
+        """
+        return self._dit is not None
+
+
+class DITPool:
+    """
+    Keeps N DataConduIT connections, each on its own worker thread.
+
+    Connections are opened lazily and reopened when lost. Free workers take the most
+    urgent queued task, in submission order within a priority class. By default bulk
+    writes may use all workers but one, which stays available for urgent work.
+
+    :param size: {int} Number of connections and worker threads.
+    :param server: {str} Hostname (IP can cause problems).
+    :param username: {str} Username.
+    :param password: {str} User password.
+    :param health_interval: {float} Idle seconds after which a worker checks its \
+    connection.
+    :param limits: {dict{int: int}} Maximum workers running tasks of a priority class \
+    at once. Defaults to size - 1 for PRIORITY_BULK.
+    """
+
+    def __init__(self, size=4, server=".", username="", password="",
+                 health_interval=60.0, limits=None):
+        if size < 1:
+            raise ValueError(f'Invalid pool size: {size}')
+        if limits is None:
+            limits = {PRIORITY_BULK: max(1, size - 1)}
+        if any(limit < 1 for limit in limits.values()):
+            raise ValueError(f'Invalid priority limits: {limits}')
+        self.server = server
+        self.username = username
+        self.password = password
+        self.health_interval = health_interval
+        self._scheduler = _Scheduler(limits)
+        self._lock = Lock()
+        self._closed = False
+        self._running = 0
+        self._completed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._workers = [_Worker(self, f'DITPool-{i}') for i in range(size)]
+        for worker in self._workers:
+            worker.start()
+
+    def _connect(self) -> DITConnection:
+        """
+        Opens a connection in the calling worker thread (already COM initialized).
+
+        :return: {DITConnection} The connection.
+        """
+        return _connect_dit(self.server, self.username, self.password)
+
+    def submit(self, fn, *args, priority=PRIORITY_READ, **kwargs) -> Future:
+        """
+        Runs fn(dit, *args, **kwargs) on a worker connection.
+
+        :param fn: {callable} Receives the worker's DITConnection as first argument.
+        :param args: Positional arguments.
+        :param priority: {int} Priority class, one of the PRIORITY_* constants.
+        :param kwargs: Named arguments.
+        :return: {Future} The call result.
+        """
+        if priority not in _PRIORITIES:
+            raise ValueError(f'Invalid priority: {priority}')
+        task = _Task(fn, args, kwargs, priority)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('Cannot submit to a pool after shutdown')
+            self._scheduler.put(task)
+        return task.future
+
+    def proxy(self, blocking=True, timeout=None) -> 'DITProxy':
+        """
+        Thread-safe stand-in for DITConnection whose methods run on the workers.
+
+        :param blocking: {bool} Whether calls wait for and return the result. Otherwise \
+        they return a Future.
+        :param timeout: {float} Seconds blocking calls wait before raising TimeoutError.
+        :return: {DITProxy} The proxy.
+        """
+        return DITProxy(self, blocking, timeout)
+
+    def data_query(self, wql: str) -> Future:
+        """
+        See DITConnection.data_query(). Query for properties, not "*".
+
+        :param wql: {str} The query.
+        :return: {Future} The query results.
+        """
+        return self.submit(DITConnection.data_query, wql)
+
+    def send_event(self, description, source, device="", subdevice="",
+                   **kwargs) -> Future:
+        """
+        See DITConnection.send_event().
+
+        :return: {Future} Completes when the event is sent.
+        """
+        return self.submit(
+            DITConnection.send_event, description, source, device, subdevice,
+            priority=PRIORITY_EVENT, **kwargs
+        )
+
+    def open_door(self, panel, reader) -> Future:
+        """
+        See DITConnection.open_door().
+
+        :return: {Future} Completes when the door is pulsed.
+        """
+        return self.submit(
+            DITConnection.open_door, panel, reader, priority=PRIORITY_INTERACTIVE
+        )
+
+    def set_reader_mode(self, panel, reader, mode) -> Future:
+        """
+        See DITConnection.set_reader_mode().
+
+        :return: {Future} Completes when the mode is set.
+        """
+        return self.submit(
+            DITConnection.set_reader_mode, panel, reader, mode,
+            priority=PRIORITY_INTERACTIVE
+        )
+
+    def open_doors(self, doors, timeout=None) -> list:
+        """
+        Pulses many doors at once, spread across the workers.
+
+        :param doors: {iterable{tuple}} (panel, reader) pairs, names or IDs.
+        :param timeout: {float} Seconds to wait for all doors. Those not done by then \
+        are reported with TimeoutError.
+        :return: {list{CommandResult}} One result per door, in the given order.
+        """
+        return self._bulk(
+            [(door, DITConnection.open_door, door) for door in doors], timeout
+        )
+
+    def set_reader_modes(self, modes, timeout=None) -> list:
+        """
+        Sets the mode of many readers at once, spread across the workers.
+
+        :Example:
+
+        >>> results = pool.set_reader_modes(
+        ...     {(panel, reader): 'MODE_LOCKED' for panel, reader in readers}
+        ... )
+        >>> [r.device for r in results if not r.ok]
+
+        :param modes: {dict{tuple: int|str}} Mode code or name by (panel, reader) pair.
+        :param timeout: {float} Seconds to wait for all readers. Those not done by then \
+        are reported with TimeoutError.
+        :return: {list{CommandResult}} One result per reader, in the given order.
+        """
+        return self._bulk(
+            [(reader, DITConnection.set_reader_mode, reader + (mode,))
+             for reader, mode in modes.items()],
+            timeout
+        )
+
+    def status_sweep(self, classes=None, timeout=None) -> OrderedDict:
+        """
+        Polls the hardware status of all devices in parallel, see \
+        DITConnection.status_sweep().
+
+        One worker lists the devices from its topology, the rest of the pool then polls \
+        them in interleaved slices, one per worker.
+
+        :param classes: {iterable{str}} Device classes to poll.
+        :param timeout: {float} Seconds to wait for each step.
+        :return: {OrderedDict} Columnar table, see status_table().
+        """
+        devices = self.submit(
+            DITConnection._status_devices, classes, priority=PRIORITY_READ
+        ).result(timeout)
+        futures = [self.submit(DITConnection._poll_statuses, devices[i::self.size])
+                   for i in range(min(self.size, len(devices)))]
+        rows = [None] * len(devices)
+        for i, future in enumerate(futures):
+            rows[i::self.size] = future.result(timeout)
+        return status_table(rows)
+
+    def _bulk(self, commands, timeout) -> list:
+        """
+        Runs device commands as interactive tasks and collects their outcome.
+
+        :param commands: {list{tuple}} (device, DITConnection method, args) triples.
+        :param timeout: {float} Seconds to wait for all commands.
+        :return: {list{CommandResult}} One result per command.
+        """
+        finished = {}  # Completion time by command index, set by future callbacks.
+        cond = Condition()
+
+        def stamp(index):
+            def callback(_):
+                with cond:
+                    finished[index] = monotonic()
+                    cond.notify()
+            return callback
+
+        submitted = []
+        for index, (device, method, args) in enumerate(commands):
+            start = monotonic()
+            future = self.submit(method, *args, priority=PRIORITY_INTERACTIVE)
+            submitted.append((device, future, start))
+            future.add_done_callback(stamp(index))
+        with cond:
+            cond.wait_for(lambda: len(finished) == len(submitted), timeout)
+        results = []
+        for index, (device, future, start) in enumerate(submitted):
+            with cond:
+                end = finished.get(index)
+            if end is not None and not future.cancelled():
+                error = future.exception()
+                results.append(CommandResult(device, error is None, error, end - start))
+            else:
+                future.cancel()
+                results.append(CommandResult(device, False, TimeoutError(), None))
+        return results
+
+    def update(self, obj_path: str, priority=PRIORITY_BULK, **kwargs) -> Future:
+        """
+        Sets properties of a DataConduIT object identified by its path.
+
+        :param obj_path: {str} Object WMI path, e.g. 'Lnl_Cardholder.ID=1'.
+        :param priority: {int} Priority class.
+        :param kwargs: Named properties and values.
+        :return: {Future} The properties actually written, see DITElement.set().
+        """
+        return self.submit(DITPool._update, obj_path, priority=priority, **kwargs)
+
+    @staticmethod
+    def _update(dit, obj_path, **kwargs):
+        try:
+            ole_obj = dit.namespace.wmi.Get(obj_path)
+        except _COMI_ERROR:
+            handle_error()
+        # noinspection PyUnboundLocalVariable
+        return DITElement(dit, ole_obj=ole_obj).set(**kwargs)
+
+    def _started(self, task):
+        wait = monotonic() - task.enqueued
+        with self._lock:
+            self._running += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+
+    def _finished(self, task):
+        self._scheduler.done(task)
+        with self._lock:
+            self._running -= 1
+            self._completed += 1
+
+    def stats(self) -> dict:
+        """
+        Queue depth and the time tasks waited for a worker.
+
+        :return: {dict} queued, running and completed task counts, average and maximum \
+        wait in seconds, and queued tasks by priority class.
+        """
+        depth = self._scheduler.depth()
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                'queued': sum(depth.values()),
+                'queued_by_priority': depth,
+                'running': self._running,
+                'completed': self._completed,
+                'wait_avg': self._wait_total / started if started else 0.0,
+                'wait_max': self._wait_max,
+            }
+
+    @property
+    def size(self) -> int:
+        """
+        Number of workers.
+
+        :return: {int} The pool size.
+        """
+        return len(self._workers)
+
+    @property
+    def connected(self) -> int:
+        """
+        Number of workers currently holding an open connection.
+
+        :return: {int} Open connections.
+        """
+        return sum(worker.connected for worker in self._workers)
+
+    def shutdown(self, wait=True):
+        """
+        Stops the workers once the submitted tasks are done.
+
+        :param wait: {bool} Whether to block until the workers exit.
+        :return: None.
+        """
+        with self._lock:
+            if not self._closed:
+                self._closed = True
+                for _ in self._workers:
+                    self._scheduler.put(None)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+
+
+class DITExecutor(DITPool):
+    """
+    A single DataConduIT connection owned by a dedicated COM thread.
+
+    Other threads cannot touch COM objects created in that thread, so they use proxy()
+    or submit() instead. Calls run one at a time, most urgent priority class first.
+
+    :Example:
+
+    >>> executor = pyog.DITExecutor(server='ms5')
+    >>> dit = executor.proxy()  # Can be shared by any thread.
+    >>> dit.send_event('Time Lapse', source='Quantum Panel')
+    >>> executor.stats()
+    {'queued': 0, 'queued_by_priority': {0: 0, 1: 0, 2: 0, 3: 0}, 'running': 0,
+    'completed': 1, 'wait_avg': 0.0001, 'wait_max': 0.0001}
+
+    :param server: {str} Hostname (IP can cause problems).
+    :param username: {str} Username.
+    :param password: {str} User password.
+    :param health_interval: {float} Idle seconds after which the connection is checked.
+    """
+
+    def __init__(self, server=".", username="", password="", health_interval=60.0):
+        super().__init__(1, server, username, password, health_interval)
+
+
+class DITProxy:
+    """
+    Forwards DITConnection method calls to a DITPool or DITExecutor.
+
+    Only methods returning plain values are forwarded: queries, door and reader
+    commands, status_sweep and event sends. Watchers, event hubs, clone() and properties
+    such as namespace are COM objects bound to the worker thread. Query generators
+    (iter_query, data_query(stream=True)) are read to the end in the worker and returned
+    as lists. Door commands run as PRIORITY_INTERACTIVE, event sends as PRIORITY_EVENT
+    and anything else as PRIORITY_READ. Results holding COM objects (e.g. DITElements
+    from "*" queries) must not be used outside the worker either.
+
+    :param pool: {DITPool} Where calls run.
+    :param blocking: {bool} Whether calls wait for and return the result. Otherwise they \
+    return a Future.
+    :param timeout: {float} Seconds blocking calls wait before raising TimeoutError.
+    """
+
+    def __init__(self, pool, blocking=True, timeout=None):
+        self._pool = pool
+        self._blocking = blocking
+        self._timeout = timeout
+
+    def __getattr__(self, name):
+        if name not in _proxy_methods:
+            raise AttributeError(name)
+        method = getattr(DITConnection, name)
+
+        def call(*args, **kwargs):
+            future = self._pool.submit(
+                _call_materialized, method, *args,
+                priority=_method_priority.get(name, PRIORITY_READ), **kwargs
+            )
+            return future.result(self._timeout) if self._blocking else future
+
+        call.__name__ = name
+        call.__doc__ = method.__doc__
+        return call
+
+
+def _call_materialized(dit, method, *args, **kwargs):
+    """
+    Calls a DITConnection method, reading a returned generator to the end so that it is
+    walked in the worker thread.
+
+    :param dit: {DITConnection} The worker's connection.
+    :param method: {function} The DITConnection method.
+    :return: The result, a list if the method returned a generator.
+    """
+    result = method(dit, *args, **kwargs)
+    return list(result) if isinstance(result, GeneratorType) else result
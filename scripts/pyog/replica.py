@@ -0,0 +1,286 @@
+"""
+replica.py
+
+Local SQLite replica of DataConduIT classes for reporting. Each sync pulls only the
+instances changed since the last one (by LASTCHANGED), removes the ones deleted on the
+server and logs what it did, so that reports run against the replica instead of the
+production server.
+
+:Example:
+
+>>> import pyog
+>>> dit = pyog.DIT(server='ms5')
+>>> replica = pyog.SQLiteReplica('onguard.db', indexes={'Lnl_Cardholder': ['DEPT']})
+>>> replica.sync(dit)  # The first sync of a class loads all of it.
+[{'class': 'Lnl_Cardholder', 'mode': 'full', 'pulled': 1200, 'deleted': 0, ...}]
+>>> replica.sync(dit)
+[{'class': 'Lnl_Cardholder', 'mode': 'delta', 'pulled': 3, 'deleted': 1, ...}]
+>>> replica.query('select DEPT, count(*) from Lnl_Cardholder group by DEPT')
+[(0, 1150), (2, 49)]
+"""
+
+
+from pyog.dit import DITConnection, _wql_literal, _wql_name
+from datetime import datetime, timedelta
+from time import monotonic
+import sqlite3
+
+
+def _sqlite_value(value):
+    """
+    :param value: A property value.
+    :return: The value as SQLite stores it: the object path of references, str if it \
+    has no SQLite type.
+    """
+    if value is None or isinstance(value, (int, float, str, bytes)):
+        return value
+    path = getattr(value, 'Path_', None)
+    if path is not None:
+        return path.Path
+    return str(value)
+
+
+def _utc(value):
+    """
+    Converts a DMTF datetime (yyyymmddHHMMSS.mmmmmm+UUU, UUU the UTC offset in minutes)
+    to UTC, so that LASTCHANGED values compare as text across offset changes (DST).
+
+    :param value: {str} The datetime.
+    :return: {str} The datetime with offset +000, the value unchanged if it is not a \
+    DMTF datetime.
+    """
+    if value is None:
+        return None
+    text = str(value)
+    try:
+        local = datetime.strptime(text[:21], '%Y%m%d%H%M%S.%f')
+        offset = int(text[21:25])
+    except ValueError:
+        return value
+    return (local - timedelta(minutes=offset)).strftime('%Y%m%d%H%M%S.%f') + '+000'
+
+
+def _columns(names) -> str:
+    """
+    :param names: {iterable{str}} Column names.
+    :return: {str} The names quoted for SQLite, comma separated.
+    """
+    return ', '.join(f'"{name}"' for name in names)
+
+
+class SQLiteReplica:
+    """
+    SQLite replica of DataConduIT classes, one table per class with the class' key \
+    properties as primary key.
+
+    A sync of a class with a LASTCHANGED property pulls the instances changed at or
+    after the newest LASTCHANGED already replicated (the watermark, kept in UTC), other
+    classes are pulled whole. References are stored as object paths.
+    Deletions are found with a keys-only scan. Each class syncs in one transaction, so
+    reports never see a half applied sync. Every sync is logged to the sync_log table.
+
+    The SQLite connection belongs to the thread that opens the replica, as sync() needs
+    the DataConduIT connection's thread too, open it there.
+
+    :param path: {str} Database file, created if needed.
+    :param classes: {iterable{str}} Classes to replicate.
+    :param fields: {dict} Properties to replicate by class, all if not given. Key \
+    properties are always replicated.
+    :param indexes: {dict} Properties to index by class. Lnl_Cardholder is always \
+    indexed by LASTCHANGED.
+    """
+
+    _log_columns = ('class', 'started', 'duration', 'mode', 'pulled', 'deleted', 'rows',
+                    'watermark', 'error')
+
+    def __init__(self, path, classes=('Lnl_Cardholder',), fields=None, indexes=None):
+        self.path = path
+        self.classes = tuple(_wql_name(c) for c in classes)
+        self.fields = {c.lower(): f for c, f in (fields or {}).items()}
+        self.indexes = {c.lower(): list(i) for c, i in (indexes or {}).items()}
+        if 'LASTCHANGED' not in self.indexes.get('lnl_cardholder', []):
+            self.indexes.setdefault('lnl_cardholder', []).append('LASTCHANGED')
+        self._db = sqlite3.connect(path)
+        self._db.executescript(
+            'CREATE TABLE IF NOT EXISTS sync_log (id INTEGER PRIMARY KEY, class TEXT, '
+            'started TEXT, duration REAL, mode TEXT, pulled INTEGER, deleted INTEGER, '
+            'rows INTEGER, watermark TEXT, error TEXT);'
+            'CREATE TABLE IF NOT EXISTS sync_state (class TEXT PRIMARY KEY, '
+            'watermark TEXT);'
+        )
+        self._db.commit()
+
+    def _table(self, connection, lnl_class) -> tuple:
+        """
+        Creates or extends the table of a class.
+
+        :param connection: {DITConnection} Connection to read the class schema with.
+        :param lnl_class: {str} Class name.
+        :return: {tuple} The key properties and the replicated properties, keys first.
+        """
+        schema = connection.schema_cache.schema(lnl_class)
+        names = {p.lower(): p for p in schema.properties}
+        keys = tuple(schema.keys)
+        fields = self.fields.get(lnl_class.lower())
+        fields = schema.properties if fields is None else \
+            [names.get(f.lower(), f) for f in fields]
+        fields = keys + tuple(_wql_name(f) for f in fields if f not in keys)
+        self._db.execute(
+            f'CREATE TABLE IF NOT EXISTS {lnl_class} ({_columns(fields)}, '
+            f'PRIMARY KEY ({_columns(keys)}))'
+        )
+        existing = {row[1].lower() for row in self._db.execute(
+            f'PRAGMA table_info({lnl_class})')}
+        for field in fields:
+            if field.lower() not in existing:
+                self._db.execute(f'ALTER TABLE {lnl_class} ADD COLUMN "{field}"')
+        for column in self.indexes.get(lnl_class.lower(), ()):
+            column = names.get(column.lower(), column)
+            if column not in fields:
+                raise ValueError(f'{lnl_class}.{column} is not replicated')
+            self._db.execute(f'CREATE INDEX IF NOT EXISTS ix_{lnl_class}_{column} '
+                             f'ON {lnl_class} ("{column}")')
+        return keys, fields
+
+    def watermark(self, lnl_class):
+        """
+        :param lnl_class: {str} Class name.
+        :return: {str} Newest LASTCHANGED replicated, in UTC, None before the first sync \
+        or if the class has no LASTCHANGED.
+        """
+        row = self._db.execute('SELECT watermark FROM sync_state WHERE class = ?',
+                               (lnl_class.lower(),)).fetchone()
+        return _utc(row[0]) if row else None
+
+    def sync(self, connection: DITConnection, full=False) -> list:
+        """
+        Syncs all classes. A class that fails is rolled back and logged with its error, \
+        the others are still synced.
+
+        :param connection: {DITConnection} Connection to pull from.
+        :param full: {bool} Pull all instances, ignoring the watermarks.
+        :raises Exception: The first error, after all classes were tried.
+        :return: {list{dict}} The sync_log entries written, one per class.
+        """
+        entries, errors = [], []
+        for lnl_class in self.classes:
+            entry, error = self._sync_class(connection, lnl_class, full)
+            entries.append(entry)
+            if error is not None:
+                errors.append(error)
+        if errors:
+            raise errors[0]
+        return entries
+
+    def _sync_class(self, connection, lnl_class, full) -> tuple:
+        """
+        Syncs one class in a transaction and logs it.
+
+        :return: {tuple} The sync_log entry and the exception raised, None if none.
+        """
+        error = None
+        started, start = datetime.now().isoformat(sep=' '), monotonic()
+        entry = dict.fromkeys(SQLiteReplica._log_columns)
+        entry.update({'class': lnl_class, 'started': started, 'pulled': 0, 'deleted': 0})
+        try:
+            with self._db:
+                keys, fields = self._table(connection, lnl_class)
+                watermark = None if full or 'LASTCHANGED' not in fields \
+                    else self.watermark(lnl_class)
+                entry['mode'] = 'full' if watermark is None else 'delta'
+                wql = f'select {", ".join(fields)} from {lnl_class}'
+                if watermark is not None:
+                    # At, not after: instances changed within the watermark's tick may
+                    # have been committed after the last sync read it.
+                    wql += f' where LASTCHANGED >= {_wql_literal(watermark)}'
+                entry['pulled'], newest = self._pull(connection, lnl_class, fields, wql)
+                entry['deleted'] = self._reconcile(connection, lnl_class, keys)
+                if 'LASTCHANGED' in fields:
+                    watermark = max(filter(None, (watermark, newest)), default=None)
+                    self._db.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?)',
+                                     (lnl_class.lower(), watermark))
+                entry['watermark'] = watermark
+                entry['rows'] = self._db.execute(
+                    f'SELECT count(*) FROM {lnl_class}').fetchone()[0]
+        except Exception as e:
+            entry['error'], error = f'{type(e).__name__}: {e}', e
+        entry['duration'] = monotonic() - start
+        with self._db:
+            self._db.execute(
+                f'INSERT INTO sync_log ({", ".join(SQLiteReplica._log_columns)}) '
+                f'VALUES ({", ".join("?" * len(SQLiteReplica._log_columns))})',
+                [entry[c] for c in SQLiteReplica._log_columns]
+            )
+        return entry, error
+
+    def _pull(self, connection, lnl_class, fields, wql) -> tuple:
+        """
+        Upserts the instances a query returns.
+
+        :return: {tuple} The number of instances and their newest LASTCHANGED, in UTC.
+        """
+        changed = fields.index('LASTCHANGED') if 'LASTCHANGED' in fields else None
+        newest = [None]
+
+        def rows():
+            for row in connection._iter_query(wql):
+                utc = _utc(row[changed]) if changed is not None else None
+                if utc is not None and (newest[0] is None or utc > newest[0]):
+                    newest[0] = utc
+                yield [_sqlite_value(value) for value in row]
+
+        cursor = self._db.executemany(
+            f'INSERT OR REPLACE INTO {lnl_class} ({_columns(fields)}) '
+            f'VALUES ({", ".join("?" * len(fields))})',
+            rows()
+        )
+        return cursor.rowcount, newest[0]
+
+    def _reconcile(self, connection, lnl_class, keys) -> int:
+        """
+        Deletes the instances no longer on the server, found with a keys-only scan.
+
+        :return: {int} The number of instances deleted.
+        """
+        self._db.execute('DROP TABLE IF EXISTS temp.server_keys')
+        self._db.execute(f'CREATE TEMP TABLE server_keys ({_columns(keys)})')
+        self._db.executemany(
+            f'INSERT INTO server_keys VALUES ({", ".join("?" * len(keys))})',
+            ([_sqlite_value(value) for value in row] for row in connection._iter_query(
+                f'select {", ".join(keys)} from {lnl_class}'))
+        )
+        match = ' AND '.join(f'{lnl_class}."{key}" = server_keys."{key}"' for key in keys)
+        return self._db.execute(
+            f'DELETE FROM {lnl_class} WHERE NOT EXISTS '
+            f'(SELECT 1 FROM server_keys WHERE {match})'
+        ).rowcount
+
+    def query(self, sql, *params) -> list:
+        """
+        Runs a query against the replica.
+
+        :param sql: {str} SQLite query.
+        :param params: Query parameters.
+        :return: {list{tuple}} The rows.
+        """
+        return self._db.execute(sql, params).fetchall()
+
+    def last_syncs(self, limit=10) -> list:
+        """
+        :param limit: {int} Number of entries.
+        :return: {list{dict}} The newest sync_log entries, newest first.
+        """
+        cursor = self._db.execute(
+            f'SELECT {", ".join(SQLiteReplica._log_columns)} FROM sync_log '
+            f'ORDER BY id DESC LIMIT ?', (limit,)
+        )
+        return [dict(zip(SQLiteReplica._log_columns, row)) for row in cursor]
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,239 @@
+"""
+state.py
+
+Live hardware status of devices. DeviceStateTable loads the status of all devices once
+and then keeps it current from Lnl_StatusChangeEvent instances, so that readers get
+device health without calling DataConduIT.
+
+:Example:
+
+>>> import pyog
+>>> dit = pyog.DIT(server='ms5')
+>>> table = pyog.DeviceStateTable(dit)
+>>> @table.on_change
+... def changed(old, new):
+...     print(new.name, new.flags)
+...
+>>> stop = Event()
+>>> Thread(target=table.watch, args=(stop,)).start()  # Or table.apply(event) per event.
+>>> table.get('Lnl_Reader', 1, 2).flags
+['RDRSTATUS_ONLINE']
+>>> [device.name for device in table.with_flag('RDRSTATUS_TAMPER')]
+['CK']
+>>> stop.set()  # watch() returns within a second.
+"""
+
+
+from pyog import _wmii
+from pyog.dit import DITConnection, HWStatusEvent, _status_cls
+from collections import namedtuple
+from threading import RLock, Event
+
+
+#: Status of one device.
+DeviceState = namedtuple('DeviceState', 'lnl_class key name status flags')
+
+# Key properties making up a device's (PanelID, DeviceID, SecondaryDeviceID) address in
+# hardware events.
+_event_address = {
+    'lnl_panel': ('ID',),
+    'lnl_reader': ('PanelID', 'ReaderID'),
+    'lnl_alarmpanel': ('PanelID', 'AlarmPanelID'),
+    'lnl_alarminput': ('PanelID', 'AlarmPanelID', 'InputID'),
+    'lnl_alarmoutput': ('PanelID', 'AlarmPanelID', 'OutputID'),
+}
+
+
+def _decode(lnl_class, status) -> list:
+    """
+    Decodes a status through the device's HWStatus.
+
+    :param lnl_class: {str} Status class of the device, a key of _status_cls.
+    :param status: {int} Encoded status, None if unknown.
+    :return: {list{str}} Status names, empty if unknown.
+    """
+    if status is None:
+        return []
+    try:
+        return _status_cls[lnl_class].decode(status)
+    except KeyError:  # Combination the status class does not define.
+        return []
+
+
+class DeviceStateTable:
+    """
+    Hardware status of all devices in a DITConnection topology, kept current from status
+    change events.
+
+    Lookups and queries are served from memory and are safe from any thread. apply(),
+    watch() and load() use the connection so must run in the thread that owns it.
+
+    Events carry a (PanelID, DeviceID, SecondaryDeviceID) address. When that address
+    matches more than one device (e.g. an alarm input and an output with the same ID),
+    or the event has no status property, the matching devices are polled instead.
+
+    :param connection: {DITConnection} Connection used to load, poll and watch.
+    :param classes: {iterable{str}} Device classes, see DITConnection.status_sweep().
+    :param status_property: {str} Event property holding the new status.
+    """
+
+    def __init__(self, connection: DITConnection, classes=None,
+                 status_property='NewStatus'):
+        self._connection = connection
+        self.classes = classes
+        self.status_property = status_property
+        self._lock = RLock()
+        self._states = {}  # DeviceState by (class, key).
+        self._by_flag = {}  # Set of (class, key) by status name.
+        self._by_address = {}  # List of (class, key) by event address.
+        self._callbacks = []
+        self.loaded = Event()
+        self.applied = 0
+        self.polled = 0
+        self.ignored = 0
+
+    def load(self, sweep=None):
+        """
+        (Re)loads the status of all devices.
+
+        :param sweep: {OrderedDict} A table from status_sweep() to load from, e.g. from \
+        DITPool.status_sweep(). Polled with the connection if not given.
+        """
+        if sweep is None:
+            sweep = self._connection.status_sweep(self.classes)
+        schema = self._connection.schema_cache.schema
+        states, by_address = {}, {}
+        for lnl_class, key, name, status in zip(sweep['class'], sweep['key'],
+                                                sweep['name'], sweep['status']):
+            status = None if status < 0 else int(status)
+            states[lnl_class, key] = \
+                DeviceState(lnl_class, key, name, status, _decode(lnl_class, status))
+            names = _event_address.get(lnl_class.lower())
+            if names is not None:
+                values = {k.lower(): v for k, v in zip(schema(lnl_class).keys, key)}
+                address = tuple(values[k.lower()] for k in names)
+                address += (0,) * (3 - len(address))
+                by_address.setdefault(address, []).append((lnl_class, key))
+        by_flag = {}
+        for device, state in states.items():
+            for flag in state.flags:
+                by_flag.setdefault(flag, set()).add(device)
+        with self._lock:
+            self._states, self._by_flag, self._by_address = states, by_flag, by_address
+        self.loaded.set()
+
+    def apply(self, event: dict) -> list:
+        """
+        Applies a status change event.
+
+        :param event: {dict} An Lnl_StatusChangeEvent as delivered by HWatcher.
+        :return: {list{DeviceState}} The new state of the devices that changed.
+        """
+        if not self.loaded.is_set():
+            self.load()
+        address = (event.get('PanelID'), event.get('DeviceID') or 0,
+                   event.get('SecondaryDeviceID') or 0)
+        devices = self._by_address.get(address)
+        if not devices:
+            self.ignored += 1
+            return []
+        status = event.get(self.status_property)
+        if status is None or len(devices) > 1:
+            statuses = {
+                (lnl_class, key): status
+                for lnl_class, key, _, status, _ in self._connection._poll_statuses(
+                    [(c, k, self._states[c, k].name) for c, k in devices]
+                )
+            }
+            self.polled += 1
+        else:
+            statuses = {devices[0]: status}
+        self.applied += 1
+        return self._update(statuses)
+
+    def _update(self, statuses: dict) -> list:
+        """
+        Stores new statuses and calls back for the devices that changed.
+
+        :param statuses: {dict{tuple: int}} Status by (class, key).
+        :return: {list{DeviceState}} The new state of the devices that changed.
+        """
+        changes = []
+        with self._lock:
+            for device, status in statuses.items():
+                old = self._states.get(device)
+                if old is None or old.status == status:
+                    continue
+                new = old._replace(status=status, flags=_decode(old.lnl_class, status))
+                self._states[device] = new
+                for flag in old.flags:
+                    self._by_flag[flag].discard(device)
+                for flag in new.flags:
+                    self._by_flag.setdefault(flag, set()).add(device)
+                changes.append((old, new))
+        for old, new in changes:
+            for callback in self._callbacks:
+                callback(old, new)
+        return [new for _, new in changes]
+
+    def watch(self, stop=None, timeout_ms=1000):
+        """
+        Loads the table if not loaded, then applies status change events as they \
+        arrive. Blocks until stop is set; run in the connection's thread.
+
+        Subscribes before loading so that no change is lost in between.
+
+        :param stop: {threading.Event} Set to return. Watches forever if not given.
+        :param timeout_ms: {int} Longest wait for an event before checking stop.
+        """
+        watcher = self._connection.hardware_events(HWStatusEvent)
+        if not self.loaded.is_set():
+            self.load()
+        while stop is None or not stop.is_set():
+            try:
+                event = watcher(timeout_ms)
+            except _wmii.x_wmi_timed_out:
+                continue
+            self.apply(event)
+
+    def on_change(self, callback):
+        """
+        Registers a callback for status changes. Can be used as a decorator.
+
+        :param callback: {callable} Called with the old and new DeviceState.
+        :return: {callable} The callback.
+        """
+        self._callbacks.append(callback)
+        return callback
+
+    def get(self, lnl_class, *key):
+        """
+        Looks up a device.
+
+        :param lnl_class: {str} Device status class, e.g. 'Lnl_Reader'.
+        :param key: Key property values in schema order, e.g. PanelID, ReaderID.
+        :return: {DeviceState} The device state, None if unknown.
+        """
+        return self._states.get((lnl_class, key))
+
+    def with_flag(self, flag) -> list:
+        """
+        Devices whose status includes a flag.
+
+        :param flag: {str} Status name, e.g. 'RDRSTATUS_ONLINE'.
+        :return: {list{DeviceState}} The devices.
+        """
+        with self._lock:
+            return [self._states[device] for device in self._by_flag.get(flag, ())]
+
+    def devices(self) -> list:
+        """
+        All devices.
+
+        :return: {list{DeviceState}} The devices.
+        """
+        with self._lock:
+            return list(self._states.values())
+
+    def __len__(self):
+        return len(self._states)
@@ -0,0 +1,53 @@
+import os
+import sys
+from types import SimpleNamespace
+
+# The package lives in scripts/pyog and is not installed.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def row_object(row):
+    """Stands in for an SWbemObject query result with the values of a dict."""
+    return SimpleNamespace(Properties_=lambda name: SimpleNamespace(Value=row[name]))
+
+
+def schema(keys=(), properties=(), references=None):
+    """
+    Stands in for a _wmii._wmi_schema.
+
+    :param references: {dict} Referenced class by reference property.
+    """
+    qualifiers = {p: {'CIMTYPE': 'string'} for p in properties}
+    qualifiers.update((p, {'CIMTYPE': f'ref:{c}'}) for p, c in (references or {}).items())
+    return SimpleNamespace(keys=list(keys), properties=list(qualifiers),
+                           property_qualifiers=qualifiers)
+
+
+class Namespace:
+    """
+    Stands in for the DataConduIT namespace, recording the data queries sent and
+    answering them with rows().
+
+    :param schemas: {dict} Schemas by class name. Without it every class has an empty \
+    schema, with it unknown classes raise KeyError.
+    """
+
+    def __init__(self, schemas=None):
+        self.queries = []
+        self.schemas = schemas
+        self.schema_cache = SimpleNamespace(schema=self.schema)
+        self.wmi = self
+
+    def schema(self, lnl_class):
+        return schema() if self.schemas is None else self.schemas[lnl_class]
+
+    def rows(self, wql):
+        """The rows of a query, as dicts."""
+        return []
+
+    def ExecQuery(self, strQuery, iFlags=0):
+        self.queries.append(strQuery)
+        return [row_object(row) for row in self.rows(strQuery)]
+
+    def _raw_query(self, wql):
+        return self.ExecQuery(wql.replace('\\', '\\\\'))  # As _wmii does.
@@ -0,0 +1,78 @@
+import pytest
+
+pytest.importorskip('win32com.client', reason='pyog needs pywin32')
+
+from conftest import Namespace
+from pyog.cardholders import CardholderCache
+from pyog.dit import DITConnection, SWDeletionEvent, SWModificationEvent
+import re
+
+
+class _Namespace(Namespace):
+    """Stands in for the DataConduIT namespace, serving Lnl_Badge and Lnl_Cardholder."""
+
+    def __init__(self, badges, holders):
+        super().__init__()
+        self.badges = badges  # Lnl_Badge rows by badge ID.
+        self.holders = holders  # Fields by cardholder ID.
+
+    def rows(self, wql):
+        id = int(re.search(r'ID = (\d+)$', wql).group(1))
+        if ' from Lnl_Badge ' in wql:
+            return self.badges.get(id, [])
+        return [self.holders[id]] if id in self.holders else []
+
+
+def _badge(key, person_id, status=1):
+    return {'BADGEKEY': key, 'PERSONID': person_id, 'STATUS': status}
+
+
+def _cache():
+    namespace = _Namespace({10: [_badge(1, 1)], 11: [_badge(2, 1)], 12: [_badge(3, 2)]},
+                           {1: {'ID': 1, 'LASTNAME': 'Lake'}, 2: {'ID': 2, 'LASTNAME': 'Doe'}})
+    return CardholderCache(DITConnection(namespace), fields=('ID', 'LASTNAME')), namespace
+
+
+def test_get_queries_once_per_badge():
+    cache, namespace = _cache()
+    assert cache.get('10') == {'ID': 1, 'LASTNAME': 'Lake'}
+    assert cache.get(10) == {'ID': 1, 'LASTNAME': 'Lake'}
+    assert cache.get(99) is None and cache.get(99) is None
+    assert len(namespace.queries) == 3
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert cache.enrich({'CardNumber': 10})['Cardholder'] == {'ID': 1, 'LASTNAME': 'Lake'}
+
+
+def test_apply_updates_and_drops_entries():
+    cache, namespace = _cache()
+    for badge_id in (10, 11, 12):
+        cache.get(badge_id)
+    cache.apply({'class': 'Lnl_Cardholder', 'operation': SWModificationEvent, 'ID': 1,
+                 'LASTNAME': 'Shore'})
+    assert cache.get(11) == {'ID': 1, 'LASTNAME': 'Shore'}
+    cache.apply({'class': 'Lnl_Badge', 'operation': SWDeletionEvent, 'ID': 12,
+                 'previous': None})
+    cache.apply({'class': 'Lnl_Cardholder', 'operation': SWDeletionEvent, 'ID': 1})
+    assert cache.stats()['size'] == 0 and cache.invalidations == 3
+    queries = len(namespace.queries)
+    cache.get(12)
+    assert len(namespace.queries) == queries + 2
+
+
+def test_invalidate():
+    cache, namespace = _cache()
+    cache.get(10)
+    cache.get(12)
+    cache.invalidate(10)
+    assert cache.stats()['size'] == 1
+    cache.invalidate()
+    assert cache.stats() == {'size': 0, 'hits': 0, 'misses': 2, 'hit_ratio': 0.0,
+                             'invalidations': 2}
+
+
+def test_get_prefers_the_active_badge():
+    cache, namespace = _cache()
+    namespace.badges[20] = [_badge(4, 1), _badge(5, 2, status=2)]
+    namespace.badges[21] = [_badge(6, 1, status=2), _badge(7, 2, status=2)]
+    assert cache.get(20)['ID'] == 1
+    assert cache.get(21)['ID'] == 2  # None active: the latest issued.
@@ -0,0 +1,455 @@
+import pytest
+
+pytest.importorskip('win32com.client', reason='pyog needs pywin32')
+
+from conftest import Namespace, schema
+from pyog import dit as dit_module
+from pyog import _wmii
+from pyog.dit import COMError, DITConnection, DITElement, DITTopology, SWCreationEvent, \
+    SWDeletionEvent, SWModificationEvent, _DITWatcher, _decode_event, _wql_condition, \
+    _wql_literal, status_table
+from pyog.events import Subscription
+from pywintypes import com_error
+from types import SimpleNamespace
+
+
+class _Device:
+    """Stands in for a DITElement whose status cannot be read."""
+
+    def wmi_class(self):
+        return 'Lnl_Reader'
+
+    @property
+    def GetHardwareStatus(self):
+        raise _wmii.x_wmi('no status')
+
+
+class _Topology:
+
+    def __init__(self, devices):
+        self._devices = devices
+
+    def by_key(self, lnl_class, *key):
+        return self._devices.get((lnl_class, key))
+
+
+def _connection(devices):
+    connection = DITConnection(None)
+    connection._topology = _Topology(devices)
+    return connection
+
+
+def test_poll_statuses_records_missing_device():
+    rows = _connection({})._poll_statuses([('Lnl_Reader', (9, 9), 'X')])
+    assert len(rows) == 1
+    lnl_class, key, name, status, error = rows[0]
+    assert (lnl_class, key, name, status) == ('Lnl_Reader', (9, 9), 'X', None)
+    assert isinstance(error, _wmii.x_wmi)
+
+
+def test_poll_statuses_records_error_without_com_error():
+    devices = {('Lnl_Reader', (1, 1)): _Device()}
+    rows = _connection(devices)._poll_statuses(
+        [('Lnl_Reader', (1, 1), 'R1'), ('Lnl_Reader', (2, 2), 'R2')]
+    )
+    assert [row[3] for row in rows] == [None, None]
+    assert all(isinstance(row[4], _wmii.x_wmi) for row in rows)
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+def test_status_table(monkeypatch, use_numpy):
+    if not use_numpy:
+        monkeypatch.setattr(dit_module, 'numpy', None)
+    elif dit_module.numpy is None:
+        pytest.skip('numpy not installed')
+    error = ValueError('failed')
+    table = status_table([
+        ('Lnl_Reader', (1, 1), 'R1', 1, None),
+        ('Lnl_Reader', (1, 2), 'R2', None, error),
+    ])
+    assert list(table['status']) == [1, -1]
+    assert table['error'] == [None, error]
+    assert list(table['RDRSTATUS_ONLINE']) == [True, False]
+
+
+class _EventSource:
+    """Stands in for SWbemEventSource: delivers events, then raises errors."""
+
+    def __init__(self, events, errors):
+        self.events = list(events)
+        self.errors = list(errors)
+
+    def NextEvent(self, timeout_ms):
+        if self.events:
+            return self.events.pop(0)
+        raise self.errors.pop(0)
+
+
+class _Namespace(Namespace):
+    """Stands in for the DataConduIT namespace, also recording event queries."""
+
+    def __init__(self, source=None):
+        super().__init__()
+        self.source = source
+
+    def ExecNotificationQuery(self, wql):
+        self.queries.append(wql)
+        return self.source
+
+
+class _RawWatcher(_DITWatcher):
+
+    def _event(self, raw_event):
+        return raw_event
+
+
+def test_drain_keeps_events_taken_before_an_error():
+    error = RuntimeError('lost')
+    watcher = _RawWatcher(_Namespace(_EventSource([1, 2], [error])), 'select', True)
+    assert watcher.drain(10) == [1, 2]
+    with pytest.raises(RuntimeError):
+        watcher.drain(10)
+
+
+def test_drain_raises_error_without_events():
+    watcher = _RawWatcher(_Namespace(_EventSource([], [RuntimeError('lost')])),
+                          'select', True)
+    with pytest.raises(RuntimeError):
+        watcher.drain(10)
+
+
+def test_add_stage():
+    watcher = _RawWatcher(_Namespace(_EventSource([1, 2], [])), 'select', True)
+    assert watcher.add_stage(lambda event: event * 10) is watcher
+    assert watcher() == 10
+    assert watcher.drain(1) == [20]
+
+
+class _Property:
+
+    def __init__(self, name, value, **qualifiers):
+        self.Name, self.Value, self.CIMType = name, value, 8
+        self.Qualifiers_ = [SimpleNamespace(Name=n, Value=v) for n, v in qualifiers.items()]
+
+
+class _Properties(list):
+    """Properties_ collection that counts how often it is walked."""
+
+    walks = 0
+
+    def __iter__(self):
+        _Properties.walks += 1
+        return super().__iter__()
+
+    def __call__(self, name):
+        for p in list.__iter__(self):
+            if p.Name == name:
+                return p
+        raise com_error(-2147217406, 'Not found', None, None)
+
+
+class _RawEvent:
+
+    def __init__(self, class_name, **values):
+        self.Path_ = SimpleNamespace(Class=class_name)
+        self.Properties_ = _Properties(_Property(n, v) for n, v in values.items())
+
+
+def test_decode_event_walks_properties_once_per_class():
+    _Properties.walks = 0
+    first = _decode_event(_RawEvent('Test_DoorEvent', Door='D1', State=1))
+    second = _decode_event(_RawEvent('Test_DoorEvent', Door='D2', State=0))
+    assert (dict(first), dict(second)) == ({'Door': 'D1', 'State': 1},
+                                           {'Door': 'D2', 'State': 0})
+    assert _Properties.walks == 1
+    other = _decode_event(_RawEvent('Test_CardEvent', Card='C1', Reader=2))
+    assert other.event_class == 'Test_CardEvent'
+    assert dict(other) == {'Card': 'C1', 'Reader': 2}
+
+
+def test_decode_event_recompiles_changed_layout():
+    _decode_event(_RawEvent('Test_AlarmEvent', Alarm='A1'))
+    record = _decode_event(_RawEvent('Test_AlarmEvent', Text='changed'))
+    assert dict(record) == {'Text': 'changed'}
+
+
+def test_wql_literal():
+    assert _wql_literal(True) == 'TRUE'
+    assert _wql_literal(12) == '12'
+    assert _wql_literal('C:\\a "b"') == '"C:\\\\a \\"b\\""'
+    with pytest.raises(TypeError):
+        _wql_literal(1.5)
+
+
+def test_wql_condition():
+    assert _wql_condition('ID', None) == 'ID IS NULL'
+    assert _wql_condition('ID', frozenset([2, 1])) == '(ID = 1 OR ID = 2)'
+    assert _wql_condition('ID', [1]) == 'ID = 1'
+    with pytest.raises(ValueError):
+        _wql_condition('ID', [])
+    with pytest.raises(ValueError):
+        _wql_condition('ID = 1 OR 1', 1)
+
+
+def test_data_query_doubles_backslashes():
+    namespace = _Namespace()
+    assert DITConnection(namespace).data_query(
+        'select ID from Lnl_Account where NAME = "DOMAIN\\user"') == []
+    assert list(DITConnection(namespace).iter_query(
+        'select ID from Lnl_Account where NAME = "DOMAIN\\user"')) == []
+    assert namespace.queries == [
+        'select ID from Lnl_Account where NAME = "DOMAIN\\\\user"'] * 2
+
+
+def test_escaped_data_query_sends_literal_escaped_once():
+    namespace = _Namespace()
+    wql = 'select ID from Lnl_Badge where ' + _wql_condition('NAME', 'a\\b"c')
+    assert DITConnection(namespace)._data_query(wql) == []
+    assert list(DITConnection(namespace)._iter_query(wql)) == []
+    assert namespace.queries == ['select ID from Lnl_Badge where NAME = "a\\\\b\\"c"'] * 2
+
+
+def test_hardware_events_sends_literal_escaped_once():
+    namespace = _Namespace()
+    DITConnection(namespace).hardware_events(Type=frozenset([4]), Text='a\\b"c')
+    assert namespace.queries[0].endswith(' WHERE Type = 4 AND Text = "a\\\\b\\"c"')
+
+
+@pytest.mark.parametrize('hresult, disconnected', [
+    (-2147023174, True),  # RPC_S_SERVER_UNAVAILABLE
+    (-2147417848, True),  # RPC_E_DISCONNECTED
+    (-2147217406, False),  # WBEM_E_NOT_FOUND
+])
+def test_com_error_disconnected(hresult, disconnected):
+    try:
+        raise com_error(hresult, 'failed', None, None)
+    except com_error:
+        error = COMError()
+    assert error.disconnected is disconnected
+    assert error.description == 'failed'
+
+
+def test_com_error_from_x_wmi():
+    try:
+        raise _wmii.x_wmi(com_error=com_error(-2147023174, 'failed', None, None))
+    except _wmii.x_wmi:
+        error = COMError()
+    assert error.code == '0x800706ba'
+    assert error.disconnected
+
+
+class _Object:
+    """Stands in for an SWbemObject of Lnl_Test."""
+
+    def __init__(self, server, values, path=''):
+        self._server = server
+        self.Path_ = SimpleNamespace(Class='Lnl_Test', Path=path, DisplayName=path or 'Lnl_Test')
+        self.Properties_ = _Properties(
+            _Property(n, v, CIMTYPE='string', key=n == 'ID') for n, v in values.items())
+        self.Methods_ = self.Qualifiers_ = []
+
+    def Put_(self):
+        self._server.puts += 1
+        values = {p.Name: p.Value for p in list.__iter__(self.Properties_)}
+        path = f'Lnl_Test.ID={values["ID"]}'
+        self._server.rows[path] = values
+        return SimpleNamespace(Relpath=path)
+
+
+class _Server:
+    """Stands in for the DataConduIT namespace, counting writes and reads of Lnl_Test."""
+
+    schema_cache = None
+
+    def __init__(self):
+        self.rows = {}
+        self.puts = self.gets = 0
+        self.wmi = self
+
+    def Get(self, path):
+        self.gets += 1
+        return _Object(self, dict(self.rows[path]), path)
+
+    def element(self, **values):
+        self.rows[f'Lnl_Test.ID={values["ID"]}'] = values
+        element = DITElement(self, ole_obj=self.Get(f'Lnl_Test.ID={values["ID"]}'))
+        self.gets = 0
+        return element
+
+
+def _element():
+    server = _Server()
+    return server, server.element(ID=1, NAME='a', CITY='x')
+
+
+def test_batch_writes_once():
+    server, element = _element()
+    with element.batch() as written:
+        element.NAME = 'b'
+        element.set(CITY='y', NAME='b')
+    assert written == {'NAME': 'b', 'CITY': 'y'}
+    assert (server.puts, server.gets) == (1, 1)
+    assert server.rows['Lnl_Test.ID=1'] == {'ID': 1, 'NAME': 'b', 'CITY': 'y'}
+    assert (element.NAME, element.CITY) == ('b', 'y')
+
+
+def test_batch_skips_unchanged():
+    server, element = _element()
+    with element.batch(refresh=False) as written:
+        element.NAME = 'b'
+        element.NAME = 'a'
+    assert written == {}
+    assert (server.puts, server.gets) == (0, 0)
+
+
+def test_batch_reverts_on_raise():
+    server, element = _element()
+    with pytest.raises(ValueError):
+        with element.batch():
+            element.NAME = 'b'
+            raise ValueError('abort')
+    assert (server.puts, element.NAME) == (0, 'a')
+    element.CITY = 'y'
+    assert server.rows['Lnl_Test.ID=1'] == {'ID': 1, 'NAME': 'a', 'CITY': 'y'}
+
+
+def test_nested_batch_drops_only_the_block_that_raised():
+    server, element = _element()
+    with element.batch() as written:
+        element.NAME = 'b'
+        with pytest.raises(ValueError):
+            with element.batch():
+                element.NAME = 'c'
+                element.CITY = 'y'
+                raise ValueError('abort')
+        assert (element.NAME, element.CITY) == ('b', 'x')
+    assert written == {'NAME': 'b'}
+    assert server.puts == 1
+    assert server.rows['Lnl_Test.ID=1'] == {'ID': 1, 'NAME': 'b', 'CITY': 'x'}
+
+
+def test_batch_reports_the_block_exception_if_revert_fails(monkeypatch):
+    _, element = _element()
+
+    def revert(self, staged):
+        raise _wmii.x_wmi('lost')
+
+    monkeypatch.setattr(DITElement, '_revert', revert)
+    with pytest.raises(ValueError):
+        with element.batch():
+            element.NAME = 'b'
+            raise ValueError('abort')
+    assert not element._deferred
+
+
+def test_projected_rows_read_only_selected_properties():
+    namespace = _Namespace()
+    namespace.rows = lambda wql: [{'ID': 1, 'NAME': 'a', 'CITY': 'x'}]  # Not iterable.
+    row, = DITConnection(namespace).data_query('select ID, NAME from Lnl_Test')
+    assert row == (1, 'a') and row.NAME == 'a'
+
+
+def test_projected_rows_wrap_references(monkeypatch):
+    monkeypatch.setattr(_wmii, 'WMI', lambda moniker: ('object', moniker))
+    namespace = _Namespace()
+    namespace.schemas = {'Lnl_Test': schema(['ID'], ['ID'], {'Panel': 'Lnl_Panel'})}
+    namespace.rows = lambda wql: [{'ID': 1, 'Panel': 'Lnl_Panel.ID=1'},
+                                  {'ID': 2, 'Panel': None}]
+    connection = DITConnection(namespace)
+    assert connection.data_query('select ID, Panel from Lnl_Test') == \
+        [(1, ('object', 'Lnl_Panel.ID=1')), (2, None)]
+    assert list(connection.iter_query('select Panel from Lnl_Test')) == \
+        [(('object', 'Lnl_Panel.ID=1'),), (None,)]
+
+
+def _device(lnl_class, keys, **values):
+    return SimpleNamespace(keys=keys, ole_object=_RawEvent(lnl_class, **values))
+
+
+class _DeviceConnection:
+    """Stands in for DITConnection, serving devices by class."""
+
+    def __init__(self, devices):
+        self.devices = devices
+
+    def iter_query(self, wql):
+        return ((device,) for device in self.devices.get(wql.split()[-1], ()))
+
+
+def test_topology_names_alarm_devices_per_alarm_panel():
+    # WMI lists key properties alphabetically, not parent first.
+    inputs = [_device('Lnl_AlarmInput', ['AlarmPanelID', 'InputID', 'PanelID'], PanelID=1,
+                      AlarmPanelID=alarm_panel, InputID=1, Name='Input 1')
+              for alarm_panel in (1, 2)]
+    alarm_panel = _device('Lnl_AlarmPanel', ['AlarmPanelID', 'PanelID'], PanelID=1,
+                          AlarmPanelID=2, Name='AP2')
+    topology = DITTopology(_DeviceConnection({
+        'Lnl_Panel': [_device('Lnl_Panel', ['ID'], ID=1, Name='3300')],
+        'Lnl_AlarmPanel': [alarm_panel],
+        'Lnl_AlarmInput': inputs,
+    }))
+    assert topology.panel('3300') is topology.by_key('Lnl_Panel', 1)
+    assert topology.device('Lnl_AlarmPanel', '3300', 'ap2') is alarm_panel
+    assert topology.device('Lnl_AlarmInput', '3300', 'input 1', alarm_panel=1) is inputs[0]
+    assert topology.device('Lnl_AlarmInput', 1, 'Input 1', alarm_panel='AP2') is inputs[1]
+    assert topology.device('Lnl_AlarmInput', '3300', 'Input 1', alarm_panel='AP9') is None
+    assert topology.by_key('Lnl_AlarmInput', 2, 1, 1) is inputs[1]
+
+
+def test_topology_names_readers_per_panel():
+    reader = _device('Lnl_Reader', ['PanelID', 'ReaderID'], PanelID=2, ReaderID=5,
+                     Name='Door')
+    topology = DITTopology(_DeviceConnection({
+        'Lnl_Panel': [_device('Lnl_Panel', ['ID'], ID=1, Name='A'),
+                      _device('Lnl_Panel', ['ID'], ID=2, Name='B')],
+        'Lnl_Reader': [reader],
+    }))
+    assert topology.reader('B', 'door') is reader
+    assert topology.reader('A', 'Door') is None
+
+
+def test_software_events_watches_several_targets_in_one_query():
+    created = _RawEvent(SWCreationEvent, TargetInstance=_RawEvent('Lnl_Visitor', ID=1))
+    namespace = _Namespace(_EventSource([created], []))
+    watcher = DITConnection(namespace).software_events(
+        ['Lnl_Cardholder', 'Lnl_Visitor'], [SWCreationEvent, SWDeletionEvent])
+    assert namespace.queries == [
+        f"select * from __InstanceOperationEvent where (__CLASS = '{SWCreationEvent}' OR "
+        f"__CLASS = '{SWDeletionEvent}') AND (TargetInstance ISA 'Lnl_Cardholder' OR "
+        f"TargetInstance ISA 'Lnl_Visitor')"]
+    assert watcher() == {'ID': 1, 'previous': None, 'class': 'Lnl_Visitor',
+                         'operation': SWCreationEvent}
+
+
+def test_software_events_tags_fixed_by_the_subscription():
+    modified = _RawEvent('Other', TargetInstance=_RawEvent('Other', ID=2),
+                         PreviousInstance=_RawEvent('Other', ID=1))
+    namespace = _Namespace(_EventSource([modified], []))
+    watcher = DITConnection(namespace).software_events('Lnl_Badge', SWModificationEvent)
+    assert namespace.queries == [
+        f"select * from {SWModificationEvent} where TargetInstance ISA 'Lnl_Badge'"]
+    assert watcher() == {'ID': 2, 'previous': {'ID': 1}, 'class': 'Lnl_Badge',
+                         'operation': SWModificationEvent}
+    with pytest.raises(ValueError):
+        DITConnection(namespace).software_events(['Lnl_Badge', 'Lnl_Panel'])
+
+
+def test_software_events_tags_with_server_class_names():
+    deleted = _RawEvent('Other', TargetInstance=_RawEvent('Lnl_Badge', ID=3))
+    for targets in ('lnl_badge', ['lnl_badge', 'lnl_visitor']):
+        watcher = DITConnection(_Namespace(_EventSource([deleted], []))).software_events(
+            targets, SWDeletionEvent.lower())
+        event = watcher()
+        assert (event['class'], event['operation']) == ('Lnl_Badge', SWDeletionEvent)
+
+
+def test_software_events_report_lag():
+    created = _RawEvent(SWCreationEvent, TIME_CREATED='131807168705467252',
+                        TargetInstance=_RawEvent('Lnl_Badge', ID=3))
+    watcher = DITConnection(_Namespace(_EventSource([created], []))).software_events(
+        'Lnl_Badge', SWCreationEvent)
+    event = watcher()
+    assert event['TIME_CREATED'] == '131807168705467252'
+    subscription = Subscription(None)
+    subscription._deliver(event)
+    assert subscription.lag > 0 and subscription.stats()['max_lag'] == subscription.lag
@@ -0,0 +1,332 @@
+import pytest
+
+pytest.importorskip('win32com.client', reason='pyog needs pywin32')
+
+from pyog import _wmii
+from pyog.dit import EventRecord, _rebuild_record
+from pyog.dit import DITConnection
+from pyog.events import EventHub, AsyncWatcher, EventBuffer, ReconnectingWatcher, \
+    EventHubStopped, BUFFER_DROP_OLDEST, BUFFER_SPILL
+from queue import Queue, Empty
+from datetime import datetime
+from threading import Thread
+from time import monotonic, sleep
+import asyncio
+
+
+class _Watcher:
+    """Delivers queued events, then times out as a DataConduIT watcher does."""
+
+    def __init__(self, events=()):
+        self.events = list(events)
+
+    def __call__(self, timeout_ms=-1):
+        if not self.events:
+            raise _wmii.x_wmi_timed_out()
+        return self.events.pop(0)
+
+
+def test_hub_delivers_to_queue_and_callback():
+    hub = EventHub(lambda: object(), idle_ms=1)
+    received, seen = Queue(), []
+    hub.subscribe(lambda dit: _Watcher([{'n': 1}, {'n': 2}]), callback=seen.append,
+                  queue=received, name='test')
+    with hub:
+        assert [received.get(timeout=5)['n'] for _ in range(2)] == [1, 2]
+    assert [event['n'] for event in seen] == [1, 2]
+    assert hub.stats()['test']['events'] == 2
+
+
+def test_hub_names_are_unique():
+    hub = EventHub(lambda: object())
+    names = [hub.subscribe(_Watcher, name='access').name for _ in range(3)]
+    names.append(hub.subscribe(_Watcher).name)
+    assert names == ['access', 'access #2', 'access #3', 'subscription']
+    assert len(hub.stats()) == 4
+
+
+def test_hub_connection_failure_fails_subscriptions():
+    def connect():
+        raise ConnectionError('no server')
+
+    hub = EventHub(connect)
+    received = Queue()
+    subscription = hub.subscribe(_Watcher, queue=received)
+    hub.start()
+    assert isinstance(received.get(timeout=5), ConnectionError)
+    hub.stop()
+    assert isinstance(subscription.error, ConnectionError)
+    late = Queue()
+    assert isinstance(hub.subscribe(_Watcher, queue=late).error, ConnectionError)
+    assert isinstance(late.get_nowait(), ConnectionError)
+
+
+def test_hub_drops_failed_subscription():
+    def fail(timeout_ms):
+        raise RuntimeError('watcher broke')
+
+    hub = EventHub(lambda: object(), idle_ms=1)
+    broken, working = Queue(), Queue()
+    hub.subscribe(lambda dit: fail, queue=broken)
+    hub.subscribe(lambda dit: _Watcher([{'n': 1}]), queue=working)
+    with hub:
+        assert isinstance(broken.get(timeout=5), RuntimeError)
+        assert working.get(timeout=5) == {'n': 1}
+
+
+def test_async_watchers_share_hub():
+    hub = EventHub(lambda: object(), idle_ms=1)
+    first = AsyncWatcher(hub, lambda dit: _Watcher([{'n': 1}, {'n': 2}]))
+    second = AsyncWatcher(hub, lambda dit: _Watcher([{'n': 3}]))
+
+    async def consume(watcher, count):
+        events = []
+        async for event in watcher:
+            events.append(event['n'])
+            if len(events) == count:
+                break
+        return events
+
+    async def main():
+        return await asyncio.gather(consume(first, 2), consume(second, 1))
+
+    try:
+        assert asyncio.run(main()) == [[1, 2], [3]]
+        assert not first.running
+    finally:
+        hub.stop()
+
+
+def test_async_watcher_drops_oldest():
+    hub = EventHub(lambda: object())
+
+    async def main():
+        watcher = AsyncWatcher(hub, _Watcher, maxsize=2)
+        watcher.start()
+        for n in range(4):
+            watcher._put_nowait({'n': n})
+        events = [watcher._queue.get_nowait()['n'] for _ in range(2)]
+        watcher.close()
+        return events, watcher.dropped
+
+    try:
+        assert asyncio.run(main()) == ([2, 3], 2)
+    finally:
+        hub.stop()
+
+
+def test_hub_stop_ends_subscriptions():
+    hub = EventHub(lambda: object(), idle_ms=1)
+    live, pending = Queue(), Queue()
+    subscription = hub.subscribe(lambda dit: _Watcher(), queue=live)
+    with hub:
+        while subscription.watcher is None and subscription.error is None:
+            sleep(0.001)
+        hub.subscribe(lambda dit: _Watcher(), queue=pending)
+    assert isinstance(live.get(timeout=5), EventHubStopped)
+    assert isinstance(pending.get(timeout=5), EventHubStopped)
+    with pytest.raises(RuntimeError):
+        hub.subscribe(lambda dit: _Watcher())
+
+
+def test_hub_stop_before_start_ends_subscriptions():
+    hub = EventHub(lambda: object())
+    received = Queue()
+    hub.subscribe(lambda dit: _Watcher(), queue=received)
+    hub.stop()
+    assert isinstance(received.get_nowait(), EventHubStopped)
+
+
+def test_hub_stop_ends_async_iteration():
+    hub = EventHub(lambda: object(), idle_ms=1)
+
+    async def main():
+        watcher = AsyncWatcher(hub, lambda dit: _Watcher())
+        watcher.start()
+        await asyncio.get_running_loop().run_in_executor(None, hub.stop)
+        return [event async for event in watcher]
+
+    assert asyncio.run(main()) == []
+
+
+def test_connection_close_stops_async_hub():
+    connection = DITConnection(None)
+    connection.clone = lambda: object()
+    hub = connection._async_hub()
+    assert connection._async_hub() is hub
+    connection.close()
+    assert hub.stopped
+    assert connection._async_hub() is not hub
+
+
+def test_async_watcher_raises_subscription_error():
+    def connect():
+        raise ConnectionError('no server')
+
+    async def main():
+        async for _ in AsyncWatcher(EventHub(connect), _Watcher):
+            pass
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(main())
+
+
+def test_async_watcher_invalid_policy():
+    with pytest.raises(ValueError):
+        AsyncWatcher(EventHub(lambda: object()), _Watcher, policy=BUFFER_SPILL)
+
+
+def _record(n):
+    return _rebuild_record('Lnl_AccessEvent', ('SerialNumber', 'TIME'),
+                           (n, f'2024010100000{n}.000000-000'))
+
+
+def test_buffer_block():
+    buffer = EventBuffer(2)
+    assert buffer.put(1) and buffer.put(2)
+    assert not buffer.put(3, block=False)
+    assert buffer.put(3, timeout=0.01) is False
+    assert buffer.get() == 1
+    assert buffer.put(3)
+    assert buffer.get_batch(10) == [2, 3]
+    with pytest.raises(Empty):
+        buffer.get(block=False)
+    assert buffer.stats()['rejected'] == 2
+
+
+def test_buffer_drop_oldest():
+    buffer = EventBuffer(2, policy=BUFFER_DROP_OLDEST)
+    for n in range(4):
+        buffer.put(n)
+    assert buffer.get_batch(10) == [2, 3]
+    assert buffer.dropped == 2
+
+
+def test_buffer_spill_keeps_order_and_records():
+    buffer = EventBuffer(2, policy=BUFFER_SPILL)
+    for n in range(5):
+        buffer.put(_record(n))
+    assert buffer.stats()['spilled'] == 3
+    events = buffer.get_batch(10)
+    assert events == [_record(n) for n in range(5)]
+    assert all(isinstance(event, EventRecord) for event in events)
+    assert events[4].event_class == 'Lnl_AccessEvent'
+    assert events[4].TIME == '20240101000004.000000-000'
+    buffer.close()
+
+
+def test_buffer_spills_json(tmp_path):
+    path = str(tmp_path / 'events.spill')
+    buffer = EventBuffer(1, policy=BUFFER_SPILL, spill_path=path)
+    buffer.put({'n': 0})
+    buffer.put({'n': 1, 'at': datetime(2024, 1, 1)})
+    buffer.put(_record(2))
+    with open(path, 'rb') as f:
+        assert b'[null, {"n": 1, "at": "2024-01-01 00:00:00"}]' in f.read()
+    assert buffer.get_batch(10) == [{'n': 0}, {'n': 1, 'at': '2024-01-01 00:00:00'},
+                                    _record(2)]
+    buffer.close()
+
+
+def test_buffer_spill_file_read_back_after_restart(tmp_path):
+    path = str(tmp_path / 'events.spill')
+    buffer = EventBuffer(1, policy=BUFFER_SPILL, spill_path=path)
+    for n in range(4):
+        buffer.put(_record(n))
+    assert [buffer.get(), buffer.get()] == [_record(0), _record(1)]
+    buffer.close()
+    with open(path, 'ab') as f:
+        f.write(b'\x10\x00')  # Record torn by a crash.
+    buffer = EventBuffer(1, policy=BUFFER_SPILL, spill_path=path)
+    assert buffer.qsize() == 2
+    buffer.put(_record(4))
+    assert buffer.get_batch(10) == [_record(2), _record(3), _record(4)]
+    buffer.close()
+
+
+def test_buffer_rejects_put_after_close():
+    buffer = EventBuffer(1, policy=BUFFER_SPILL)
+    buffer.put(1)
+    buffer.put(2)
+    buffer.close()
+    assert not buffer.put(3)
+    assert buffer.rejected == 1
+    assert buffer.get_batch(10) == [1]
+
+
+def test_buffer_close_wakes_blocked_put_and_get():
+    full, empty = EventBuffer(1), EventBuffer(1)
+    full.put(1)
+    results = []
+    threads = [Thread(target=lambda: results.append(full.put(2))),
+               Thread(target=lambda: results.append(empty.get_batch(10)))]
+    for thread in threads:
+        thread.start()
+    sleep(0.05)
+    full.close()
+    empty.close()
+    for thread in threads:
+        thread.join(5)
+    assert sorted(results, key=repr) == [False, []]
+    assert full.rejected == 1
+    assert full.get() == 1
+    with pytest.raises(Empty):
+        full.get()
+
+
+class _Disconnected(Exception):
+    disconnected = True
+
+
+class _StagedWatcher(_Watcher):
+    """_Watcher with processing stages, that loses its connection when told to."""
+
+    def __init__(self, events=(), disconnect=False):
+        super().__init__(events)
+        self.disconnect = disconnect
+        self.stages = []
+
+    def __call__(self, timeout_ms=-1):
+        if self.disconnect:
+            raise _Disconnected()
+        event = super().__call__(timeout_ms)
+        for stage in self.stages:
+            event = stage(event)
+        return event
+
+    def add_stage(self, stage):
+        self.stages.append(stage)
+        return self
+
+
+def test_reconnecting_watcher_applies_stages_to_new_watcher():
+    watchers = [_StagedWatcher(disconnect=True), _StagedWatcher([{'n': 1}])]
+    watcher = ReconnectingWatcher(object(), object, lambda connection: watchers.pop(0))
+    assert watcher.add_stage(lambda event: dict(event, staged=True)) is watcher
+    assert watcher(1000) == {'n': 1, 'staged': True}
+    assert watcher.reconnects == 1
+
+
+def test_reconnecting_watcher_keeps_recent_gaps():
+    watchers = [_StagedWatcher(disconnect=True)] + [_StagedWatcher([{'n': n}])
+                                                    for n in range(3)]
+    watcher = ReconnectingWatcher(object(), object, lambda connection: watchers.pop(0),
+                                  max_gaps=2)
+    for n in range(3):
+        assert watcher(1000) == {'n': n}
+        watcher._watcher.disconnect = True
+    assert len(watcher.gaps) == 2
+    assert watcher.stats()['gaps'] == 3
+
+
+def test_reconnecting_watcher_times_out_while_reconnecting():
+    def connect():
+        raise _Disconnected()
+
+    watcher = ReconnectingWatcher(object(), connect, lambda connection: _StagedWatcher(
+        disconnect=True), backoff=0.2, max_backoff=0.2)
+    started = monotonic()
+    with pytest.raises(_wmii.x_wmi_timed_out):
+        watcher(50)
+    assert monotonic() - started < 1
+    assert watcher.drain(10) == []
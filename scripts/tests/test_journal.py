@@ -0,0 +1,76 @@
+import pytest
+
+pytest.importorskip('win32com.client', reason='pyog needs pywin32')
+
+from pyog.journal import EventJournal, _SEGMENT_EXT
+import json
+import os
+import zlib
+
+
+def _events(n):
+    return [{'SerialNumber': i, 'Description': f'event {i}'} for i in range(n)]
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_append_and_replay(tmp_path, compress):
+    with EventJournal(str(tmp_path), segment_size=200, compress=compress,
+                      index_interval=2) as journal:
+        assert [journal.append(event) for event in _events(20)] == list(range(1, 21))
+        entries = list(journal.replay())
+        assert [entry.seq for entry in entries] == list(range(1, 21))
+        assert [entry.event for entry in entries] == _events(20)
+        assert journal.stats()['segments'] > 1
+        assert [entry.seq for entry in journal.replay(start_seq=15)] == \
+            list(range(15, 21))
+        start_time = entries[9].time
+        replayed = list(journal.replay(start_time=start_time))
+        assert replayed and all(entry.time >= start_time for entry in replayed)
+        raw = next(journal.replay(start_seq=3, raw=True))
+        data = bytes(raw.event)
+        raw.event.release()
+        assert json.loads(zlib.decompress(data) if compress else data) == _events(3)[2]
+
+
+def test_reopen_continues_and_drops_torn_record(tmp_path):
+    with EventJournal(str(tmp_path)) as journal:
+        for event in _events(3):
+            journal.append(event)
+    segment = [name for name in os.listdir(tmp_path) if name.endswith(_SEGMENT_EXT)][0]
+    with open(tmp_path / segment, 'ab') as f:
+        f.write(b'\x40\x00\x00')  # Record torn by a crash.
+    with EventJournal(str(tmp_path)) as journal:
+        assert journal.last_seq == 3
+        assert journal.append({'SerialNumber': 3}) == 4
+        assert [entry.seq for entry in journal.replay()] == [1, 2, 3, 4]
+
+
+def test_stats_and_flush(tmp_path):
+    journal = EventJournal(str(tmp_path))
+    journal.append({'SerialNumber': 1})
+    assert journal.flush(5)
+    stats = journal.stats()
+    assert (stats['appended'], stats['written'], stats['pending']) == (1, 1, 0)
+    assert stats['bytes'] > 0
+    journal.close()
+
+
+def test_append_after_close_raises(tmp_path):
+    journal = EventJournal(str(tmp_path))
+    journal.append({'SerialNumber': 1})
+    journal.close()
+    with pytest.raises(ValueError):
+        journal.append({'SerialNumber': 2})
+    assert journal.flush(5)
+    assert [entry.seq for entry in journal.replay()] == [1]
+    journal.close()
+
+
+def test_writer_stops_at_first_close_marker(tmp_path):
+    journal = EventJournal(str(tmp_path))
+    journal.close()
+    for item in ((1, 0.0, {'SerialNumber': 1}), None, (2, 0.0, {'SerialNumber': 2})):
+        journal._queue.put(item)
+    journal._write_loop()
+    assert journal.error is None and journal.written == 1
+    assert [entry.event for entry in journal.replay()] == [{'SerialNumber': 1}]
@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip('win32com.client', reason='pyog needs pywin32')
+
+from conftest import Namespace, schema
+from pyog import _wmii
+from pyog.dit import DITConnection, SWCreationEvent, SWDeletionEvent, SWModificationEvent
+from pyog.mirror import ClassMirror, DataMirror
+from threading import Event
+
+
+def _mirror(rows):
+    namespace = Namespace({'Lnl_Test': schema(['NAME'], ['NAME', 'LASTCHANGED'])})
+    namespace.rows = lambda wql: rows
+    mirror = ClassMirror(DITConnection(namespace), 'Lnl_Test')
+    mirror.load()
+    return mirror, namespace
+
+
+def test_load_and_apply():
+    mirror, _ = _mirror([{'NAME': 'a', 'LASTCHANGED': '1'}])
+    assert mirror.get('a') == {'NAME': 'a', 'LASTCHANGED': '1'}
+    assert mirror.apply(SWModificationEvent, {'NAME': 'a', 'LASTCHANGED': '2'})
+    assert not mirror.apply(SWModificationEvent, {'NAME': 'a', 'LASTCHANGED': '1'})
+    assert mirror.apply(SWDeletionEvent, {'NAME': 'a'})
+    assert len(mirror) == 0
+
+
+def test_check_sends_literal_escaped_once():
+    mirror, namespace = _mirror([{'NAME': 'a\\b"c', 'LASTCHANGED': '1'}])
+    assert mirror.check() == {'local': 1, 'server': 1, 'missing': [], 'extra': [],
+                              'stale': []}
+    assert namespace.queries[-1] == \
+        'select NAME, LASTCHANGED from Lnl_Test where (NAME = "a\\\\b\\"c")'
+
+
+def test_badge_prefers_the_active_badge():
+    namespace = Namespace({'Lnl_Badge': schema(['BADGEKEY'],
+                                               ['BADGEKEY', 'ID', 'PERSONID', 'STATUS'])})
+    namespace.rows = lambda wql: [
+        {'BADGEKEY': 1, 'ID': 7, 'PERSONID': 1, 'STATUS': 2},
+        {'BADGEKEY': 2, 'ID': 7, 'PERSONID': 2, 'STATUS': 1},
+        {'BADGEKEY': 3, 'ID': 7, 'PERSONID': 3, 'STATUS': 2},
+    ]
+    mirror = DataMirror(DITConnection(namespace), classes=['Lnl_Badge'])
+    mirror.load()
+    assert mirror.badge('7')['BADGEKEY'] == 2
+    mirror.apply({'class': 'Lnl_Badge', 'operation': SWDeletionEvent, 'BADGEKEY': 2})
+    assert mirror.badge(7)['BADGEKEY'] == 3
+    assert mirror.badge(8) is None
+    assert mirror.badge('') is None and mirror.badge(None) is None
+
+
+def test_watch_returns_when_stopped():
+    namespace = Namespace({'Lnl_Test': schema(['NAME'], ['NAME'])})
+    stop = Event()
+    events = [{'class': 'Lnl_Test', 'operation': SWCreationEvent, 'NAME': 'a'}, None]
+
+    def watcher(timeout_ms):
+        event = events.pop(0)
+        if event is None:
+            stop.set()
+            raise _wmii.x_wmi_timed_out()
+        return event
+
+    connection = DITConnection(namespace)
+    connection.software_events = lambda targets, operations: watcher
+    mirror = DataMirror(connection, classes=['Lnl_Test'])
+    mirror.watch(stop)
+    assert mirror['Lnl_Test'].get('a') == {'NAME': 'a'} and not events
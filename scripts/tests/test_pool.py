@@ -0,0 +1,166 @@
+import pytest
+
+pytest.importorskip('win32com.client', reason='pyog needs pywin32')
+
+from conftest import Namespace
+from pyog.pool import DITPool, _Scheduler, _Task, PRIORITY_INTERACTIVE, \
+    PRIORITY_READ, PRIORITY_BULK
+from pyog.dit import DITConnection
+from queue import Empty
+from threading import Event, current_thread
+
+
+class _Connection:
+    """Stands in for the DITConnection a worker opens."""
+
+
+class _Pool(DITPool):
+
+    def _connect(self):
+        return _Connection()
+
+
+def _task(priority):
+    return _Task(lambda dit: None, (), {}, priority)
+
+
+@pytest.fixture
+def pool():
+    pool = _Pool(2)
+    yield pool
+    pool.shutdown()
+
+
+def test_submit_runs_on_worker_connection(pool):
+    assert isinstance(pool.submit(lambda dit: dit).result(5), _Connection)
+    assert pool.submit(lambda dit, a, b=0: a + b, 1, b=2).result(5) == 3
+
+
+def test_submit_sets_exception(pool):
+    def fail(dit):
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        pool.submit(fail).result(5)
+    assert pool.submit(lambda dit: 1).result(5) == 1
+
+
+def test_submit_invalid_priority(pool):
+    with pytest.raises(ValueError):
+        pool.submit(lambda dit: None, priority=99)
+
+
+def test_submit_after_shutdown(pool):
+    pool.shutdown()
+    with pytest.raises(RuntimeError):
+        pool.submit(lambda dit: None)
+
+
+def test_stats(pool):
+    for future in [pool.submit(lambda dit: None) for _ in range(5)]:
+        future.result(5)
+    stats = pool.stats()
+    assert stats['completed'] == 5
+    assert stats['running'] == 0
+    assert stats['queued'] == 0
+
+
+def test_invalid_size():
+    with pytest.raises(ValueError):
+        _Pool(0)
+
+
+def test_scheduler_priority_order():
+    scheduler = _Scheduler({})
+    bulk, read, interactive = _task(PRIORITY_BULK), _task(PRIORITY_READ), \
+        _task(PRIORITY_INTERACTIVE)
+    for task in (bulk, read, interactive):
+        scheduler.put(task)
+    assert [scheduler.get(0) for _ in range(3)] == [interactive, read, bulk]
+
+
+def test_scheduler_limit():
+    scheduler = _Scheduler({PRIORITY_BULK: 1})
+    first, second = _task(PRIORITY_BULK), _task(PRIORITY_BULK)
+    scheduler.put(first)
+    scheduler.put(second)
+    assert scheduler.get(0) is first
+    with pytest.raises(Empty):
+        scheduler.get(0)
+    scheduler.done(first)
+    assert scheduler.get(0) is second
+
+
+def test_scheduler_stop_after_tasks():
+    scheduler = _Scheduler({})
+    task = _task(PRIORITY_READ)
+    scheduler.put(None)
+    scheduler.put(task)
+    assert scheduler.get(0) is task
+    assert scheduler.get(0) is None
+
+
+def test_bulk_limit_keeps_worker_free(pool):
+    release = Event()
+    bulk = pool.submit(lambda dit: release.wait(5), priority=PRIORITY_BULK)
+    queued = pool.submit(lambda dit: None, priority=PRIORITY_BULK)
+    assert pool.submit(lambda dit: 'urgent', priority=PRIORITY_INTERACTIVE).result(5) \
+        == 'urgent'
+    assert not queued.done()
+    release.set()
+    assert bulk.result(5) is True
+    queued.result(5)
+
+
+def test_cancelled_bulk_task_frees_slot():
+    pool = _Pool(1)
+    try:
+        release = Event()
+        pool.submit(lambda dit: release.wait(5), priority=PRIORITY_BULK)
+        cancelled = pool.submit(lambda dit: None, priority=PRIORITY_BULK)
+        assert cancelled.cancel()
+        release.set()
+        assert pool.submit(lambda dit: 'next', priority=PRIORITY_BULK).result(5) == 'next'
+    finally:
+        pool.shutdown()
+
+
+class _Namespace(Namespace):
+    """Stands in for the DataConduIT namespace, recording the thread queries run in."""
+
+    def __init__(self):
+        super().__init__()
+        self.threads = []
+
+    def rows(self, wql):
+        self.threads.append(current_thread())
+        return [{'ID': n} for n in range(3)]
+
+
+class _QueryPool(DITPool):
+
+    def _connect(self):
+        self.namespace = _Namespace()
+        return DITConnection(self.namespace)
+
+
+def test_proxy_reads_query_generators_in_worker():
+    pool = _QueryPool(1)
+    try:
+        proxy = pool.proxy(timeout=5)
+        assert [row.ID for row in proxy.iter_query('select ID from Lnl_Badge')] == \
+            [0, 1, 2]
+        assert isinstance(proxy.data_query('select ID from Lnl_Badge', stream=True), list)
+        assert len(proxy.data_query('select ID from Lnl_Badge')) == 3
+        assert current_thread() not in pool.namespace.threads
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.parametrize('name', [
+    'hardware_events', 'software_events', 'hardware_events_async', 'event_hub',
+    'hardware_events_reconnecting', 'clone', 'namespace', '_data_query',
+])
+def test_proxy_refuses_thread_bound_methods(pool, name):
+    with pytest.raises(AttributeError):
+        getattr(pool.proxy(), name)
@@ -0,0 +1,78 @@
+import pytest
+
+pytest.importorskip('win32com.client', reason='pyog needs pywin32')
+
+from conftest import Namespace, schema
+from pyog import _wmii
+from pyog.dit import DITConnection
+from pyog.replica import SQLiteReplica, _utc
+from types import SimpleNamespace
+import re
+
+
+class _Namespace(Namespace):
+    """Stands in for the DataConduIT namespace, serving Lnl_Test from a list of rows."""
+
+    def __init__(self, rows, references=None):
+        super().__init__({'Lnl_Test': schema(['ID'], ['ID', 'NAME', 'LASTCHANGED'],
+                                             references)})
+        self.lnl_test = rows
+
+    def rows(self, wql):
+        since = re.search(r'LASTCHANGED >= "(.*)"$', wql)
+        return [row for row in self.lnl_test
+                if since is None or _utc(row['LASTCHANGED']) >= since.group(1)]
+
+
+def _row(id, name, changed):
+    return {'ID': id, 'NAME': name, 'LASTCHANGED': changed}
+
+
+def test_sync_full_then_delta():
+    namespace = _Namespace([_row(1, 'a', '20240101'), _row(2, 'b', '20240102')])
+    connection = DITConnection(namespace)
+    with SQLiteReplica(':memory:', classes=['Lnl_Test']) as replica:
+        entry, = replica.sync(connection)
+        assert (entry['mode'], entry['pulled'], entry['rows']) == ('full', 2, 2)
+        assert replica.watermark('Lnl_Test') == '20240102'
+        namespace.lnl_test = [_row(2, 'b2', '20240103'), _row(3, 'c', '20240102')]
+        entry, = replica.sync(connection)
+        assert namespace.queries[-2] == \
+            'select ID, NAME, LASTCHANGED from Lnl_Test where LASTCHANGED >= "20240102"'
+        assert (entry['mode'], entry['pulled'], entry['deleted'], entry['rows']) == \
+            ('delta', 2, 1, 2)
+        assert replica.query('select ID, NAME from Lnl_Test order by ID') == \
+            [(2, 'b2'), (3, 'c')]
+        assert replica.watermark('Lnl_Test') == '20240103'
+
+
+def test_sync_logs_failed_class_and_syncs_the_others():
+    connection = DITConnection(_Namespace([_row(1, 'a', '20240101')]))
+    with SQLiteReplica(':memory:', classes=['Lnl_Missing', 'Lnl_Test']) as replica:
+        with pytest.raises(KeyError):
+            replica.sync(connection)
+        test, missing = replica.last_syncs(2)
+        assert missing['class'] == 'Lnl_Missing' and missing['error'].startswith('KeyError')
+        assert test['class'] == 'Lnl_Test' and test['rows'] == 1 and test['error'] is None
+
+
+def test_sync_keeps_the_watermark_in_utc():
+    # 01:30 CEST is before 01:20 CET, the same night the clocks go back.
+    namespace = _Namespace([_row(1, 'a', '20241027013000.000000+120'),
+                            _row(2, 'b', '20241027012000.000000+060')])
+    with SQLiteReplica(':memory:', classes=['Lnl_Test']) as replica:
+        replica.sync(DITConnection(namespace))
+        assert replica.watermark('Lnl_Test') == '20241027002000.000000+000'
+        entry, = replica.sync(DITConnection(namespace))
+        assert namespace.queries[-2].endswith('>= "20241027002000.000000+000"')
+        assert entry['pulled'] == 1
+
+
+def test_sync_stores_reference_paths(monkeypatch):
+    monkeypatch.setattr(_wmii, 'WMI', lambda moniker: SimpleNamespace(
+        Path_=SimpleNamespace(Path=moniker)))
+    row = dict(_row(1, 'a', '20240101'), Owner='Lnl_Cardholder.ID=1')
+    namespace = _Namespace([row], references={'Owner': 'Lnl_Cardholder'})
+    with SQLiteReplica(':memory:', classes=['Lnl_Test']) as replica:
+        replica.sync(DITConnection(namespace))
+        assert replica.query('select Owner from Lnl_Test') == [('Lnl_Cardholder.ID=1',)]
@@ -0,0 +1,98 @@
+import pytest
+
+pytest.importorskip('win32com.client', reason='pyog needs pywin32')
+
+from pyog import _wmii
+from pyog.dit import status_table
+from pyog.state import DeviceStateTable
+from threading import Event
+from types import SimpleNamespace
+
+
+_KEYS = {
+    'Lnl_Reader': ['PanelID', 'ReaderID'],
+    'Lnl_AlarmInput': ['PanelID', 'AlarmPanelID', 'InputID'],
+    'Lnl_AlarmOutput': ['PanelID', 'AlarmPanelID', 'OutputID'],
+}
+
+
+class _Connection:
+    """Stands in for DITConnection, serving device statuses by (class, key)."""
+
+    def __init__(self, statuses):
+        self.statuses = statuses
+        self.polls = []
+        self.schema_cache = SimpleNamespace(
+            schema=lambda lnl_class: SimpleNamespace(keys=_KEYS[lnl_class]))
+
+    def status_sweep(self, classes=None):
+        return status_table(self._poll_statuses(
+            [(lnl_class, key, f'{lnl_class} {key}') for lnl_class, key in self.statuses]))
+
+    def _poll_statuses(self, devices):
+        self.polls.append(devices)
+        return [(lnl_class, key, name, self.statuses[lnl_class, key], None)
+                for lnl_class, key, name in devices]
+
+
+def _table():
+    connection = _Connection({
+        ('Lnl_Reader', (1, 2)): 1,
+        ('Lnl_AlarmInput', (1, 3, 4)): 0,
+        ('Lnl_AlarmOutput', (1, 3, 4)): 0,
+    })
+    table = DeviceStateTable(connection)
+    table.load()
+    connection.polls.clear()
+    return table, connection
+
+
+def test_load_and_apply():
+    table, connection = _table()
+    assert table.get('Lnl_Reader', 1, 2).flags == ['RDRSTATUS_ONLINE']
+    changes = []
+    table.on_change(lambda old, new: changes.append((old.status, new.status)))
+    new, = table.apply({'PanelID': 1, 'DeviceID': 2, 'NewStatus': 3})
+    assert new.flags == ['RDRSTATUS_ONLINE', 'RDRSTATUS_OPTION_MISTMATCH']
+    assert changes == [(1, 3)]
+    assert [state.key for state in table.with_flag('RDRSTATUS_OPTION_MISTMATCH')] == [(1, 2)]
+    assert table.apply({'PanelID': 1, 'DeviceID': 2, 'NewStatus': 3}) == []
+    assert table.apply({'PanelID': 9, 'DeviceID': 9, 'NewStatus': 1}) == []
+    assert (table.applied, table.ignored, table.polled) == (2, 1, 0)
+    assert connection.polls == []
+
+
+def test_apply_polls_ambiguous_address():
+    table, connection = _table()
+    connection.statuses['Lnl_AlarmOutput', (1, 3, 4)] = 1
+    new, = table.apply({'PanelID': 1, 'DeviceID': 3, 'SecondaryDeviceID': 4,
+                        'NewStatus': 1})
+    assert (new.lnl_class, new.status) == ('Lnl_AlarmOutput', 1)
+    assert table.get('Lnl_AlarmInput', 1, 3, 4).status == 0
+    assert [len(devices) for devices in connection.polls] == [2]
+    assert table.polled == 1
+
+
+def test_empty_table_loads_once():
+    connection = _Connection({})
+    table = DeviceStateTable(connection)
+    for _ in range(3):
+        assert table.apply({'PanelID': 1, 'DeviceID': 2, 'NewStatus': 3}) == []
+    assert len(connection.polls) == 1 and table.ignored == 3
+
+
+def test_watch_returns_when_stopped():
+    table, connection = _table()
+    stop = Event()
+    events = [{'PanelID': 1, 'DeviceID': 2, 'NewStatus': 3}, None]
+
+    def watcher(timeout_ms):
+        event = events.pop(0)
+        if event is None:
+            stop.set()
+            raise _wmii.x_wmi_timed_out()
+        return event
+
+    connection.hardware_events = lambda event_class: watcher
+    table.watch(stop)
+    assert table.get('Lnl_Reader', 1, 2).status == 3 and not events
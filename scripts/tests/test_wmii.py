@@ -0,0 +1,141 @@
+import pytest
+
+pytest.importorskip('win32com.client', reason='pyog needs pywin32')
+
+from pyog import _wmii
+from types import SimpleNamespace
+import pywintypes
+
+
+def _qualifiers(**values):
+    return [SimpleNamespace(Name=n, Value=v) for n, v in values.items()]
+
+
+class _Collection(list):
+    """Properties_ or Methods_ collection, callable by name, that counts its walks."""
+
+    def __init__(self, items):
+        super().__init__(items)
+        self.walks = 0
+
+    def __iter__(self):
+        self.walks += 1
+        return super().__iter__()
+
+    def __call__(self, name):
+        return next(item for item in list.__iter__(self) if item.Name == name)
+
+
+class _Object:
+    """Stands in for an SWbemObject of Lnl_Test, or for the class itself."""
+
+    def __init__(self, path='', **values):
+        self.Path_ = SimpleNamespace(Class='Lnl_Test', Path=path,
+                                     DisplayName=path or 'Lnl_Test')
+        self.Properties_ = _Collection(
+            SimpleNamespace(Name=n, Value=v,
+                            Qualifiers_=_qualifiers(CIMTYPE='string', key=n == 'ID'))
+            for n, v in values.items())
+        self.Methods_ = _Collection([SimpleNamespace(
+            Name='Go', Qualifiers_=[], InParameters=None, OutParameters=None)])
+        self.Qualifiers_ = _qualifiers(dynamic=True)
+        self.Derivation_ = ('Lnl_Base',)
+        self.puts = 0
+        self.fail = 0  # Number of Put_() calls to fail.
+
+    def Put_(self):
+        self.puts += 1
+        if self.fail:
+            self.fail -= 1
+            raise pywintypes.com_error(-2147023174, 'failed', None, None)
+
+
+class _Namespace:
+    """Stands in for SWbemServices, counting the class definitions read."""
+
+    def __init__(self):
+        self.gets = 0
+
+    def Get(self, class_name):
+        self.gets += 1
+        return _Object(ID=None, NAME=None)
+
+
+def test_schema_cache_hits_misses_and_invalidate():
+    namespace = _Namespace()
+    cache = _wmii._wmi_schema_cache(namespace)
+    schema = cache.schema('Lnl_Test')
+    assert cache.schema('LNL_TEST') is schema
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'classes': 1}
+    assert (schema.properties, schema.keys, schema.methods, schema.derivation) == \
+        (['ID', 'NAME'], ['ID'], ['Go'], ('Lnl_Base',))
+    cache.invalidate('lnl_test')
+    assert cache.schema('Lnl_Test') is not schema
+    cache.invalidate()
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'classes': 0}
+    assert namespace.gets == 2
+
+
+def test_object_reads_names_from_schema_cache():
+    cache = _wmii._wmi_schema_cache(_Namespace())
+    for name in 'ab':
+        ole_object = _Object('Lnl_Test.ID=1', ID=1, NAME=name)
+        wrapped = _wmii._wmi_object(ole_object, schema_cache=cache)
+        assert (wrapped.NAME, wrapped.keys, wrapped.qualifiers) == \
+            (name, ['ID'], {'dynamic': True})
+        assert (ole_object.Properties_.walks, ole_object.Methods_.walks) == (0, 0)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_rebind_keeps_methods_and_schema(monkeypatch):
+    monkeypatch.setattr(_wmii, 'Dispatch', lambda ole_object: ole_object)
+    wrapped = _wmii._wmi_object(_Object('Lnl_Test.ID=1', ID=1, NAME='a'),
+                                schema_cache=_wmii._wmi_schema_cache(_Namespace()))
+    schema, method = wrapped._schema, wrapped.Go
+    assert wrapped.NAME == 'a'
+    fresh = _Object('Lnl_Test.ID=1', ID=1, NAME='b')
+    wrapped._rebind(fresh)
+    assert wrapped.ole_object is fresh and wrapped.properties['NAME'] is None
+    assert wrapped.Go is method and method.ole_object is fresh
+    assert wrapped._schema is schema
+    assert wrapped.NAME == 'b'
+    assert (fresh.Properties_.walks, fresh.Methods_.walks) == (0, 0)
+
+
+def test_property_dirty_and_clean():
+    ole_property = SimpleNamespace(Name='NAME', Value='a', Qualifiers_=[])
+    prop = _wmii._wmi_property(ole_property)
+    assert not prop.dirty
+    prop.set('b')
+    assert prop.dirty and ole_property.Value == 'b'
+    prop.set('a')
+    assert not prop.dirty
+    prop.set('b')
+    prop.clean()
+    assert not prop.dirty and prop.read_value == 'b'
+
+
+def test_set_writes_only_changed_properties():
+    ole_object = _Object('Lnl_Test.ID=1', ID=1, NAME='a')
+    wrapped = _wmii._wmi_object(ole_object)
+    assert wrapped.set(ID=1, NAME='a') == {} and ole_object.puts == 0
+    assert wrapped.set(ID=1, NAME='b') == {'NAME': 'b'} and ole_object.puts == 1
+    assert wrapped._dirty() == {}
+
+
+def test_set_retries_value_left_by_failed_write():
+    ole_object = _Object('Lnl_Test.ID=1', ID=1, NAME='a')
+    ole_object.fail = 1
+    wrapped = _wmii._wmi_object(ole_object)
+    with pytest.raises(_wmii.x_wmi):
+        wrapped.set(NAME='b')
+    assert wrapped._dirty() == {'NAME': 'b'}
+    assert wrapped.set(NAME='b') == {'NAME': 'b'} and ole_object.puts == 2
+    assert wrapped._dirty() == {}
+
+
+def test_set_keeps_new_object_dirty():
+    ole_object = _Object(ID=None, NAME=None)
+    wrapped = _wmii._wmi_object(ole_object)
+    assert wrapped.set(ID=1) == {'ID': 1} and ole_object.puts == 0
+    assert wrapped._dirty() == {'ID': 1}